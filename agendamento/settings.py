@@ -52,6 +52,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bookings.tracing.TracingMiddleware',  # Spans OTLP-JSON (TRACE_SAMPLE_RATE)
+    'bookings.metrics.MetricsMiddleware',  # Latência e queries por rota (/metrics)
     'bookings.middleware.AutoMigrateMiddleware',  # Auto-migração em produção
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Para servir arquivos estáticos
@@ -59,6 +61,9 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bookings.middleware.TenantMiddleware',  # request.business (host, /n/<slug>/ ou sessão)
+    'bookings.middleware.ReplicaStickinessMiddleware',  # read-your-writes com réplica
+    'bookings.middleware.RateLimitMiddleware',  # 429 por IP/telefone nas rotas públicas
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -67,7 +72,8 @@ ROOT_URLCONF = 'agendamento.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates com spans de renderização (bookings.tracing)
+        'BACKEND': 'bookings.tracing.TracedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -91,14 +97,33 @@ WSGI_APPLICATION = 'agendamento.wsgi.application'
 database_url = os.environ.get('DATABASE_URL')
 railway_environment = os.environ.get('RAILWAY_ENVIRONMENT_NAME')
 
+# Pool nativo do psycopg 3 (por processo do gunicorn). Sem ele, cada thread
+# mantém uma conexão persistente, com um ping de verificação por requisição.
+# Conexões abertas no Postgres ≈ workers × DATABASE_POOL_MAX_SIZE.
+DATABASE_POOL = os.environ.get('DATABASE_POOL', 'false').lower() == 'true'
+DATABASE_POOL_OPTIONS = {
+    'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 1)),
+    'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', 4)),
+    # Segundos de espera por uma conexão livre antes de erro
+    'timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
+}
+
+
+def database_from_url(url):
+    """Configuração de um banco a partir da URL, com pool se habilitado"""
+    config = dj_database_url.parse(url, conn_max_age=600, conn_health_checks=True)
+    if DATABASE_POOL and config['ENGINE'] == 'django.db.backends.postgresql':
+        # O pool não convive com conexões persistentes; ele já devolve
+        # apenas conexões saudáveis
+        config.update(CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False)
+        config.setdefault('OPTIONS', {})['pool'] = dict(DATABASE_POOL_OPTIONS)
+    return config
+
+
 if database_url:
     # Produção (Railway) - Usar DATABASE_URL fornecida pelo Railway
     DATABASES = {
-        'default': dj_database_url.parse(
-            database_url,
-            conn_max_age=600,
-            conn_health_checks=True,
-        )
+        'default': database_from_url(database_url),
     }
 elif railway_environment:
     # Estamos no Railway mas sem DATABASE_URL - erro crítico
@@ -117,6 +142,61 @@ else:
     }
 
 
+# Réplica de leitura opcional para relatórios e exportações
+# (bookings.routers). Os testes usam uma segunda base SQLite
+# (agendamento/test_settings.py).
+database_replica_url = os.environ.get('DATABASE_REPLICA_URL')
+if database_replica_url:
+    DATABASES['replica'] = database_from_url(database_replica_url)
+
+DATABASE_ROUTERS = ['bookings.routers.ReplicaRouter']
+
+# Segundos em que a sessão lê do primário depois de gravar um agendamento
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 15))
+
+
+# Cache
+# 'default' é local a cada processo; 'shared' é visto por todos os workers
+# do gunicorn na mesma máquina (usado para versões de catálogo e afins).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('SHARED_CACHE_DIR', '/tmp/agendamento-cache'),
+        # O padrão (300) faz o cache descartar chaves ao acaso (inclusive
+        # versões) quando há muitas entradas, como as do feed .ics
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Blocos do feed .ics e resumos de dias/semanas dos relatórios, locais
+    # a cada processo. Um relatório de um ano são ~365 chaves só de dias;
+    # no 'default' (300 entradas) o cache se descartaria a cada consulta
+    'chunks': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'chunks',
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CHUNK_CACHE_MAX_ENTRIES', 50_000))},
+    },
+}
+
+# Baldes do limite de requisições (bookings.ratelimit) num cache à parte:
+# uma rajada de IPs não expulsa versões, holds nem outras chaves. Sem
+# RATE_LIMIT_REDIS_URL é local ao processo (usado só se RATE_LIMIT_BACKEND
+# for o CacheBackend).
+rate_limit_redis_url = os.environ.get('RATE_LIMIT_REDIS_URL')
+if rate_limit_redis_url:
+    CACHES['ratelimit'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',  # requer o pacote redis
+        'LOCATION': rate_limit_redis_url,
+    }
+else:
+    CACHES['ratelimit'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ratelimit',
+        'OPTIONS': {'MAX_ENTRIES': 100_000},
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -186,6 +266,77 @@ DEFAULT_DAILY_TIMES = ["09:00", "10:00", "11:00", "14:00", "15:00", "16:00"]
 # Configurações do sistema de agendamento
 DEFAULT_DAILY_TIMES = ['09:00', '10:00', '11:00', '14:00', '15:00', '16:00']
 
+# Reserva temporária de horário enquanto o cliente preenche o formulário
+SLOT_HOLD_TTL_SECONDS = int(os.environ.get('SLOT_HOLD_TTL_SECONDS', 300))
+
+# Por quanto tempo um reenvio do formulário de reserva volta ao mesmo agendamento
+RESERVATION_KEY_TTL_SECONDS = int(os.environ.get('RESERVATION_KEY_TTL_SECONDS', 3600))
+
+# Limite de requisições nas rotas públicas (bookings.ratelimit):
+# "N/s|m|h|d" por IP e, quando há telefone na requisição, por telefone
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+# Sem Redis, os baldes ficam na memória de cada worker (O(1), sem I/O) e a
+# capacidade é dividida por RATE_LIMIT_WORKERS (padrão: WEB_CONCURRENCY, o
+# número de workers do gunicorn). Com RATE_LIMIT_REDIS_URL, CacheBackend
+# num cache próprio, compartilhado entre workers e máquinas.
+RATE_LIMIT_BACKEND = os.environ.get(
+    'RATE_LIMIT_BACKEND',
+    'bookings.ratelimit.CacheBackend' if rate_limit_redis_url else 'bookings.ratelimit.LocalMemoryBackend',
+)
+RATE_LIMIT_CACHE = os.environ.get('RATE_LIMIT_CACHE', 'ratelimit')  # usado pelo CacheBackend
+RATE_LIMIT_WORKERS = int(os.environ.get('RATE_LIMIT_WORKERS', os.environ.get('WEB_CONCURRENCY', 1)))
+# Proxies à frente do app para achar o IP real no X-Forwarded-For. No
+# Railway há um; sem isso todos os clientes dividiriam o balde do proxy
+RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', 1 if railway_environment else 0))
+RATE_LIMITS = {
+    'bookings:reservar': {'ip': '10/m', 'phone': '5/h'},
+    'bookings:segurar_horario': {'ip': '30/m'},
+    'bookings:lista_espera': {'ip': '10/m', 'phone': '5/h'},
+    'bookings:meus_agendamentos': {'ip': '20/m', 'phone': '10/m'},
+    'bookings:agenda': {'ip': '120/m'},
+    'bookings:agendar': {'ip': '120/m'},
+    'bookings:proximos_horarios': {'ip': '60/m'},
+}
+
+# Minutos até um agendamento PENDENTE não confirmado liberar o horário
+# (cancelado pelo comando expire_pending_bookings). 0 = nunca expira.
+PENDING_BOOKING_TTL_MINUTES = int(os.environ.get('PENDING_BOOKING_TTL_MINUTES', 24 * 60))
+
+# Máximo de agendamentos PENDENTES futuros por telefone
+MAX_PENDING_BOOKINGS_PER_PHONE = int(os.environ.get('MAX_PENDING_BOOKINGS_PER_PHONE', 3))
+
+# Dias futuros incluídos no feed .ics do profissional
+CALENDAR_FEED_DAYS = int(os.environ.get('CALENDAR_FEED_DAYS', 60))
+
+# Notificações ao cliente (outbox + comando send_notifications)
+NOTIFICATIONS_ENABLED = os.environ.get('NOTIFICATIONS_ENABLED', 'true').lower() == 'true'
+NOTIFICATION_TRANSPORT = os.environ.get('NOTIFICATION_TRANSPORT', 'bookings.notifications.ConsoleTransport')
+NOTIFICATION_FILE_PATH = os.environ.get('NOTIFICATION_FILE_PATH', str(BASE_DIR / 'notifications.jsonl'))
+NOTIFICATION_MAX_ATTEMPTS = int(os.environ.get('NOTIFICATION_MAX_ATTEMPTS', 5))
+NOTIFICATION_RETRY_SECONDS = int(os.environ.get('NOTIFICATION_RETRY_SECONDS', 60))
+
+# Negócio usado quando o domínio não identifica nenhum (vazio = o primeiro)
+DEFAULT_BUSINESS_SLUG = os.environ.get('DEFAULT_BUSINESS_SLUG', '')
+
+# Rastreamento (bookings.tracing): fração das requisições com spans
+# gravados em OTLP-JSON, num arquivo rotativo ou no stdout
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0))
+# Seguir o flag de amostragem do `traceparent` recebido (só atrás de um
+# proxy/gateway que controla o cabeçalho; clientes podem forjá-lo)
+TRACE_TRUST_PARENT = os.environ.get('TRACE_TRUST_PARENT', 'false').lower() == 'true'
+TRACE_EXPORT = os.environ.get('TRACE_EXPORT', 'file')  # 'file' ou 'stdout'
+TRACE_FILE_PATH = os.environ.get('TRACE_FILE_PATH', str(BASE_DIR / 'traces.jsonl'))
+TRACE_FILE_MAX_BYTES = int(os.environ.get('TRACE_FILE_MAX_BYTES', 10 * 1024 * 1024))
+TRACE_FILE_BACKUP_COUNT = int(os.environ.get('TRACE_FILE_BACKUP_COUNT', 5))
+TRACE_SERVICE_NAME = os.environ.get('TRACE_SERVICE_NAME', 'agendamento')
+
+# Métricas (bookings.metrics), somadas entre workers por arquivos em METRICS_DIR
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_DIR = os.environ.get('METRICS_DIR', '/tmp/agendamento-metrics')
+METRICS_FLUSH_SECONDS = int(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+# Token exigido pelo /metrics (Authorization: Bearer); vazio = só staff logado
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 # WhatsApp Business
 WHATSAPP_BUSINESS_NUMBER = "5524998190280"  # +55 24 99819-0280
 
@@ -215,10 +366,26 @@ if not DEBUG and os.environ.get('RAILWAY_ENVIRONMENT'):
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
         },
+        # Uma linha OTLP-JSON por trace
+        'traces': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': TRACE_FILE_PATH,
+            'maxBytes': TRACE_FILE_MAX_BYTES,
+            'backupCount': TRACE_FILE_BACKUP_COUNT,
+            'delay': True,  # o arquivo só é criado no primeiro trace
+            'formatter': 'message',
+        } if TRACE_EXPORT == 'file' else {
+            'class': 'logging.StreamHandler',
+            'stream': 'ext://sys.stdout',
+            'formatter': 'message',
+        },
     },
     'root': {
         'handlers': ['console'],
@@ -230,6 +397,11 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': False,
         },
+        'bookings.traces': {
+            'handlers': ['traces'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
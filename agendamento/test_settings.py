@@ -0,0 +1,13 @@
+"""
+Configurações dos testes (manage.py test usa este módulo).
+
+Acrescenta uma réplica SQLite separada do primário, vazia nos testes,
+para verificar o roteamento de leituras (bookings.routers).
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'db_replica.sqlite3',
+}
@@ -16,11 +16,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from bookings.views import favicon_view
+from bookings.views import favicon_view, metrics_view
 
 urlpatterns = [
     path('secret-dev-access-f7b8c9d2e1a3/', admin.site.urls),  # URL secreta para desenvolvedor apenas
     path('profissional/', include('bookings.admin_urls')),  # Nova interface para profissional
     path('favicon.ico', favicon_view, name='favicon'),
+    path('metrics', metrics_view, name='metrics'),  # Prometheus (METRICS_TOKEN)
     path('', include('bookings.urls')),
 ]
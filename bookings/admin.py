@@ -1,24 +1,113 @@
 from django.contrib import admin
-from .models import Service, Schedule, Booking
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .models import Business, Service, Booking, WaitlistEntry, RecurrenceRule, Notification
+from .utils import canonical_phone, normalize_phone
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginador que evita COUNT(*) completo em tabelas grandes no PostgreSQL.
+    
+    Sem filtros, usa a estimativa do planner (pg_class.reltuples); acima de
+    ESTIMATE_THRESHOLD linhas o número exato não faz diferença para a
+    navegação. Com filtros (ou em outros bancos) faz o COUNT normal.
+    """
+    ESTIMATE_THRESHOLD = 100_000
+    
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is not None and not query.where:
+            connection = connections[queryset.db]
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                        [queryset.model._meta.db_table],
+                    )
+                    row = cursor.fetchone()
+                if row and row[0] > self.ESTIMATE_THRESHOLD:
+                    return row[0]
+        return super().count
+
+
+@admin.register(Business)
+class BusinessAdmin(admin.ModelAdmin):
+    list_display = ['name', 'slug', 'host', 'whatsapp_number']
+    search_fields = ['name', 'slug', 'host']
+    prepopulated_fields = {'slug': ['name']}
+    filter_horizontal = ['users']
 
 
 @admin.register(Service)
 class ServiceAdmin(admin.ModelAdmin):
-    list_display = ['name', 'price_cents', 'duration_minutes']
+    list_display = ['name', 'business', 'price_cents', 'duration_minutes']
     list_editable = ['price_cents', 'duration_minutes']
-
-
-@admin.register(Schedule)
-class ScheduleAdmin(admin.ModelAdmin):
-    list_display = ['date', 'time_slot', 'is_available']
-    list_filter = ['date', 'is_available']
-    list_editable = ['is_available']
-    ordering = ['date', 'time_slot']
+    list_filter = ['business']
+    list_select_related = ['business']
 
 
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
-    list_display = ['customer_name', 'service', 'date', 'time', 'status', 'created_at']
-    list_filter = ['status', 'date', 'service']
-    search_fields = ['customer_name', 'customer_phone']
+    list_display = ['customer_name', 'service', 'date', 'start_time', 'status', 'created_at']
+    list_filter = ['business', 'status', 'date', 'service']
+    list_select_related = ['service']
+    date_hierarchy = 'date'
+    # Busca por nome: índice trigram no PostgreSQL (migração 0006)
+    search_fields = ['customer_name']
+    ordering = ['-created_at']
+    paginator = EstimatedCountPaginator
+    # Não repetir COUNT(*) sem filtros ao lado do total filtrado
+    show_full_result_count = False
+    raw_id_fields = ['recurrence']
+    
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Termos numéricos buscam pelo telefone. Número completo vai direto à
+        chave canônica; número parcial casa o prefixo da chave com e sem o
+        nono dígito (a chave não guarda o 9). Não há busca pelo final do
+        número: LIKE '%…' não usa índice e varreria a tabela inteira.
+        """
+        term = search_term.strip()
+        digits = normalize_phone(term)
+        if len(digits) >= 4 and not any(char.isalpha() for char in term):
+            key = canonical_phone(digits)
+            if len(digits) >= 10 and len(key) == 10:
+                return queryset.filter(customer_phone_key=key), False
+            prefixes = {digits}
+            if len(digits) >= 3 and digits[2] == '9':
+                prefixes.add(digits[:2] + digits[3:])
+            condition = Q()
+            for prefix in prefixes:
+                condition |= Q(customer_phone_key__startswith=prefix)
+            return queryset.filter(condition), False
+        return super().get_search_results(request, queryset, search_term)
+
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ['customer_name', 'service', 'date', 'start_time', 'status', 'created_at']
+    list_filter = ['status', 'service']
+    list_select_related = ['service']
+    raw_id_fields = ['booking']
+    ordering = ['date', 'start_time', 'created_at']
+
+
+@admin.register(RecurrenceRule)
+class RecurrenceRuleAdmin(admin.ModelAdmin):
+    list_display = ['customer_name', 'service', 'frequency', 'start_date', 'start_time', 'until', 'count']
+    list_filter = ['frequency', 'service']
+    list_select_related = ['service']
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ['recipient', 'kind', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status', 'kind']
+    raw_id_fields = ['booking']
     ordering = ['-created_at']
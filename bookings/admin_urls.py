@@ -14,9 +14,14 @@ urlpatterns = [
     path('agenda/<str:date>/', professional_views.agenda_data, name='agenda_data'),
     path('agendamento/<int:booking_id>/', professional_views.agendamento_detail, name='agendamento_detail'),
     path('agendamento/<int:booking_id>/status/', professional_views.update_status, name='update_status'),
+    path('agendamentos/status/', professional_views.bulk_update_status_view, name='bulk_update_status'),
+    path('recorrencias/', professional_views.criar_recorrencia, name='criar_recorrencia'),
+    path('calendario/<str:token>.ics', professional_views.calendario_ics, name='calendario_ics'),
     path('relatorios/', professional_views.relatorios, name='relatorios'),
+    path('metricas/holds/', professional_views.metricas_holds, name='metricas_holds'),
     path('relatorios/exportar-pdf/', professional_views.exportar_relatorio_pdf, name='exportar_pdf'),
     path('relatorios/exportar-csv/', professional_views.exportar_csv, name='exportar_csv'),
+    path('relatorios/exportar-dados/', professional_views.exportar_dados, name='exportar_dados'),
     path('configuracoes/', professional_views.configuracoes, name='configuracoes'),
     path('configuracoes/backup/', professional_views.backup_dados, name='backup_dados'),
     path('configuracoes/limpar-antigos/', professional_views.limpar_dados_antigos, name='limpar_antigos'),
@@ -0,0 +1,151 @@
+"""
+Exportação colunar dos agendamentos (Parquet ou Arrow IPC) para análise.
+
+Ao contrário do CSV do painel, as colunas são tipadas: datas e horários
+nativos, valores em centavos como inteiros e status/serviço codificados
+como dicionário. As linhas são lidas em lotes de um cursor do lado do
+servidor (QuerySet.iterator no PostgreSQL) e cada lote vira um row group
+(Parquet) ou record batch (Arrow), que é enviado assim que fica pronto:
+memória limitada a um lote, qualquer que seja o tamanho da exportação.
+
+Requer pyarrow, importado só quando uma exportação é feita.
+"""
+from itertools import islice
+
+from .catalog import service_catalog
+from .models import Booking
+
+# formato -> (content type, extensão)
+FORMATS = {
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.file', 'arrow'),
+}
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+# Colunas lidas do banco, na ordem do values_list
+FIELDS = (
+    'id', 'business_id', 'service_id', 'date', 'start_time', 'end_time', 'status',
+    'price_cents', 'duration_minutes', 'customer_name', 'customer_phone',
+    'customer_phone_key', 'created_at',
+)
+
+STATUSES = [code for code, _ in Booking.STATUS_CHOICES]
+
+
+def export_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('id', pa.int64()),
+        ('business_id', pa.int64()),
+        ('service_id', pa.int64()),
+        ('service', pa.dictionary(pa.int32(), pa.string())),
+        ('date', pa.date32()),
+        ('start_time', pa.time32('s')),
+        ('end_time', pa.time32('s')),
+        ('status', pa.dictionary(pa.int8(), pa.string())),
+        ('price_cents', pa.int32()),
+        ('duration_minutes', pa.int16()),
+        ('customer_name', pa.string()),
+        ('customer_phone', pa.string()),
+        ('customer_phone_key', pa.string()),
+        ('created_at', pa.timestamp('us', tz='UTC')),
+    ])
+
+
+def record_batches(queryset, business=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Lotes (pyarrow.RecordBatch) de até `chunk_size` agendamentos.
+
+    Os dicionários de serviço e status são fixos para a exportação inteira
+    (Arrow IPC em arquivo não aceita dicionários diferentes por lote).
+    """
+    import pyarrow as pa
+
+    schema = export_schema()
+    services = service_catalog.all(business)
+    service_index = {service.pk: index for index, service in enumerate(services)}
+    service_names = pa.array([service.name for service in services], pa.string())
+    status_index = {status: index for index, status in enumerate(STATUSES)}
+    status_names = pa.array(STATUSES, pa.string())
+
+    rows = queryset.values_list(*FIELDS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        columns = dict(zip(FIELDS, zip(*chunk)))
+        arrays = {
+            'service': pa.DictionaryArray.from_arrays(
+                pa.array([service_index.get(pk) for pk in columns['service_id']], pa.int32()),
+                service_names,
+            ),
+            'status': pa.DictionaryArray.from_arrays(
+                pa.array([status_index.get(status) for status in columns['status']], pa.int8()),
+                status_names,
+            ),
+        }
+        yield pa.RecordBatch.from_arrays(
+            [
+                arrays[field.name] if field.name in arrays else pa.array(columns[field.name], field.type)
+                for field in schema
+            ],
+            schema=schema,
+        )
+
+
+class StreamSink:
+    """Arquivo só de escrita cujo conteúdo é retirado a cada lote"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_export(queryset, fmt='parquet', business=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Bytes do arquivo `fmt` ('parquet' ou 'arrow'), gerados lote a lote.
+    Serve tanto a StreamingHttpResponse quanto a escrita em disco.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if fmt not in FORMATS:
+        raise ValueError(f'Formato desconhecido: {fmt!r}')
+    sink = StreamSink()
+    schema = export_schema()
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_file(sink, schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+    try:
+        for batch in record_batches(queryset, business, chunk_size):
+            writer.write_batch(batch)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        # Fecha o arquivo (rodapé/índice) mesmo se a exportação for interrompida
+        writer.close()
+    yield sink.drain()
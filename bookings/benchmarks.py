@@ -0,0 +1,480 @@
+"""
+Cenários de benchmark, executados por `python manage.py benchmark <cenário>`.
+
+Cada cenário popula o banco com dados sintéticos (dentro de uma transação
+que o comando desfaz ao final) e devolve uma lista de medições.
+"""
+import random
+import statistics
+import time as time_module
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from .models import Booking, Service
+from .services import list_day_times
+
+SCENARIOS = {}
+
+STATUS_WEIGHTS = [('CONFIRMED', 70), ('PENDING', 15), ('CANCELLED', 15)]
+
+
+def scenario(name, rows):
+    """Registra um cenário com o número padrão de linhas"""
+    def decorator(func):
+        SCENARIOS[name] = (func, rows)
+        return func
+    return decorator
+
+
+def measure(label, func, repeat=5):
+    """
+    Executa `func` `repeat` vezes.
+    Retorna melhor tempo e mediana (ms) e o nº de queries da última execução.
+    """
+    timings = []
+    for _ in range(repeat):
+        # O log de queries é limitado (9000): depois de popular milhões de
+        # linhas ele está cheio e a contagem sairia zerada
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            started = time_module.perf_counter()
+            func()
+            timings.append((time_module.perf_counter() - started) * 1000)
+    return {
+        'label': label,
+        'best_ms': min(timings),
+        'median_ms': statistics.median(timings),
+        'queries': len(ctx.captured_queries),
+    }
+
+
+def seed_services(count=3):
+    """Cria serviços de benchmark com durações variadas"""
+    services = [
+        Service(name=f'Bench {i + 1}', price_cents=5000 + 2500 * i, duration_minutes=30 * (i + 2))
+        for i in range(count)
+    ]
+    return Service.objects.bulk_create(services)
+
+
+def seed_bookings(rows, services, start=None, slot_minutes=5, batch_size=5000, seed=42):
+    """
+    Insere `rows` agendamentos sem violar (service, date, start_time).
+    
+    Os horários são distribuídos numa grade de `slot_minutes` entre 06:00
+    e 23:55, dia após dia a partir de `start`, com status, nomes e
+    telefones pseudoaleatórios (determinísticos por `seed`).
+    """
+    rng = random.Random(seed)
+    start = start or date.today() - timedelta(days=365)
+    slot_times = [
+        (datetime(2000, 1, 1, 6) + timedelta(minutes=m)).time()
+        for m in range(0, 18 * 60, slot_minutes)
+    ]
+    statuses = [s for s, _ in STATUS_WEIGHTS]
+    weights = [w for _, w in STATUS_WEIGHTS]
+    
+    batch = []
+    created = 0
+    day = start
+    while created < rows:
+        for slot in slot_times:
+            for service in services:
+                if created >= rows:
+                    break
+                customer = rng.randrange(max(rows // 4, 1))
+                batch.append(Booking(
+                    service=service,
+                    customer_name=f'Cliente {customer}',
+                    customer_phone=f'119{customer:08d}',
+                    date=day,
+                    start_time=slot,
+                    status=rng.choices(statuses, weights)[0],
+                ))
+                created += 1
+                if len(batch) >= batch_size:
+                    seed_batch(batch)
+                    batch = []
+        day += timedelta(days=1)
+    
+    if batch:
+        seed_batch(batch)
+    return created
+
+
+def seed_batch(bookings, **kwargs):
+    """bulk_create de dados sintéticos, sem mensagens na outbox"""
+    with override_settings(NOTIFICATIONS_ENABLED=False):
+        return Booking.objects.bulk_create(bookings, **kwargs)
+
+
+@scenario('admin_changelist', rows=1_000_000)
+def admin_changelist(rows):
+    """Changelist do BookingAdmin: paginação, busca e filtros"""
+    from django.contrib import admin
+    from django.contrib.auth.models import User
+    from django.test import RequestFactory
+    
+    seed_bookings(rows, seed_services())
+    user = User.objects.create_superuser('bench-admin', 'bench@example.com', 'bench')
+    model_admin = admin.site._registry[Booking]
+    factory = RequestFactory()
+    
+    def changelist(params):
+        def run():
+            request = factory.get('/admin/bookings/booking/', params)
+            request.user = user
+            model_admin.changelist_view(request).render()
+        return run
+    
+    middle = Booking.objects.order_by('date').values_list('date', flat=True)[rows // 2]
+    return [
+        measure('página 1', changelist({})),
+        measure('página 200', changelist({'p': 200})),
+        measure('busca por nome', changelist({'q': 'Cliente 4242'})),
+        measure('busca por telefone', changelist({'q': '(11) 9000-04242'})),
+        measure('filtro status', changelist({'status__exact': 'PENDING'})),
+        measure('date_hierarchy (dia)', changelist({
+            'date__year': middle.year, 'date__month': middle.month, 'date__day': middle.day,
+        })),
+    ]
+
+
+@scenario('recurrence_expand', rows=200_000)
+def recurrence_expand(rows):
+    """Um ano de agendamentos semanais: expansão em lote vs. um a um"""
+    from .models import RecurrenceRule
+    from .recurrence import create_recurring_bookings, expand_occurrences
+    from .services import is_time_available
+    
+    services = seed_services()
+    seed_bookings(rows, services, slot_minutes=15)
+    start = date.today()
+    slots = iter(range(10_000))
+    
+    def new_rule():
+        # Horário diferente a cada execução para não colidir com a anterior
+        minute = next(slots)
+        return RecurrenceRule.objects.create(
+            service=services[0],
+            customer_name='Cliente fixo',
+            customer_phone='11999990000',
+            start_date=start,
+            start_time=time(minute // 60 % 24, minute % 60),
+            frequency='WEEKLY',
+            count=52,
+        )
+    
+    def bulk():
+        create_recurring_bookings(new_rule())
+    
+    def one_by_one():
+        rule = new_rule()
+        for occurrence in expand_occurrences(rule):
+            if is_time_available(rule.service, occurrence, rule.start_time):
+                Booking.objects.create(
+                    service=rule.service,
+                    customer_name=rule.customer_name,
+                    customer_phone=rule.customer_phone,
+                    date=occurrence,
+                    start_time=rule.start_time,
+                    recurrence=rule,
+                )
+    
+    return [
+        measure('bulk_create (52 semanas)', bulk),
+        measure('um a um (52 semanas)', one_by_one),
+    ]
+
+
+@scenario('next_available', rows=100_000)
+def next_available(rows):
+    """Próximo horário livre numa agenda lotada e esparsa"""
+    from .services import find_next_available, list_free_times
+    
+    service = seed_services(count=1)[0]
+    today = date.today()
+    grid = list_day_times(today)
+    days = max(rows // len(grid), 1)
+    # Agenda lotada por `days` dias, exceto um horário a cada 30 dias
+    seed_batch([
+        Booking(
+            service=service,
+            customer_name=f'Cliente {i}',
+            customer_phone=f'119{i:08d}',
+            date=today + timedelta(days=i // len(grid)),
+            start_time=grid[i % len(grid)],
+            status='CONFIRMED',
+        )
+        for i in range(days * len(grid))
+        if not (i // len(grid) % 30 == 29 and i % len(grid) == 0)
+    ], batch_size=5000)
+    after = datetime.combine(today, time(0, 0))
+    
+    def day_by_day(limit):
+        def run():
+            found = []
+            day = today
+            while len(found) < limit and day < today + timedelta(days=180):
+                found.extend((day, t) for t in list_free_times(service, day))
+                day += timedelta(days=1)
+        return run
+    
+    return [
+        measure('em lotes (1 horário)', lambda: find_next_available(service, after, 1)),
+        measure('em lotes (5 horários)', lambda: find_next_available(service, after, 5)),
+        measure('dia a dia (1 horário)', day_by_day(1)),
+        measure('dia a dia (5 horários)', day_by_day(5)),
+    ]
+
+
+POOL_BENCH_THREADS = 8
+POOL_BENCH_REQUESTS = 50
+
+POOLING_MODES = [
+    ('sem persistência', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}),
+    ('persistente + health check', {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True}),
+    ('pool psycopg', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'pool': True}),
+]
+
+
+def simulate_requests(settings_dict, alias, threads=POOL_BENCH_THREADS, requests=POOL_BENCH_REQUESTS):
+    """
+    Simula `threads` threads do gunicorn atendendo `requests` requisições
+    cada, com o ciclo de conexão do Django (close_old_connections antes e
+    depois, uma query no meio). Retorna a medição, incluindo as conexões
+    que ficam abertas ao final (ociosas, ocupando o limite do Postgres).
+    """
+    import threading
+    from django.db.utils import load_backend
+    
+    backend = load_backend(settings_dict['ENGINE'])
+    wrappers = [backend.DatabaseWrapper(dict(settings_dict), alias) for _ in range(threads)]
+    timings = []
+    lock = threading.Lock()
+    today = date.today()
+    
+    def worker(wrapper):
+        local = []
+        for _ in range(requests):
+            started = time_module.perf_counter()
+            wrapper.close_if_unusable_or_obsolete()  # request_started
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT COUNT(*) FROM bookings_booking WHERE date = %s', [today])
+                cursor.fetchone()
+            wrapper.close_if_unusable_or_obsolete()  # request_finished
+            local.append((time_module.perf_counter() - started) * 1000)
+        with lock:
+            timings.extend(local)
+    
+    # Criados aqui, usados nas threads e fechados aqui de novo
+    for wrapper in wrappers:
+        wrapper.inc_thread_sharing()
+    pool_threads = [threading.Thread(target=worker, args=(wrapper,)) for wrapper in wrappers]
+    for thread in pool_threads:
+        thread.start()
+    for thread in pool_threads:
+        thread.join()
+    
+    pool = getattr(wrappers[0], 'pool', None)
+    if pool:
+        open_connections = pool.get_stats()['pool_size']
+    else:
+        open_connections = sum(wrapper.connection is not None for wrapper in wrappers)
+    
+    for wrapper in wrappers:
+        wrapper.close()
+        wrapper.dec_thread_sharing()
+    if pool:
+        wrappers[0].close_pool()
+    
+    timings.sort()
+    return {
+        'best_ms': timings[0],
+        'median_ms': statistics.median(timings),
+        'p95_ms': timings[int(len(timings) * 0.95) - 1],
+        'queries': 1,
+        'connections': open_connections,
+    }
+
+
+@scenario('connection_pooling', rows=0)
+def connection_pooling(rows):
+    """
+    Latência por requisição e conexões abertas em cada modo de conexão.
+    
+    As threads usam conexões próprias (fora da transação do comando), por
+    isso só enxergam dados já gravados; `rows` não é usado. O modo pool
+    só roda em PostgreSQL com psycopg 3.
+    """
+    from copy import deepcopy
+    
+    results = []
+    for label, mode in POOLING_MODES:
+        pooled = mode.get('pool')
+        if pooled and connection.vendor != 'postgresql':
+            continue
+        settings_dict = deepcopy(connection.settings_dict)
+        settings_dict.update(CONN_MAX_AGE=mode['CONN_MAX_AGE'], CONN_HEALTH_CHECKS=mode['CONN_HEALTH_CHECKS'])
+        settings_dict['OPTIONS'].pop('pool', None)
+        if pooled:
+            settings_dict['OPTIONS']['pool'] = {'min_size': 1, 'max_size': 4}
+        result = simulate_requests(settings_dict, f'bench_{len(results)}')
+        result['label'] = label
+        results.append(result)
+    return results
+
+
+@scenario('rate_limit', rows=0)
+def rate_limit(rows):
+    """
+    Custo do limite de requisições: verificações isoladas (10.000 IPs
+    distintos, o pior caso do LRU) com o backend configurado em
+    RATE_LIMIT_BACKEND (o que vai para produção) e com os dois backends,
+    e a agenda pública com e sem o middleware.
+    """
+    from django.test import Client
+    from django.utils.module_loading import import_string
+    from . import middleware
+    from .ratelimit import CacheBackend, LocalMemoryBackend, RateLimiter
+    
+    middleware._migrations_completed = True
+    service = seed_services(count=1)[0]
+    ips = [f'10.{i // 65536}.{i // 256 % 256}.{i % 256}' for i in range(10_000)]
+    limits = {'bookings:agenda': {'ip': '1000000/m'}, 'bookings:meus_agendamentos': {'ip': '1000000/m', 'phone': '1000000/m'}}
+    
+    def checks(backend_factory):
+        def run():
+            limiter = RateLimiter()
+            limiter._backend = backend_factory()
+            for ip in ips:
+                limiter.check('bookings:meus_agendamentos', ip, '1199998888')
+        return run
+    
+    client = Client()
+    
+    def agenda(enabled):
+        def run():
+            with override_settings(RATE_LIMIT_ENABLED=enabled):
+                for _ in range(100):
+                    client.get('/agenda/', {'service': service.pk})
+        return run
+    
+    with override_settings(RATE_LIMITS=limits):
+        return [
+            measure('10k verificações (configurado)', checks(import_string(settings.RATE_LIMIT_BACKEND))),
+            measure('10k verificações (memória)', checks(LocalMemoryBackend)),
+            measure('10k verificações (cache)', checks(CacheBackend)),
+            # Mais repetições: a diferença é menor que o ruído de uma rodada
+            measure('100 GET /agenda/ sem limite', agenda(False), repeat=15),
+            measure('100 GET /agenda/ com limite', agenda(True), repeat=15),
+        ]
+
+
+@scenario('metrics_overhead', rows=0)
+def metrics_overhead(rows):
+    """
+    Custo de registrar métricas no caminho quente: operações isoladas
+    (100.000 cada) e a agenda pública com e sem o MetricsMiddleware.
+    """
+    import tempfile
+    from django.test import Client
+    from . import middleware
+    from .metrics import MetricsRegistry
+    
+    middleware._migrations_completed = True
+    service = seed_services(count=1)[0]
+    registry = MetricsRegistry()
+    
+    def counters():
+        for _ in range(100_000):
+            registry.inc('bookings_created_total')
+    
+    def histograms():
+        for i in range(100_000):
+            registry.observe('http_request_duration_seconds', (i % 1000) / 1000, route='bookings:agenda')
+    
+    client = Client()
+    
+    def agenda(enabled):
+        def run():
+            with override_settings(METRICS_ENABLED=enabled):
+                for _ in range(100):
+                    client.get('/agenda/', {'service': service.pk})
+        return run
+    
+    with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+        return [
+            measure('100k inc()', counters),
+            measure('100k observe()', histograms),
+            # Mais repetições: a diferença é menor que o ruído de uma rodada
+            measure('100 GET /agenda/ sem métricas', agenda(False), repeat=15),
+            measure('100 GET /agenda/ com métricas', agenda(True), repeat=15),
+        ]
+
+
+@scenario('columnar_export', rows=200_000)
+def columnar_export(rows):
+    """
+    Exportação do histórico inteiro: CSV do painel contra Parquet e Arrow
+    (tempo de geração e tamanho do arquivo baixado).
+    """
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from django.urls import reverse
+    from . import middleware
+    
+    middleware._migrations_completed = True
+    seed_bookings(rows, seed_services())
+    client = Client()
+    client.force_login(User.objects.create_user('bench-export', password='x', is_superuser=True, is_staff=True))
+    period = {'start_date': '2000-01-01', 'end_date': '2100-12-31'}
+    sizes = {}
+    
+    def download(label, url, params):
+        def run():
+            response = client.get(url, params)
+            if response.streaming:
+                content = b''.join(response.streaming_content)
+            else:
+                content = response.content
+            sizes[label] = len(content)
+        return run
+    
+    results = []
+    for label, url, params in [
+        ('CSV', reverse('profissional:exportar_csv'), period),
+        ('Parquet', reverse('profissional:exportar_dados'), {**period, 'formato': 'parquet'}),
+        ('Arrow IPC', reverse('profissional:exportar_dados'), {**period, 'formato': 'arrow'}),
+    ]:
+        result = measure(label, download(label, url, params), repeat=3)
+        result['size_kb'] = sizes[label] // 1024
+        results.append(result)
+    return results
+
+
+@scenario('report_computation', rows=1_000_000)
+def report_computation(rows):
+    """
+    Relatório do período inteiro: agregações no banco contra colunas
+    NumPy (carga e cálculo medidos também em separado).
+    """
+    from django.db.models import Max, Min
+    from .reports import load_columns, orm_aggregates, period_report, vectorized_aggregates
+    
+    seed_bookings(rows, seed_services())
+    bookings = Booking.objects.all()
+    period = bookings.aggregate(start=Min('date'), end=Max('date'))
+    start, end = period['start'], period['end']
+    columns = load_columns(bookings)
+    
+    return [
+        measure('ORM: agregados', lambda: orm_aggregates(bookings, start, end), repeat=3),
+        measure('NumPy: carregar colunas', lambda: load_columns(bookings), repeat=3),
+        measure('NumPy: calcular', lambda: vectorized_aggregates(columns, start, end), repeat=3),
+        measure('relatório (ORM)', lambda: period_report(bookings, start, end, vectorized=False), repeat=3),
+        measure('relatório (NumPy)', lambda: period_report(bookings, start, end, vectorized=True), repeat=3),
+    ]
@@ -0,0 +1,219 @@
+"""
+Feed iCalendar (.ics) da agenda do profissional.
+
+O feed é montado dia a dia: cada dia vira um bloco de VEVENTs guardado
+no cache local do processo, sob uma versão do dia publicada no cache
+compartilhado. Escritas em Booking trocam só a versão dos dias
+afetados, então uma atualização gera de novo apenas esses dias. O ETag é derivado das versões, o que permite
+responder 304 sem consultar agendamentos nem renderizar nada.
+"""
+import hashlib
+import secrets
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .catalog import service_catalog
+from .models import Booking, CalendarFeedToken
+
+DAY_VERSION_KEY = 'bookings:ics:version:{}'
+DAY_CHUNK_KEY = 'bookings:ics:chunk:{}:{}:{}:{}'
+CHUNK_TIMEOUT = 60 * 60 * 24
+# Versões de dias que já saíram da janela expiram sozinhas
+VERSION_TIMEOUT = 60 * 60 * 24 * 120
+
+STATUS_MAP = {'PENDING': 'TENTATIVE', 'CONFIRMED': 'CONFIRMED'}
+
+
+def feed_token_for(user, business=None):
+    """Token do feed do usuário no negócio (criado na primeira vez)"""
+    feed_token, _ = CalendarFeedToken.objects.get_or_create(
+        user=user, business=business, defaults={'token': secrets.token_urlsafe(32)},
+    )
+    return feed_token.token
+
+
+def valid_feed_token(token):
+    """Token de um usuário ativo da equipe (com o negócio), ou None"""
+    return CalendarFeedToken.objects.filter(
+        token=token, user__is_active=True, user__is_staff=True,
+    ).select_related('business').first()
+
+
+def feed_cache():
+    """Versões dos dias: vistas por todos os workers"""
+    return caches['shared']
+
+
+def chunk_cache():
+    """
+    Blocos renderizados e resumos de relatórios: derivados das versões,
+    locais a cada processo, num cache próprio dimensionado para janelas
+    longas
+    """
+    return caches['chunks']
+
+
+def feed_days(today=None):
+    """Dias cobertos pelo feed: hoje + CALENDAR_FEED_DAYS"""
+    today = today or timezone.localdate()
+    total = getattr(settings, 'CALENDAR_FEED_DAYS', 60)
+    return [today + timedelta(days=offset) for offset in range(total)]
+
+
+def day_versions(days):
+    """Versão de cada dia (uma leitura em lote no cache compartilhado)"""
+    cache = feed_cache()
+    keys = {day: DAY_VERSION_KEY.format(day.isoformat()) for day in days}
+    found = cache.get_many(list(keys.values()))
+    versions = {}
+    missing = {}
+    for day, key in keys.items():
+        if key in found:
+            versions[day] = found[key]
+        else:
+            missing[key] = versions[day] = uuid.uuid4().hex
+    if missing:
+        cache.set_many(missing, timeout=VERSION_TIMEOUT)
+    return versions
+
+
+def invalidate_days(days):
+    """
+    Troca a versão dos dias afetados agora e de novo após o commit,
+    como no catálogo de serviços.
+    """
+    keys = [DAY_VERSION_KEY.format(day.isoformat()) for day in set(days)]
+    if not keys:
+        return
+    
+    def publish():
+        feed_cache().delete_many(keys)
+    
+    publish()
+    transaction.on_commit(publish)
+
+
+def feed_etag(business=None, days=None):
+    """
+    ETag do feed: negócio + versões dos dias + versão do catálogo (nomes
+    de serviço). As versões dos dias são comuns a todos os negócios: uma
+    escrita invalida o dia inteiro, o que só custa uma nova renderização.
+    """
+    days = days or feed_days()
+    versions = day_versions(days)
+    digest = hashlib.md5(f'{business.pk if business else "-"}:{service_catalog.current_version()}'.encode())
+    for day in days:
+        digest.update(f'{day.isoformat()}={versions[day]};'.encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def escape_text(value):
+    """Escapa TEXT conforme RFC 5545 (3.3.11)"""
+    return (
+        str(value).replace('\\', '\\\\').replace(';', '\\;')
+        .replace(',', '\\,').replace('\n', '\\n')
+    )
+
+
+def fold_line(line):
+    """Quebra linhas com mais de 75 octetos (RFC 5545, 3.1)"""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        # Não cortar no meio de um caractere UTF-8
+        while cut and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+    parts.append(encoded.decode())
+    return '\r\n '.join(parts)
+
+
+def format_utc(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def render_event(booking):
+    """VEVENT de um agendamento (UID estável pelo id)"""
+    service = service_catalog.get(booking.service_id)
+    start = timezone.make_aware(datetime.combine(booking.date, booking.start_time))
+    end_time = booking.end_time or booking.start_time
+    end = timezone.make_aware(datetime.combine(booking.date, end_time))
+    modified = format_utc(booking.updated_at or booking.created_at)
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:booking-{booking.pk}@agendamento',
+        f'DTSTAMP:{modified}',
+        f'LAST-MODIFIED:{modified}',
+        f'DTSTART:{format_utc(start)}',
+        f'DTEND:{format_utc(end)}',
+        f'SUMMARY:{escape_text(f"{service.name} - {booking.customer_name}")}',
+        f'DESCRIPTION:{escape_text(f"Telefone: {booking.customer_phone}")}',
+        f'STATUS:{STATUS_MAP[booking.status]}',
+        'END:VEVENT',
+    ]
+    return ''.join(fold_line(line) + '\r\n' for line in lines)
+
+
+def render_days(days, business=None):
+    """Blocos de VEVENTs por dia (uma consulta por intervalo)"""
+    chunks = {day: [] for day in days}
+    bookings = Booking.objects.for_business(business).filter(
+        date__range=(min(days), max(days)),
+        status__in=Booking.ACTIVE_STATUSES,
+    ).only(
+        'id', 'service_id', 'customer_name', 'customer_phone',
+        'date', 'start_time', 'end_time', 'status', 'created_at', 'updated_at',
+    ).order_by('date', 'start_time')
+    for booking in bookings:
+        if booking.date in chunks:
+            chunks[booking.date].append(render_event(booking))
+    return {day: ''.join(events) for day, events in chunks.items()}
+
+
+def render_feed(business=None, days=None):
+    """
+    Calendário completo. Dias já em cache não consultam o banco; os
+    demais são gerados juntos e guardados para as próximas requisições.
+    """
+    days = days or feed_days()
+    cache = chunk_cache()
+    versions = day_versions(days)
+    catalog_version = service_catalog.current_version()
+    business_id = business.pk if business else '-'
+    keys = {
+        day: DAY_CHUNK_KEY.format(business_id, day.isoformat(), versions[day], catalog_version)
+        for day in days
+    }
+    cached = cache.get_many(list(keys.values()))
+    
+    missing = [day for day in days if keys[day] not in cached]
+    metrics.inc('cache_requests_total', len(days) - len(missing), cache='calendar_days', result='hit')
+    metrics.inc('cache_requests_total', len(missing), cache='calendar_days', result='miss')
+    if missing:
+        rendered = render_days(missing, business)
+        cache.set_many({keys[day]: rendered[day] for day in missing}, timeout=CHUNK_TIMEOUT)
+        cached.update({keys[day]: rendered[day] for day in missing})
+    
+    header = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Agendamento//Agenda do Profissional//PT',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        'X-WR-CALNAME:Agenda',
+    ]
+    return (
+        ''.join(line + '\r\n' for line in header)
+        + ''.join(cached[keys[day]] for day in days)
+        + 'END:VCALENDAR\r\n'
+    )
@@ -0,0 +1,158 @@
+"""
+Cache em memória do catálogo de serviços.
+
+O catálogo muda poucas vezes por ano (admin ou tela de configurações),
+mas é lido em quase toda requisição pública. Cada processo (worker do
+gunicorn) mantém sua própria cópia e só recarrega do banco quando a
+versão compartilhada no cache 'shared' muda.
+"""
+import threading
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+
+from . import metrics
+from .models import Service
+
+CATALOG_VERSION_KEY = 'bookings:service_catalog:version'
+
+
+class VersionedCache:
+    """
+    Cópia local (por processo) de uma tabela pequena, versionada por uma
+    chave no cache compartilhado.
+
+    Subclasses definem `version_key` e `load()`. Consultas no caminho
+    quente apenas leem a versão compartilhada e, se ela não mudou,
+    respondem com os objetos já carregados.
+    """
+    version_key = None
+    # Rótulo na métrica cache_requests_total
+    metrics_name = None
+
+    def __init__(self, cache_alias='shared'):
+        self.cache_alias = cache_alias
+        self._lock = threading.Lock()
+        self._version = None
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def current_version(self):
+        """Versão publicada no cache compartilhado (cria se não existir)."""
+        version = self.cache.get(self.version_key)
+        if version is None:
+            self.cache.add(self.version_key, uuid.uuid4().hex, timeout=None)
+            version = self.cache.get(self.version_key)
+        return version
+
+    def load(self):
+        """Recarrega os dados do banco (chamado com o lock adquirido)."""
+        raise NotImplementedError
+
+    def _ensure_fresh(self):
+        version = self.current_version()
+        if version == self._version:
+            metrics.inc('cache_requests_total', cache=self.metrics_name, result='hit')
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            self.load()
+            self._version = version
+        metrics.inc('cache_requests_total', cache=self.metrics_name, result='miss')
+
+    def invalidate(self):
+        """
+        Publica uma nova versão para todos os processos.
+
+        A versão é trocada imediatamente (este processo enxerga a
+        mudança) e de novo após o commit, para que nenhum outro worker
+        guarde uma leitura feita antes da transação terminar.
+        """
+        self._publish_version()
+        transaction.on_commit(self._publish_version)
+
+    def _publish_version(self):
+        self.cache.set(self.version_key, uuid.uuid4().hex, timeout=None)
+
+
+class ServiceCatalog(VersionedCache):
+    """
+    Cópia local do catálogo de serviços.
+
+    Consultas no caminho quente (all/first/get) não tocam o banco.
+    """
+    version_key = CATALOG_VERSION_KEY
+    metrics_name = 'service_catalog'
+
+    def __init__(self, cache_alias='shared'):
+        super().__init__(cache_alias)
+        self._services = []
+        self._by_id = {}
+        self._durations = {}
+        self._businesses = {}
+        self._prices = {}
+
+    def load(self):
+        services = list(Service.objects.all())
+        self._services = services
+        self._by_id = {service.pk: service for service in services}
+        self._durations = {service.pk: service.duration_minutes for service in services}
+        self._businesses = {service.pk: service.business_id for service in services}
+        self._prices = {service.pk: service.price_cents for service in services}
+
+    def all(self, business=None):
+        """
+        Equivalente a Service.objects.for_business(business), na ordenação
+        do model. Sem business, todos os serviços.
+        """
+        self._ensure_fresh()
+        if business is None:
+            return list(self._services)
+        return [service for service in self._services if service.business_id == business.pk]
+
+    def first(self, business=None):
+        """Equivalente a Service.objects.for_business(business).first()."""
+        services = self.all(business)
+        return services[0] if services else None
+
+    def get(self, pk, business=None):
+        """
+        Equivalente a Service.objects.for_business(business).get(pk=pk).
+        IDs inválidos, inexistentes ou de outro negócio levantam
+        Service.DoesNotExist.
+        """
+        self._ensure_fresh()
+        try:
+            service = self._by_id[int(pk)]
+        except (KeyError, TypeError, ValueError):
+            raise Service.DoesNotExist(f'Serviço {pk!r} não encontrado')
+        if business is not None and service.business_id != business.pk:
+            raise Service.DoesNotExist(f'Serviço {pk!r} não encontrado')
+        return service
+
+    def durations(self):
+        """Tabela {service_id: duration_minutes} para cálculos em lote."""
+        self._ensure_fresh()
+        return self._durations
+
+    def prices(self):
+        """Tabela {service_id: price_cents} para cálculos em lote."""
+        self._ensure_fresh()
+        return self._prices
+
+    def business_ids(self):
+        """Tabela {service_id: business_id} para cálculos em lote."""
+        self._ensure_fresh()
+        return self._businesses
+
+    def duration(self, service_id):
+        """Duração em minutos do serviço, ou None se não estiver no catálogo."""
+        return self.durations().get(service_id)
+
+
+# Instância usada pelas views (uma por processo)
+service_catalog = ServiceCatalog()
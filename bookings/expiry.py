@@ -0,0 +1,97 @@
+"""
+Expiração de agendamentos PENDENTES abandonados.
+
+Todo agendamento nasce PENDENTE e só vira CONFIRMADO quando o
+profissional age. Após PENDING_BOOKING_TTL_MINUTES sem confirmação
+(contados de updated_at, ou seja, de quando ficou PENDENTE, inclusive ao
+voltar de CONFIRMADO) um agendamento de hoje ou futuro deixa de ocupar o
+horário nas consultas de disponibilidade (Booking.objects.blocking()) e
+o comando expire_pending_bookings o cancela em lotes via
+bulk_update_status. Assim o feed .ics, a lista de espera e as
+notificações reagem como a um cancelamento normal.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Booking
+from .services import bulk_update_status
+
+
+def pending_ttl():
+    """Validade de um PENDENTE, ou None se a expiração estiver desligada"""
+    minutes = getattr(settings, 'PENDING_BOOKING_TTL_MINUTES', 0)
+    return timedelta(minutes=minutes) if minutes else None
+
+
+def stale_cutoff(now=None):
+    """PENDENTES sem alteração desde antes deste instante estão vencidos (None = nunca)"""
+    ttl = pending_ttl()
+    if ttl is None:
+        return None
+    return (now or timezone.now()) - ttl
+
+
+def stale_condition(now=None):
+    """
+    Filtro dos PENDENTES vencidos de hoje em diante (índice parcial
+    booking_pending_updated), ou None se a expiração estiver desligada.
+    Os de datas passadas ficam como estão: cancelá-los reescreveria o
+    histórico e avisaria o cliente de um cancelamento de algo que já passou.
+    """
+    now = now or timezone.now()
+    cutoff = stale_cutoff(now)
+    if cutoff is None:
+        return None
+    return Q(status='PENDING', updated_at__lt=cutoff, date__gte=timezone.localdate(now))
+
+
+def stale_pending(now=None):
+    """PENDENTES vencidos (stale_condition)"""
+    condition = stale_condition(now)
+    if condition is None:
+        return Booking.objects.none()
+    return Booking.objects.filter(condition)
+
+
+def cancel_stale(ids, now=None):
+    """
+    Cancela os `ids` que continuam vencidos. A condição é conferida de novo
+    com as linhas travadas: um agendamento confirmado (ou alterado) entre a
+    leitura dos IDs e o UPDATE não é cancelado. Retorna quantos cancelou.
+    """
+    condition = stale_condition(now)
+    if condition is None or not ids:
+        return 0
+    results = bulk_update_status(ids, 'CANCELLED', only_if=condition)
+    return sum(1 for result in results.values() if result == 'updated')
+
+
+def expire_stale_pending(batch_size=1000, now=None):
+    """
+    Cancela os PENDENTES vencidos em lotes de `batch_size` (um SELECT de
+    IDs e um UPDATE ... WHERE id IN por lote). Retorna quantos cancelou.
+    """
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        ids = list(stale_pending(now).order_by().values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return expired
+        expired += cancel_stale(ids, now)
+
+
+def release_stale_slots(service, start_time, dates):
+    """
+    Cancela os PENDENTES vencidos que ainda ocupam o horário nas `dates`.
+    A leitura já os trata como livres, mas a constraint
+    booking_unique_active_slot não: chamado quando a inserção falha.
+    Retorna quantos cancelou.
+    """
+    ids = list(
+        stale_pending().filter(service=service, start_time=start_time, date__in=list(dates))
+        .values_list('id', flat=True)
+    )
+    return cancel_stale(ids)
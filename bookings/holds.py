@@ -0,0 +1,161 @@
+"""
+Reservas temporárias (holds) de horários.
+
+Ao escolher um horário na agenda, o cliente segura o horário por
+SLOT_HOLD_TTL_SECONDS. Enquanto isso, as funções de disponibilidade em
+services.py escondem o horário dos demais clientes. Holds vencidos são
+tratados como livres na leitura, reaproveitados no próximo pedido do
+mesmo horário e apagados em lote pelo comando sweep_slot_holds.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Booking, SlotHold
+
+SESSION_OWNER_KEY = 'slot_hold_owner'
+METRICS_KEY_PREFIX = 'bookings:holds:'
+METRIC_NAMES = ['created', 'conflicted', 'converted', 'expired']
+
+
+def hold_ttl():
+    return timedelta(seconds=getattr(settings, 'SLOT_HOLD_TTL_SECONDS', 300))
+
+
+def get_hold_owner(request, create=False):
+    """Token do cliente guardado na sessão (criado sob demanda)"""
+    owner = request.session.get(SESSION_OWNER_KEY)
+    if owner is None and create:
+        owner = uuid.uuid4().hex
+        request.session[SESSION_OWNER_KEY] = owner
+    return owner
+
+
+def record(metric, amount=1):
+    """Incrementa um contador compartilhado entre os workers"""
+    if not amount:
+        return
+    cache = caches['shared']
+    key = METRICS_KEY_PREFIX + metric
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        cache.set(key, amount, timeout=None)
+
+
+def hold_metrics():
+    """Contadores e taxa de conflito (conflitos / tentativas)"""
+    cache = caches['shared']
+    values = cache.get_many([METRICS_KEY_PREFIX + name for name in METRIC_NAMES])
+    metrics = {name: values.get(METRICS_KEY_PREFIX + name, 0) for name in METRIC_NAMES}
+    attempts = metrics['created'] + metrics['conflicted']
+    metrics['conflict_rate'] = metrics['conflicted'] / attempts if attempts else 0.0
+    metrics['active'] = SlotHold.objects.filter(expires_at__gt=timezone.now()).count()
+    return metrics
+
+
+def held_times(service, date_obj, owner=None):
+    """Horários com hold ativo de outros clientes (um serviço numa data)"""
+    holds = SlotHold.objects.filter(service=service, date=date_obj, expires_at__gt=timezone.now())
+    if owner:
+        holds = holds.exclude(owner=owner)
+    return set(holds.values_list('start_time', flat=True))
+
+
+def all_held_times(date_obj, owner=None):
+    """Horários com hold ativo de outros clientes (qualquer serviço)"""
+    holds = SlotHold.objects.filter(date=date_obj, expires_at__gt=timezone.now())
+    if owner:
+        holds = holds.exclude(owner=owner)
+    return set(holds.values_list('start_time', flat=True))
+
+
+def is_held_by_other(service, date_obj, time_obj, owner=None):
+    holds = SlotHold.objects.filter(
+        service=service, date=date_obj, start_time=time_obj, expires_at__gt=timezone.now(),
+    )
+    if owner:
+        holds = holds.exclude(owner=owner)
+    return holds.exists()
+
+
+def acquire_hold(service, date_obj, time_obj, owner):
+    """
+    Segura o horário para `owner`, liberando holds anteriores do mesmo dono.
+    
+    Returns:
+        SlotHold ou None se o horário estiver agendado ou segurado por outro
+    """
+    now = timezone.now()
+    expires_at = now + hold_ttl()
+    
+    try:
+        with transaction.atomic():
+            if Booking.objects.blocking().filter(
+                service=service, date=date_obj, start_time=time_obj,
+            ).exists():
+                record('conflicted')
+                return None
+            
+            SlotHold.objects.filter(owner=owner).exclude(
+                service=service, date=date_obj, start_time=time_obj,
+            ).delete()
+            
+            hold = (
+                SlotHold.objects.select_for_update()
+                .filter(service=service, date=date_obj, start_time=time_obj)
+                .first()
+            )
+            if hold is None:
+                hold = SlotHold.objects.create(
+                    service=service, date=date_obj, start_time=time_obj,
+                    owner=owner, expires_at=expires_at,
+                )
+            elif hold.owner == owner or hold.expires_at <= now:
+                if hold.owner != owner:
+                    record('expired')  # Reaproveitando hold vencido
+                hold.owner = owner
+                hold.expires_at = expires_at
+                hold.save(update_fields=['owner', 'expires_at'])
+            else:
+                record('conflicted')
+                return None
+    except IntegrityError:
+        # Outro cliente criou o hold no mesmo instante
+        record('conflicted')
+        return None
+    
+    record('created')
+    return hold
+
+
+def release_holds(owner, converted=False):
+    """Remove os holds do dono (após confirmar o agendamento ou desistir)"""
+    if not owner:
+        return 0
+    deleted, _ = SlotHold.objects.filter(owner=owner).delete()
+    if converted:
+        record('converted', deleted)
+    return deleted
+
+
+def sweep_expired_holds(batch_size=1000):
+    """Apaga holds vencidos em lotes; retorna quantos foram removidos"""
+    total = 0
+    while True:
+        ids = list(
+            SlotHold.objects.filter(expires_at__lte=timezone.now())
+            .order_by('expires_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        deleted, _ = SlotHold.objects.filter(id__in=ids, expires_at__lte=timezone.now()).delete()
+        total += deleted
+    record('expired', total)
+    return total
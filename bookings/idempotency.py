@@ -0,0 +1,101 @@
+"""
+Chaves de idempotência do formulário de reserva.
+
+Cada formulário da agenda leva uma chave aleatória. O primeiro POST com a
+chave a reivindica inserindo uma linha em ReservationKey (chave primária:
+só um POST consegue, mesmo com vários workers) e, se criar o
+agendamento, guarda o id dele por RESERVATION_KEY_TTL_SECONDS. Reenvios
+(duplo toque, rede instável no celular) recebem o mesmo redirecionamento
+sem validar nem inserir de novo. Linhas vencidas são removidas pelo
+comando sweep_slot_holds.
+"""
+import re
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import ReservationKey
+
+FORM_FIELD = 'reservation_key'
+IN_FLIGHT = 'in-flight'
+# Segundos que a reivindicação vale enquanto o primeiro POST é processado
+IN_FLIGHT_TTL_SECONDS = 30
+
+_KEY_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def key_ttl():
+    return getattr(settings, 'RESERVATION_KEY_TTL_SECONDS', 3600)
+
+
+def new_reservation_key():
+    return uuid.uuid4().hex
+
+
+def reservation_key(request):
+    """Chave enviada com o formulário, ou None se ausente/malformada"""
+    key = request.POST.get(FORM_FIELD, '')
+    return key if _KEY_RE.match(key) else None
+
+
+def claim(key):
+    """
+    Reivindica a chave para este POST.
+
+    Retorna None se a chave é nova ou venceu (siga com a reserva),
+    IN_FLIGHT se outro POST com ela ainda está em andamento, ou o id do
+    agendamento já criado com ela.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=IN_FLIGHT_TTL_SECONDS)
+    try:
+        with transaction.atomic():
+            ReservationKey.objects.create(key=key, expires_at=expires_at)
+        return None
+    except IntegrityError:
+        pass
+    
+    row = ReservationKey.objects.filter(key=key).values_list('booking_id', 'expires_at').first()
+    if row is None:
+        # Liberada entre o INSERT e a leitura: o cliente pode reenviar
+        return IN_FLIGHT
+    booking_id, previous_expiry = row
+    if previous_expiry <= now:
+        # Vencida (POST abandonado ou TTL): só um dos concorrentes a retoma
+        taken = ReservationKey.objects.filter(key=key, expires_at=previous_expiry).update(
+            booking=None, expires_at=expires_at,
+        )
+        if taken:
+            return None
+        return IN_FLIGHT
+    return booking_id if booking_id is not None else IN_FLIGHT
+
+
+def remember(key, booking_id):
+    """Associa a chave ao agendamento criado"""
+    ReservationKey.objects.filter(key=key).update(
+        booking_id=booking_id, expires_at=timezone.now() + timedelta(seconds=key_ttl()),
+    )
+
+
+def release(key):
+    """Libera a chave após falha, para o cliente poder tentar de novo"""
+    ReservationKey.objects.filter(key=key, booking__isnull=True).delete()
+
+
+def sweep_expired_keys(batch_size=1000):
+    """Apaga chaves vencidas em lotes; retorna quantas foram removidas"""
+    total = 0
+    while True:
+        keys = list(
+            ReservationKey.objects.filter(expires_at__lte=timezone.now())
+            .order_by('expires_at')
+            .values_list('key', flat=True)[:batch_size]
+        )
+        if not keys:
+            return total
+        deleted, _ = ReservationKey.objects.filter(key__in=keys, expires_at__lte=timezone.now()).delete()
+        total += deleted
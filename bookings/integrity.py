@@ -0,0 +1,107 @@
+"""
+Verificação de integridade dos dados de agendamento.
+
+Gera um "snapshot" com contagem de linhas e checksum das colunas que
+importam, para comparar antes/depois de migrações de schema.
+"""
+import datetime
+import hashlib
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+from .models import Booking, Service
+
+BOOKING_FIELDS = (
+    'pk', 'service_id', 'customer_name', 'customer_phone', 'date',
+    'start_time', 'end_time', 'status', 'created_at',
+)
+SERVICE_FIELDS = ('pk', 'name', 'price_cents', 'duration_minutes')
+
+
+def table_checksum(queryset, fields, batch_size=5000):
+    """
+    Percorre a tabela em lotes pela chave primária (sem OFFSET) e
+    retorna {'count': n, 'checksum': sha256}.
+    """
+    digest = hashlib.sha256()
+    count = 0
+    last_pk = None
+
+    while True:
+        batch = queryset.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        rows = list(batch.values_list(*fields)[:batch_size])
+        if not rows:
+            break
+        for row in rows:
+            digest.update('|'.join(str(value) for value in row).encode())
+            digest.update(b'\n')
+        count += len(rows)
+        last_pk = rows[-1][0]
+
+    return {'count': count, 'checksum': digest.hexdigest()}
+
+
+# Horário que a linha deve ter depois da remoção de Booking.time: linhas
+# ainda no formato antigo (só `time`, start_time no default 9:00 da 0002)
+# dependem da coluna legada
+LEGACY_START_TIME_SQL = (
+    'CASE WHEN "time" IS NOT NULL AND "time" <> start_time AND start_time = %s '
+    'THEN "time" ELSE start_time END'
+)
+
+
+def data_snapshot(using='default', batch_size=5000, legacy_time=False):
+    """
+    Snapshot de Booking e Service no banco `using`. Com legacy_time=True
+    (coluna `time` ainda presente), o start_time de cada agendamento vem
+    de LEGACY_START_TIME_SQL: o snapshot só bate com o de depois da
+    remoção se nenhum horário depender da coluna legada.
+    """
+    bookings = Booking.objects.using(using)
+    fields = BOOKING_FIELDS
+    if legacy_time:
+        connection = connections[using]
+        bookings = bookings.annotate(legacy_start_time=RawSQL(
+            LEGACY_START_TIME_SQL, [connection.ops.adapt_timefield_value(datetime.time(9, 0))],
+        ))
+        fields = tuple('legacy_start_time' if field == 'start_time' else field for field in fields)
+    return {
+        'bookings': table_checksum(bookings, fields, batch_size),
+        'services': table_checksum(Service.objects.using(using), SERVICE_FIELDS, batch_size),
+    }
+
+
+def compare_snapshots(before, after):
+    """Retorna lista de divergências (vazia se os snapshots batem)"""
+    problems = []
+    for table in sorted(set(before) | set(after)):
+        old = before.get(table)
+        new = after.get(table)
+        if old is None or new is None:
+            problems.append(f'{table}: ausente em um dos snapshots')
+            continue
+        if old['count'] != new['count']:
+            problems.append(f"{table}: contagem {old['count']} -> {new['count']}")
+        elif old['checksum'] != new['checksum']:
+            problems.append(f'{table}: checksum divergente')
+    return problems
+
+
+def legacy_schema_objects(using='default'):
+    """Objetos legados (Schedule e Booking.time) ainda presentes no banco"""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+        columns = []
+        if Booking._meta.db_table in tables:
+            columns = [
+                col.name for col in
+                connection.introspection.get_table_description(cursor, Booking._meta.db_table)
+            ]
+    return {
+        'schedule_table': 'bookings_schedule' in tables,
+        'booking_time_column': 'time' in columns,
+    }
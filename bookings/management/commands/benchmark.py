@@ -0,0 +1,54 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bookings.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = 'Executa benchmarks de desempenho com dados sintéticos (desfeitos ao final)'
+
+    EXTRA_COLUMNS = [('p95_ms', 'p95 (ms)'), ('connections', 'conexões'), ('size_kb', 'KB')]
+
+    @staticmethod
+    def format_extra(value):
+        if value is None:
+            return '-'
+        return f'{value:.2f}' if isinstance(value, float) else str(value)
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS))
+        parser.add_argument('--rows', type=int, help='Quantidade de agendamentos sintéticos')
+        parser.add_argument('--keep', action='store_true', help='Manter os dados gerados no banco')
+
+    def handle(self, *args, **options):
+        func, default_rows = SCENARIOS[options['scenario']]
+        rows = options['rows'] or default_rows
+
+        # Com DEBUG=True o log de SQL de milhões de INSERTs domina o tempo
+        logging.getLogger('django.db.backends').setLevel(logging.WARNING)
+        logging.getLogger('django.template').setLevel(logging.WARNING)
+
+        self.stdout.write(f"🏁 {options['scenario']} com {rows:,} agendamentos...")
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            results = func(rows)
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        # Colunas opcionais, presentes só em alguns cenários
+        extra = [(key, title) for key, title in self.EXTRA_COLUMNS if any(key in r for r in results)]
+        self.stdout.write(
+            f'{"medição":<32} {"melhor (ms)":>12} {"mediana (ms)":>13} {"queries":>8}'
+            + ''.join(f' {title:>10}' for _, title in extra)
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result['label']:<32} {result['best_ms']:>12.2f} "
+                f"{result['median_ms']:>13.2f} {result['queries']:>8}"
+                + ''.join(f' {self.format_extra(result.get(key)):>10}' for key, _ in extra)
+            )
+        self.stdout.write(self.style.SUCCESS(f'✅ Concluído em {time.perf_counter() - started:.1f}s'))
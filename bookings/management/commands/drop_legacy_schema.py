@@ -0,0 +1,73 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, models
+
+from bookings.integrity import compare_snapshots, data_snapshot, legacy_schema_objects
+from bookings.models import Booking
+
+
+class Command(BaseCommand):
+    help = (
+        'Etapa 2 da remoção de Schedule/Booking.time: apaga a coluna e a tabela '
+        'legadas, conferindo contagens e checksums antes e depois'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--dry-run', action='store_true', help='Apenas mostrar o que seria removido')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        connection = connections[using]
+        legacy = legacy_schema_objects(using)
+
+        if not any(legacy.values()):
+            self.stdout.write('ℹ️ Nenhum objeto legado encontrado; nada a fazer')
+            return
+
+        if legacy['booking_time_column']:
+            self._check_backfill(connection)
+
+        self.stdout.write(f"Tabela bookings_schedule: {'presente' if legacy['schedule_table'] else 'ausente'}")
+        self.stdout.write(f"Coluna bookings_booking.time: {'presente' if legacy['booking_time_column'] else 'ausente'}")
+        if options['dry_run']:
+            return
+
+        # Conferências fora da transação do DDL: o DROP COLUMN segura um
+        # lock exclusivo na tabela, e varrê-la ali bloquearia o site inteiro
+        before = data_snapshot(using, legacy_time=legacy['booking_time_column'])
+
+        with connection.schema_editor() as editor:
+            if legacy['booking_time_column']:
+                field = models.TimeField(null=True)
+                field.set_attributes_from_name('time')
+                field.model = Booking
+                editor.remove_field(Booking, field)
+            if legacy['schedule_table']:
+                editor.execute(editor.sql_delete_table % {'table': editor.quote_name('bookings_schedule')})
+
+        problems = compare_snapshots(before, data_snapshot(using))
+        if problems:
+            raise CommandError(
+                'Schema legado removido, mas os dados divergem do snapshot anterior '
+                '(escritas durante a remoção também contam): ' + '; '.join(problems)
+            )
+
+        self.stdout.write(self.style.SUCCESS('✅ Schema legado removido; contagens e checksums conferem'))
+
+    def _check_backfill(self, connection):
+        """Garante que a 0005 já copiou `time` para `start_time`"""
+        table = connection.ops.quote_name(Booking._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {table} '
+                f'WHERE "time" IS NOT NULL AND "time" <> start_time AND start_time = %s',
+                [connection.ops.adapt_timefield_value(datetime.time(9, 0))],
+            )
+            pending = cursor.fetchone()[0]
+        if pending:
+            raise CommandError(
+                f'{pending} agendamentos ainda dependem de Booking.time; '
+                'rode "python manage.py migrate" antes'
+            )
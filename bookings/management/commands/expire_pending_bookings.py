@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bookings.expiry import expire_stale_pending, pending_ttl
+
+
+class Command(BaseCommand):
+    help = 'Cancela agendamentos PENDENTES não confirmados dentro de PENDING_BOOKING_TTL_MINUTES'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Repetir a cada N segundos (0 = executar uma vez)')
+
+    def handle(self, *args, **options):
+        if pending_ttl() is None:
+            self.stdout.write('⏸️ Expiração desligada (PENDING_BOOKING_TTL_MINUTES=0)')
+            return
+        while True:
+            expired = expire_stale_pending(options['batch_size'])
+            self.stdout.write(f'⌛ {expired} agendamentos pendentes vencidos cancelados')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -1,8 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
-from django.utils import timezone
-from bookings.models import Service, Schedule
-from datetime import datetime, timedelta, time
+from bookings.models import Service
 
 
 class Command(BaseCommand):
@@ -40,32 +38,7 @@ class Command(BaseCommand):
         else:
             self.stdout.write('- Usuário admin já existe')
 
-        # Criar alguns slots de exemplo para os próximos 7 dias
-        today = timezone.now().date()
-        horarios = [
-            time(9, 0),   # 09:00
-            time(10, 0),  # 10:00
-            time(11, 0),  # 11:00
-            time(14, 0),  # 14:00
-            time(15, 0),  # 15:00
-            time(16, 0),  # 16:00
-        ]
-        
-        slots_criados = 0
-        for i in range(7):  # próximos 7 dias
-            data = today + timedelta(days=i)
-            # Pular domingo (weekday 6)
-            if data.weekday() != 6:
-                for horario in horarios:
-                    schedule, created = Schedule.objects.get_or_create(
-                        date=data,
-                        time_slot=horario,
-                        defaults={'is_available': True}
-                    )
-                    if created:
-                        slots_criados += 1
-
-        self.stdout.write(f'✓ {slots_criados} slots de horário criados')
+        # Horários são gerados dinamicamente por list_day_times() (services.py)
         self.stdout.write(
             self.style.SUCCESS(
                 'Dados iniciais carregados com sucesso!\n'
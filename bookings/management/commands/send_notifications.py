@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bookings.notifications import enqueue_reminders, get_transport, process_outbox
+
+
+class Command(BaseCommand):
+    help = 'Agenda lembretes do dia seguinte e envia a fila de notificações'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Repetir a cada N segundos (0 = executar uma vez)')
+        parser.add_argument('--no-reminders', action='store_true',
+                            help='Apenas enviar a fila, sem agendar lembretes')
+
+    def handle(self, *args, **options):
+        transport = get_transport()
+        while True:
+            if not options['no_reminders']:
+                scheduled = enqueue_reminders()
+                self.stdout.write(f"⏰ {scheduled} lembretes verificados para amanhã")
+            
+            totals = {'sent': 0, 'skipped': 0, 'retried': 0, 'failed': 0}
+            while True:
+                counts = process_outbox(options['batch_size'], transport)
+                for key, value in counts.items():
+                    totals[key] += value
+                if not any(counts.values()):
+                    break
+            self.stdout.write(
+                f"📨 enviadas: {totals['sent']} | descartadas: {totals['skipped']} | "
+                f"reagendadas: {totals['retried']} | falharam: {totals['failed']}"
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
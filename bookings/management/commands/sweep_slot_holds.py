@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bookings.holds import hold_metrics, sweep_expired_holds
+from bookings.idempotency import sweep_expired_keys
+
+
+class Command(BaseCommand):
+    help = 'Remove reservas temporárias (holds) e chaves de reserva vencidas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Repetir a cada N segundos (0 = executar uma vez)')
+
+    def handle(self, *args, **options):
+        while True:
+            removed = sweep_expired_holds(options['batch_size'])
+            keys = sweep_expired_keys(options['batch_size'])
+            metrics = hold_metrics()
+            self.stdout.write(
+                f"🧹 {removed} holds e {keys} chaves de reserva vencidos removidos | ativos: {metrics['active']} | "
+                f"conflitos: {metrics['conflicted']} ({metrics['conflict_rate']:.1%}) | "
+                f"expirados: {metrics['expired']} | convertidos: {metrics['converted']}"
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bookings.integrity import compare_snapshots, data_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Gera ou compara snapshot (contagem + checksum) de agendamentos e serviços'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--save', metavar='ARQUIVO', help='Salvar snapshot atual em JSON')
+        parser.add_argument('--compare', metavar='ARQUIVO', help='Comparar banco atual com snapshot salvo')
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        snapshot = data_snapshot(options['database'], options['batch_size'])
+
+        for table, info in snapshot.items():
+            self.stdout.write(f"{table}: {info['count']} linhas, sha256 {info['checksum'][:16]}…")
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(snapshot, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"✅ Snapshot salvo em {options['save']}"))
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                before = json.load(f)
+            problems = compare_snapshots(before, snapshot)
+            if problems:
+                raise CommandError('Snapshot divergente: ' + '; '.join(problems))
+            self.stdout.write(self.style.SUCCESS('✅ Contagens e checksums conferem'))
@@ -0,0 +1,332 @@
+"""
+Métricas no formato de exposição do Prometheus.
+
+Cada processo (worker do gunicorn) acumula contadores e histogramas em
+memória, sem I/O no caminho quente, e a cada METRICS_FLUSH_SECONDS grava
+um instantâneo em METRICS_DIR (um arquivo JSON por processo, trocado
+atomicamente). O endpoint /metrics soma os arquivos de todos os
+processos. Para que os contadores nunca diminuam sem que os arquivos se
+acumulem a cada reinício de worker, o processo que termina funde o seu
+instantâneo em total.json e apaga o próprio arquivo; arquivos de
+processos mortos sem passar pelo atexit (SIGKILL) são fundidos na
+próxima coleta.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+# Limites dos histogramas de latência (segundos), os padrões do Prometheus
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Nome -> (tipo, descrição)
+METRICS = {
+    'bookings_created_total': ('counter', 'Agendamentos criados'),
+    'bookings_conflicted_total': ('counter', 'Reservas recusadas por horário já ocupado'),
+    'bookings_cancelled_total': ('counter', 'Agendamentos cancelados'),
+    'http_request_duration_seconds': ('histogram', 'Latência das requisições por rota'),
+    'db_queries_total': ('counter', 'Queries executadas por rota'),
+    'cache_requests_total': ('counter', 'Consultas a caches de leitura (hit/miss)'),
+}
+
+# Soma acumulada dos processos que já terminaram
+TOTAL_FILE = 'total.json'
+LOCK_FILE = '.lock'
+
+
+def metrics_dir():
+    return Path(getattr(settings, 'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'agendamento-metrics')))
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+def dump_snapshot(counters, histograms):
+    """Contadores e histogramas no formato JSON dos arquivos de METRICS_DIR"""
+    return {
+        'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [
+            [name, list(labels), list(buckets), total, count]
+            for (name, labels), (buckets, total, count) in histograms.items()
+        ],
+    }
+
+
+class MetricsRegistry:
+    """Contadores e histogramas deste processo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._flushed_at = time.monotonic()
+        # pid + token: um worker novo com o mesmo pid não apaga o antigo
+        self.process_id = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+    def inc(self, name, amount=1, **labels):
+        if not metrics_enabled():
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        self.maybe_flush()
+
+    def observe(self, name, value, **labels):
+        """Registra `value` no histograma (contagens por faixa, soma e total)"""
+        if not metrics_enabled():
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+            buckets = histogram[0]
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    buckets[index] += 1
+                    break
+            else:
+                buckets[-1] += 1
+            histogram[1] += value
+            histogram[2] += 1
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self._lock:
+            return dump_snapshot(self._counters, self._histograms)
+
+    def maybe_flush(self):
+        interval = getattr(settings, 'METRICS_FLUSH_SECONDS', 5)
+        if time.monotonic() - self._flushed_at >= interval:
+            self.flush()
+
+    def flush(self):
+        """Grava o instantâneo deste processo (escrita atômica)"""
+        self._flushed_at = time.monotonic()
+        directory = metrics_dir()
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / f'{self.process_id}.json'
+            tmp_path = path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps(self.snapshot()))
+            os.replace(tmp_path, path)
+        except OSError:
+            # Métricas nunca derrubam uma requisição
+            pass
+
+    def close(self):
+        """Fim do processo: funde o instantâneo em total.json e apaga o arquivo"""
+        self.flush()
+        directory = metrics_dir()
+        try:
+            with directory_lock(directory):
+                fold_into_total(directory, [directory / f'{self.process_id}.json'])
+        except OSError:
+            pass
+
+    def reset(self):
+        """Zera este processo (testes)"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+# Instância usada pelo código (uma por processo)
+registry = MetricsRegistry()
+atexit.register(registry.close)
+
+
+def inc(name, amount=1, **labels):
+    registry.inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+
+@contextmanager
+def directory_lock(directory):
+    """Trava exclusiva do diretório (fusões em total.json e leituras do /metrics)"""
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / LOCK_FILE, 'a') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def read_snapshot(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def add_snapshot(counters, histograms, data):
+    """Soma um instantâneo nos dicionários de contadores e histogramas"""
+    for name, labels, value in data.get('counters', []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, buckets, total, count in data.get('histograms', []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        current = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+        current[0] = [a + b for a, b in zip(current[0], buckets)]
+        current[1] += total
+        current[2] += count
+
+
+def fold_into_total(directory, paths):
+    """
+    Soma os instantâneos de `paths` em total.json (escrita atômica) e
+    apaga os arquivos. Chamar com directory_lock.
+    """
+    snapshots = [(path, read_snapshot(path)) for path in paths if path.exists()]
+    if not snapshots:
+        return
+    counters, histograms = {}, {}
+    for data in [read_snapshot(directory / TOTAL_FILE)] + [data for _, data in snapshots]:
+        if data:
+            add_snapshot(counters, histograms, data)
+    total_path = directory / TOTAL_FILE
+    tmp_path = total_path.with_suffix('.tmp')
+    tmp_path.write_text(json.dumps(dump_snapshot(counters, histograms)))
+    os.replace(tmp_path, total_path)
+    for path, _ in snapshots:
+        path.unlink(missing_ok=True)
+
+
+def process_alive(path):
+    """
+    False se o arquivo é de um processo que já não existe. Nomes fora do
+    padrão <pid>-<token> e pids de outro usuário contam como vivos.
+    """
+    try:
+        pid = int(path.stem.split('-', 1)[0])
+    except ValueError:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def collect():
+    """
+    Soma total.json e os instantâneos dos processos vivos; os de
+    processos mortos são fundidos em total.json antes
+    """
+    registry.flush()
+    directory = metrics_dir()
+    counters = {}
+    histograms = {}
+    try:
+        with directory_lock(directory):
+            paths = [path for path in sorted(directory.glob('*.json')) if path.name != TOTAL_FILE]
+            fold_into_total(directory, [path for path in paths if not process_alive(path)])
+            for path in [directory / TOTAL_FILE] + paths:
+                data = read_snapshot(path)
+                if data:
+                    add_snapshot(counters, histograms, data)
+    except OSError:
+        pass
+    return counters, histograms
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label_value(value)}"' for key, value in pairs) + '}'
+
+
+def format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render_metrics(extra_counters=None):
+    """
+    Texto no formato de exposição do Prometheus (0.0.4).
+    `extra_counters`: {nome: (descrição, valor)} de contadores mantidos
+    fora do registro (ex.: holds no cache compartilhado).
+    """
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {format_number(value)}')
+        else:
+            for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+                    cumulative += bucket
+                    lines.append(f'{name}_bucket{format_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {format_number(total)}')
+                lines.append(f'{name}_count{format_labels(labels)} {count}')
+    for name, (description, value) in (extra_counters or {}).items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} counter')
+        lines.append(f'{name} {format_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """Latência e nº de queries por rota (nome da URL)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from contextlib import ExitStack
+        from django.db import connections
+
+        if not metrics_enabled():
+            return self.get_response(request)
+
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match is not None else 'unmatched'
+        observe('http_request_duration_seconds', time.perf_counter() - started, route=route)
+        if queries[0]:
+            inc('db_queries_total', queries[0], route=route)
+        return response
@@ -108,4 +108,80 @@ class AutoMigrateMiddleware:
         except Exception as e:
             print(f"❌ Erro no setup automático: {e}")
         finally:
-            _migrations_running = False
\ No newline at end of file
+            _migrations_running = False
+
+
+class TenantMiddleware:
+    """
+    Define request.business (ver bookings.tenants).
+    O link /n/<slug>/<caminho> escolhe o negócio e redireciona para
+    <caminho>, que passa a ser resolvido pela sessão.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from django.http import Http404, HttpResponseRedirect
+        from .tenants import SESSION_BUSINESS_KEY, resolve_business, split_tenant_path, tenant_directory
+        
+        slug, rest = split_tenant_path(request.path_info)
+        if slug is not None:
+            if tenant_directory.for_slug(slug) is None:
+                raise Http404('Estabelecimento não encontrado')
+            request.session[SESSION_BUSINESS_KEY] = slug
+            query = request.META.get('QUERY_STRING')
+            return HttpResponseRedirect(rest + (f'?{query}' if query else ''))
+        
+        request.business = resolve_business(request)
+        return self.get_response(request)
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Depois de gravar um agendamento, prende o navegador ao banco primário
+    por REPLICA_STICKY_SECONDS (ver bookings.routers).
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from .routers import PRIMARY_COOKIE_NAME, replica_configured, sticky_seconds, track_booking_writes
+        
+        if not replica_configured():
+            return self.get_response(request)
+        
+        with track_booking_writes() as writes:
+            response = self.get_response(request)
+        if writes:
+            response.set_cookie(PRIMARY_COOKIE_NAME, '1', max_age=sticky_seconds(), httponly=True, samesite='Lax')
+        return response
+
+
+class RateLimitMiddleware:
+    """
+    Limite de requisições por IP e telefone nas rotas de RATE_LIMITS
+    (ver bookings.ratelimit). Excedido, responde 429 com Retry-After.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        from django.conf import settings
+        from .ratelimit import client_ip, rate_limiter, request_phone
+        
+        if not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+            return None
+        route = request.resolver_match.view_name
+        if route not in getattr(settings, 'RATE_LIMITS', {}):
+            return None
+        
+        retry_after = rate_limiter.check(route, client_ip(request), request_phone(request))
+        if not retry_after:
+            return None
+        response = HttpResponse('Muitas requisições. Tente novamente em instantes.',
+                                status=429, content_type='text/plain; charset=utf-8')
+        response['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+        return response
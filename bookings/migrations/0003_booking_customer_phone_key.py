@@ -0,0 +1,87 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0002_booking_end_time_booking_start_time_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='booking',
+            options={'ordering': ['-created_at'], 'verbose_name': 'Agendamento', 'verbose_name_plural': 'Agendamentos'},
+        ),
+        migrations.AlterModelOptions(
+            name='service',
+            options={'ordering': ['name'], 'verbose_name': 'Serviço', 'verbose_name_plural': 'Serviços'},
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='customer_phone_key',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Telefone canônico para buscas (calculado automaticamente)', max_length=20, verbose_name='Chave do Telefone'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Criado em'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='customer_name',
+            field=models.CharField(max_length=200, verbose_name='Nome do Cliente'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='customer_phone',
+            field=models.CharField(help_text='Apenas dígitos', max_length=20, verbose_name='Telefone'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='date',
+            field=models.DateField(verbose_name='Data'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='end_time',
+            field=models.TimeField(blank=True, help_text='Horário de fim (calculado automaticamente)', null=True, verbose_name='Horário de Fim'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='service',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bookings.service', verbose_name='Serviço'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='start_time',
+            field=models.TimeField(default='09:00:00', help_text='Horário de início', verbose_name='Horário de Início'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pendente'), ('CONFIRMED', 'Confirmado'), ('CANCELLED', 'Cancelado')], default='PENDING', max_length=20, verbose_name='Status'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='time',
+            field=models.TimeField(blank=True, help_text='DEPRECATED: use start_time', null=True, verbose_name='Horário (Antigo)'),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='duration_minutes',
+            field=models.IntegerField(default=60, help_text='Duração em minutos', verbose_name='Duração (minutos)'),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='name',
+            field=models.CharField(max_length=100, verbose_name='Nome do Serviço'),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='price_cents',
+            field=models.IntegerField(help_text='Preço em centavos', verbose_name='Preço (centavos)'),
+        ),
+    ]
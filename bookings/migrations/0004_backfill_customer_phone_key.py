@@ -0,0 +1,62 @@
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def canonical_phone(phone_str):
+    """
+    Cópia de bookings.utils.canonical_phone como era nesta migração: o
+    backfill tem de dar o mesmo resultado mesmo se a função mudar depois.
+    """
+    digits = ''.join(filter(str.isdigit, phone_str or ''))
+    if len(digits) in (12, 13) and digits.startswith('55'):
+        digits = digits[2:]
+    if len(digits) in (11, 12) and digits.startswith('0'):
+        digits = digits[1:]
+    if len(digits) == 11 and digits[2] == '9':
+        digits = digits[:2] + digits[3:]
+    return digits
+
+
+def backfill_customer_phone_key(apps, schema_editor):
+    """Preenche customer_phone_key em lotes, percorrendo a chave primária"""
+    Booking = apps.get_model('bookings', 'Booking')
+    last_pk = 0
+
+    while True:
+        batch = list(
+            Booking.objects.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .only('pk', 'customer_phone', 'customer_phone_key')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+
+        changed = []
+        for booking in batch:
+            key = canonical_phone(booking.customer_phone)
+            if booking.customer_phone_key != key:
+                booking.customer_phone_key = key
+                changed.append(booking)
+
+        Booking.objects.bulk_update(changed, ['customer_phone_key'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    # Cada lote é confirmado separadamente, sem uma transação gigante
+    atomic = False
+
+    dependencies = [
+        ('bookings', '0003_booking_customer_phone_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_customer_phone_key, migrations.RunPython.noop),
+        # Índice criado depois do backfill (mais barato que mantê-lo durante as escritas)
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['customer_phone_key', 'status', 'date'], name='booking_phone_status_date'),
+        ),
+    ]
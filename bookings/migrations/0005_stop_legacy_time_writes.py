@@ -0,0 +1,72 @@
+"""
+Etapa 1 da remoção de Schedule e Booking.time (sem downtime).
+
+- Copia `time` para `start_time` nas linhas antigas (anteriores à 0002),
+  em lotes pela chave primária.
+- Remove Schedule e Booking.time apenas do *estado* do Django: o código
+  deixa de ler/escrever esses campos, mas a coluna (nula) e a tabela
+  continuam no banco enquanto workers antigos ainda estão no ar.
+
+A remoção física é a etapa 2: `python manage.py drop_legacy_schema`,
+executada depois que o deploy com este código estiver completo.
+"""
+import datetime
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+# Default de start_time aplicado pela 0002 nas linhas que só tinham `time`
+LEGACY_START_TIME = datetime.time(9, 0)
+
+
+def backfill_start_time(apps, schema_editor):
+    Booking = apps.get_model('bookings', 'Booking')
+    last_pk = 0
+
+    while True:
+        batch = list(
+            Booking.objects.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .select_related('service')
+            .only('pk', 'time', 'start_time', 'end_time', 'service__duration_minutes')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+
+        changed = []
+        for booking in batch:
+            legacy = (
+                booking.time is not None
+                and booking.start_time == LEGACY_START_TIME
+                and booking.time != booking.start_time
+            )
+            if legacy:
+                booking.start_time = booking.time
+                start = datetime.datetime.combine(datetime.date.min, booking.start_time)
+                end = start + datetime.timedelta(minutes=booking.service.duration_minutes)
+                booking.end_time = end.time()
+                changed.append(booking)
+
+        Booking.objects.bulk_update(changed, ['start_time', 'end_time'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('bookings', '0004_backfill_customer_phone_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_start_time, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveField(model_name='booking', name='time'),
+                migrations.DeleteModel(name='Schedule'),
+            ],
+            database_operations=[],
+        ),
+    ]
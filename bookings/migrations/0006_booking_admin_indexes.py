@@ -0,0 +1,51 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:58
+
+from django.db import migrations, models
+
+# Índices específicos do PostgreSQL para a busca do admin:
+# - trigram em UPPER(customer_name) atende icontains (LIKE '%termo%')
+# - varchar_pattern_ops atende prefixo do telefone (LIKE 'termo%')
+POSTGRES_SEARCH_INDEXES = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS booking_name_trgm ON bookings_booking '
+    'USING gin (UPPER(customer_name::text) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS booking_phone_key_prefix ON bookings_booking '
+    '(customer_phone_key varchar_pattern_ops)',
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in POSTGRES_SEARCH_INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS booking_name_trgm')
+    schema_editor.execute('DROP INDEX IF EXISTS booking_phone_key_prefix')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_stop_legacy_time_writes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['date', 'status'], name='booking_date_status'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'date'], name='booking_status_date'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['-created_at'], name='booking_created_desc'),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
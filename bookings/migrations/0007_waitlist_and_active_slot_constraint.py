@@ -0,0 +1,57 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0006_booking_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Data')),
+                ('start_time', models.TimeField(verbose_name='Horário')),
+                ('customer_name', models.CharField(max_length=200, verbose_name='Nome do Cliente')),
+                ('customer_phone', models.CharField(help_text='Apenas dígitos', max_length=20, verbose_name='Telefone')),
+                ('status', models.CharField(choices=[('WAITING', 'Aguardando'), ('PROMOTED', 'Promovido'), ('CANCELLED', 'Cancelado')], default='WAITING', max_length=20, verbose_name='Status')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Entrou em')),
+            ],
+            options={
+                'verbose_name': 'Lista de espera',
+                'verbose_name_plural': 'Lista de espera',
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='booking',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['PENDING', 'CONFIRMED'])), fields=('service', 'date', 'start_time'), name='booking_unique_active_slot'),
+        ),
+        migrations.AddField(
+            model_name='waitlistentry',
+            name='booking',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='waitlist_entry', to='bookings.booking', verbose_name='Agendamento gerado'),
+        ),
+        migrations.AddField(
+            model_name='waitlistentry',
+            name='service',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bookings.service', verbose_name='Serviço'),
+        ),
+        migrations.AddIndex(
+            model_name='waitlistentry',
+            index=models.Index(fields=['service', 'date', 'start_time', 'status', 'created_at'], name='waitlist_slot_queue'),
+        ),
+        migrations.AddConstraint(
+            model_name='waitlistentry',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'WAITING')), fields=('service', 'date', 'start_time', 'customer_phone'), name='waitlist_unique_waiting_phone'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0007_waitlist_and_active_slot_constraint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Data')),
+                ('start_time', models.TimeField(verbose_name='Horário')),
+                ('owner', models.CharField(help_text='Token da sessão do cliente', max_length=64, verbose_name='Dono')),
+                ('expires_at', models.DateTimeField(verbose_name='Expira em')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bookings.service', verbose_name='Serviço')),
+            ],
+            options={
+                'verbose_name': 'Reserva temporária',
+                'verbose_name_plural': 'Reservas temporárias',
+                'indexes': [models.Index(fields=['owner'], name='slothold_owner'), models.Index(fields=['expires_at'], name='slothold_expires')],
+                'constraints': [models.UniqueConstraint(fields=('service', 'date', 'start_time'), name='slothold_unique_slot')],
+            },
+        ),
+    ]
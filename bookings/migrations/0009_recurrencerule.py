@@ -0,0 +1,39 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0008_slothold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurrenceRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer_name', models.CharField(max_length=200, verbose_name='Nome do Cliente')),
+                ('customer_phone', models.CharField(help_text='Apenas dígitos', max_length=20, verbose_name='Telefone')),
+                ('start_date', models.DateField(verbose_name='Primeira data')),
+                ('start_time', models.TimeField(verbose_name='Horário')),
+                ('frequency', models.CharField(choices=[('WEEKLY', 'Semanal'), ('BIWEEKLY', 'Quinzenal'), ('MONTHLY', 'Mensal')], default='WEEKLY', max_length=10, verbose_name='Frequência')),
+                ('until', models.DateField(blank=True, help_text='Última data (opcional)', null=True, verbose_name='Até')),
+                ('count', models.PositiveIntegerField(blank=True, help_text='Número de ocorrências (opcional)', null=True, verbose_name='Ocorrências')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bookings.service', verbose_name='Serviço')),
+            ],
+            options={
+                'verbose_name': 'Recorrência',
+                'verbose_name_plural': 'Recorrências',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='recurrence',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bookings', to='bookings.recurrencerule', verbose_name='Recorrência'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0009_recurrencerule'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # No banco, updated_at é uma coluna nula sem default: ADD COLUMN
+        # simples, sem reescrever a tabela (no SQLite, reescrever perderia
+        # a coluna legada "time"). Linhas antigas usam created_at no feed.
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.AddField(
+                    model_name='booking',
+                    name='updated_at',
+                    field=models.DateTimeField(null=True, verbose_name='Atualizado em'),
+                ),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='booking',
+                    name='updated_at',
+                    field=models.DateTimeField(auto_now=True, null=True, verbose_name='Atualizado em'),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CalendarFeedToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64, unique=True, verbose_name='Token')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_feed_token', to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Token do calendário',
+                'verbose_name_plural': 'Tokens do calendário',
+            },
+        ),
+    ]
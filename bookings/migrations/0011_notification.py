@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0010_calendar_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('CONFIRMATION', 'Agendamento recebido'), ('STATUS', 'Mudança de status'), ('REMINDER', 'Lembrete')], max_length=20, verbose_name='Tipo')),
+                ('recipient', models.CharField(help_text='Telefone (apenas dígitos)', max_length=20, verbose_name='Destinatário')),
+                ('message', models.TextField(verbose_name='Mensagem')),
+                ('dedup_key', models.CharField(max_length=100, unique=True, verbose_name='Chave de deduplicação')),
+                ('status', models.CharField(choices=[('PENDING', 'Pendente'), ('SENT', 'Enviada'), ('SKIPPED', 'Descartada'), ('FAILED', 'Falhou')], default='PENDING', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Tentativas')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próxima tentativa')),
+                ('last_error', models.TextField(blank=True, verbose_name='Último erro')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Enviada em')),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='bookings.booking', verbose_name='Agendamento')),
+            ],
+            options={
+                'verbose_name': 'Notificação',
+                'verbose_name_plural': 'Notificações',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='notification_due')],
+            },
+        ),
+    ]
@@ -0,0 +1,125 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def backfill_business(apps, schema_editor):
+    """
+    Instalações com dados viram o primeiro negócio ("principal"):
+    serviços, agendamentos (em lotes pela chave primária) e usuários
+    da equipe passam a pertencer a ele. Banco vazio continua no modo de
+    negócio único, sem Business cadastrado.
+    """
+    Business = apps.get_model('bookings', 'Business')
+    Service = apps.get_model('bookings', 'Service')
+    Booking = apps.get_model('bookings', 'Booking')
+    CalendarFeedToken = apps.get_model('bookings', 'CalendarFeedToken')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+
+    if not Service.objects.exists() or Business.objects.exists():
+        return
+
+    business = Business.objects.create(
+        name='Meu Salão',
+        slug='principal',
+        whatsapp_number=getattr(settings, 'WHATSAPP_BUSINESS_NUMBER', ''),
+    )
+    business.users.set(User.objects.filter(is_staff=True))
+    Service.objects.update(business=business)
+    CalendarFeedToken.objects.update(business=business)
+
+    last_pk = 0
+    while True:
+        pks = list(
+            Booking.objects.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:BATCH_SIZE]
+        )
+        if not pks:
+            break
+        Booking.objects.filter(pk__in=pks).update(business=business)
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+
+    # Cada lote do backfill é confirmado separadamente
+    atomic = False
+
+    dependencies = [
+        ('bookings', '0011_notification'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Business',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Nome')),
+                ('slug', models.SlugField(max_length=60, unique=True, verbose_name='Identificador')),
+                ('host', models.CharField(blank=True, help_text='Domínio próprio (ex: salao.com.br)', max_length=255, null=True, unique=True, verbose_name='Domínio')),
+                ('description', models.TextField(blank=True, verbose_name='Descrição')),
+                ('phone', models.CharField(blank=True, max_length=20, verbose_name='Telefone')),
+                ('whatsapp_number', models.CharField(blank=True, help_text='Com código do país (ex: 5511999999999)', max_length=20, verbose_name='WhatsApp')),
+                ('address', models.CharField(blank=True, max_length=255, verbose_name='Endereço')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+            ],
+            options={
+                'verbose_name': 'Estabelecimento',
+                'verbose_name_plural': 'Estabelecimentos',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='business',
+            name='users',
+            field=models.ManyToManyField(blank=True, related_name='businesses', to=settings.AUTH_USER_MODEL, verbose_name='Profissionais'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='business',
+            field=models.ForeignKey(blank=True, editable=False, help_text='Copiado do serviço (calculado automaticamente)', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bookings', to='bookings.business', verbose_name='Estabelecimento'),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='business',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='services', to='bookings.business', verbose_name='Estabelecimento'),
+        ),
+        migrations.AddField(
+            model_name='calendarfeedtoken',
+            name='business',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='bookings.business', verbose_name='Estabelecimento'),
+        ),
+        migrations.AlterField(
+            model_name='calendarfeedtoken',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_feed_tokens', to=settings.AUTH_USER_MODEL, verbose_name='Usuário'),
+        ),
+        migrations.AddConstraint(
+            model_name='calendarfeedtoken',
+            constraint=models.UniqueConstraint(fields=('user', 'business'), name='calendarfeedtoken_user_business'),
+        ),
+        migrations.RunPython(backfill_business, migrations.RunPython.noop),
+        # Índices por negócio (negócio na frente). Os antigos ficam: admin do
+        # Django, lembretes e o modo de negócio único consultam sem filtrar
+        # por negócio
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['business', 'customer_phone_key', 'status', 'date'], name='booking_biz_phone_status'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['business', 'date', 'status'], name='booking_biz_date_status'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['business', 'status', 'date'], name='booking_biz_status_date'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['business', '-created_at'], name='booking_biz_created_desc'),
+        ),
+    ]
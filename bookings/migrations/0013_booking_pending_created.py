@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0012_business'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['created_at'], name='booking_pending_created'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 1000
+
+
+def backfill_price_snapshot(apps, schema_editor):
+    """
+    Agendamentos existentes recebem o preço e a duração atuais do serviço
+    (melhor aproximação disponível), em lotes pela chave primária.
+    """
+    Service = apps.get_model('bookings', 'Service')
+    Booking = apps.get_model('bookings', 'Booking')
+
+    service = Service.objects.filter(pk=OuterRef('service_id'))
+    last_pk = 0
+    while True:
+        pks = list(
+            Booking.objects.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:BATCH_SIZE]
+        )
+        if not pks:
+            break
+        Booking.objects.filter(pk__in=pks).update(
+            price_cents=Subquery(service.values('price_cents')[:1]),
+            duration_minutes=Subquery(service.values('duration_minutes')[:1]),
+        )
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+
+    # Cada lote do backfill é confirmado separadamente
+    atomic = False
+
+    dependencies = [
+        ('bookings', '0013_booking_pending_created'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='price_cents',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Preço do serviço ao agendar (calculado automaticamente)', null=True, verbose_name='Preço (centavos)'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='duration_minutes',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Duração do serviço ao agendar (calculado automaticamente)', null=True, verbose_name='Duração (minutos)'),
+        ),
+        migrations.RunPython(backfill_price_snapshot, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations, models
+from django.db.models import F
+
+BATCH_SIZE = 1000
+
+
+def backfill_updated_at(apps, schema_editor):
+    """
+    Agendamentos anteriores à 0010 não têm updated_at: usa created_at, em
+    lotes pela chave primária. A validade dos PENDENTES passa a contar dele.
+    """
+    Booking = apps.get_model('bookings', 'Booking')
+    last_pk = 0
+    while True:
+        pks = list(
+            Booking.objects.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:BATCH_SIZE]
+        )
+        if not pks:
+            break
+        Booking.objects.filter(pk__in=pks, updated_at__isnull=True).update(updated_at=F('created_at'))
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+
+    # Cada lote do backfill é confirmado separadamente
+    atomic = False
+
+    dependencies = [
+        ('bookings', '0014_booking_price_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        # Índice novo antes de remover o antigo: a varredura continua indexada
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['updated_at'], name='booking_pending_updated'),
+        ),
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='booking_pending_created',
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-19 18:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0015_booking_pending_since'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservationKey',
+            fields=[
+                ('key', models.CharField(max_length=32, primary_key=True, serialize=False, verbose_name='Chave')),
+                ('expires_at', models.DateTimeField(verbose_name='Expira em')),
+                ('booking', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bookings.booking', verbose_name='Agendamento')),
+            ],
+            options={
+                'verbose_name': 'Chave de reserva',
+                'verbose_name_plural': 'Chaves de reserva',
+                'indexes': [models.Index(fields=['expires_at'], name='reservationkey_expires')],
+            },
+        ),
+    ]
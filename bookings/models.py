@@ -1,14 +1,51 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 
 
+class Business(models.Model):
+    """
+    Estabelecimento (tenant). Uma instalação atende vários negócios,
+    identificados pelo domínio (host) ou pelo link /n/<slug>/.
+    Sem nenhum Business cadastrado, o sistema funciona como antes
+    (um único negócio, sem filtro).
+    """
+    name = models.CharField(max_length=200, verbose_name="Nome")
+    slug = models.SlugField(max_length=60, unique=True, verbose_name="Identificador")
+    host = models.CharField(max_length=255, unique=True, null=True, blank=True, help_text="Domínio próprio (ex: salao.com.br)", verbose_name="Domínio")
+    description = models.TextField(blank=True, verbose_name="Descrição")
+    phone = models.CharField(max_length=20, blank=True, verbose_name="Telefone")
+    whatsapp_number = models.CharField(max_length=20, blank=True, help_text="Com código do país (ex: 5511999999999)", verbose_name="WhatsApp")
+    address = models.CharField(max_length=255, blank=True, verbose_name="Endereço")
+    users = models.ManyToManyField(User, blank=True, related_name='businesses', verbose_name="Profissionais")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+    
+    class Meta:
+        verbose_name = "Estabelecimento"
+        verbose_name_plural = "Estabelecimentos"
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+
+
+class TenantQuerySet(models.QuerySet):
+    def for_business(self, business):
+        """Filtra pelo negócio; None (modo de negócio único) não filtra"""
+        if business is None:
+            return self
+        return self.filter(business=business)
+
+
 class Service(models.Model):
     """Serviços fixos: Serviço 1, 2 e 3"""
+    business = models.ForeignKey(Business, null=True, blank=True, on_delete=models.CASCADE, related_name='services', verbose_name="Estabelecimento")
     name = models.CharField(max_length=100, verbose_name="Nome do Serviço")
     price_cents = models.IntegerField(help_text="Preço em centavos", verbose_name="Preço (centavos)")
     duration_minutes = models.IntegerField(default=60, help_text="Duração em minutos", verbose_name="Duração (minutos)")
     
+    objects = TenantQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Serviço"
         verbose_name_plural = "Serviços"
@@ -22,27 +59,65 @@ class Service(models.Model):
         return self.price_cents / 100
 
 
-class Schedule(models.Model):
-    """
-    DEPRECATED: Slots de horários disponíveis definidos pelo admin.
-    
-    Este model não é mais usado no MVP atual. Os horários são gerados
-    dinamicamente pela função list_day_times() em services.py baseada
-    em settings.DEFAULT_DAILY_TIMES.
+class RecurrenceRule(models.Model):
+    """Regra de agendamento recorrente (cliente fixo)"""
+    FREQUENCY_CHOICES = [
+        ('WEEKLY', 'Semanal'),
+        ('BIWEEKLY', 'Quinzenal'),
+        ('MONTHLY', 'Mensal'),
+    ]
     
-    Mantido apenas para compatibilidade com dados existentes.
-    Em futuras versões, este model pode ser removido completamente.
-    """
-    date = models.DateField()
-    time_slot = models.TimeField()
-    is_available = models.BooleanField(default=True)
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, verbose_name="Serviço")
+    customer_name = models.CharField(max_length=200, verbose_name="Nome do Cliente")
+    customer_phone = models.CharField(max_length=20, help_text="Apenas dígitos", verbose_name="Telefone")
+    start_date = models.DateField(verbose_name="Primeira data")
+    start_time = models.TimeField(verbose_name="Horário")
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default='WEEKLY', verbose_name="Frequência")
+    until = models.DateField(null=True, blank=True, help_text="Última data (opcional)", verbose_name="Até")
+    count = models.PositiveIntegerField(null=True, blank=True, help_text="Número de ocorrências (opcional)", verbose_name="Ocorrências")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
     
     class Meta:
-        unique_together = ['date', 'time_slot']
-        ordering = ['date', 'time_slot']
+        verbose_name = "Recorrência"
+        verbose_name_plural = "Recorrências"
+        ordering = ['-created_at']
     
     def __str__(self):
-        return f"[DEPRECATED] {self.date} às {self.time_slot}"
+        return f"{self.customer_name} - {self.service.name} ({self.get_frequency_display()}) às {self.start_time}"
+
+
+class BookingQuerySet(TenantQuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Calcula end_time/chave do telefone em lote antes de inserir e grava
+        as confirmações na outbox na mesma transação (bulk_create não
+        dispara post_save). Linhas ignoradas por conflito ficam sem pk e
+        sem mensagem.
+        """
+        from .calendar_feed import invalidate_days
+        from .metrics import inc
+        from .notifications import enqueue
+        from .services import fill_booking_fields
+        objs = fill_booking_fields(list(objs))
+        with transaction.atomic(using=self.db, savepoint=False):
+            created = super().bulk_create(objs, *args, **kwargs)
+            enqueue([booking for booking in created if booking.pk is not None], 'CONFIRMATION')
+        invalidate_days(booking.date for booking in objs)
+        inc('bookings_created_total', len(created))
+        return created
+
+    def blocking(self, now=None):
+        """
+        Agendamentos que ocupam o horário: ativos, exceto PENDENTES vencidos
+        (PENDING_BOOKING_TTL_MINUTES) que o expire_pending_bookings ainda
+        não cancelou. Mantém status IN (...) para usar os índices parciais.
+        """
+        from .expiry import stale_cutoff
+        queryset = self.filter(status__in=self.model.ACTIVE_STATUSES)
+        cutoff = stale_cutoff(now)
+        if cutoff is not None:
+            queryset = queryset.exclude(status='PENDING', updated_at__lt=cutoff)
+        return queryset
 
 
 class Booking(models.Model):
@@ -53,46 +128,279 @@ class Booking(models.Model):
         ('CANCELLED', 'Cancelado'),
     ]
     
+    # Transições permitidas (mesmas ações oferecidas na agenda do profissional)
+    STATUS_TRANSITIONS = {
+        'PENDING': {'CONFIRMED', 'CANCELLED'},
+        'CONFIRMED': {'PENDING', 'CANCELLED'},
+        'CANCELLED': {'CONFIRMED'},
+    }
+    
+    # Status que ocupam o horário
+    ACTIVE_STATUSES = ['PENDING', 'CONFIRMED']
+    
+    business = models.ForeignKey(Business, null=True, blank=True, editable=False, on_delete=models.CASCADE, related_name='bookings', help_text="Copiado do serviço (calculado automaticamente)", verbose_name="Estabelecimento")
     service = models.ForeignKey(Service, on_delete=models.CASCADE, verbose_name="Serviço")
     customer_name = models.CharField(max_length=200, verbose_name="Nome do Cliente")
     customer_phone = models.CharField(max_length=20, help_text="Apenas dígitos", verbose_name="Telefone")
+    customer_phone_key = models.CharField(max_length=20, blank=True, default='', editable=False, help_text="Telefone canônico para buscas (calculado automaticamente)", verbose_name="Chave do Telefone")
     date = models.DateField(verbose_name="Data")
     start_time = models.TimeField(default='09:00:00', help_text="Horário de início", verbose_name="Horário de Início")
     end_time = models.TimeField(null=True, blank=True, help_text="Horário de fim (calculado automaticamente)", verbose_name="Horário de Fim")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING', verbose_name="Status")
+    # Preço e duração do serviço no momento do agendamento: mudar o serviço
+    # depois não reescreve o faturamento histórico
+    price_cents = models.PositiveIntegerField(null=True, blank=True, editable=False, help_text="Preço do serviço ao agendar (calculado automaticamente)", verbose_name="Preço (centavos)")
+    duration_minutes = models.PositiveIntegerField(null=True, blank=True, editable=False, help_text="Duração do serviço ao agendar (calculado automaticamente)", verbose_name="Duração (minutos)")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+    updated_at = models.DateTimeField(auto_now=True, null=True, verbose_name="Atualizado em")
+    recurrence = models.ForeignKey(RecurrenceRule, null=True, blank=True, on_delete=models.SET_NULL, related_name='bookings', verbose_name="Recorrência")
+    
+    objects = BookingQuerySet.as_manager()
+    
+    # Campos que exigem recalcular end_time/customer_phone_key/business ao salvar
+    DERIVED_SOURCE_FIELDS = {'service', 'service_id', 'start_time', 'customer_phone'}
+    DERIVED_FIELDS = {'end_time', 'customer_phone_key', 'business', 'price_cents', 'duration_minutes'}
     
-    # Campo para compatibilidade com código antigo (será removido em migração futura)
-    time = models.TimeField(null=True, blank=True, help_text="DEPRECATED: use start_time", verbose_name="Horário (Antigo)")
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Serviço do preço/duração gravados: trocar de serviço refaz o snapshot
+        instance._snapshot_service_id = instance.__dict__.get('service_id')
+        instance._remember_saved_state()
+        return instance
+    
+    def _remember_saved_state(self, fields=None):
+        """
+        Data e status como estão no banco, lidos sem nova consulta: mudar a
+        data também invalida o dia antigo no feed .ics, e mudar o status
+        gera notificação ao cliente (signals.py). None = desconhecido.
+        """
+        for field in ('date', 'status'):
+            if fields is None or field in fields:
+                setattr(self, f'_previous_{field}', self.__dict__.get(field))
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._remember_saved_state(fields)
     
     class Meta:
         verbose_name = "Agendamento"
         verbose_name_plural = "Agendamentos"
         ordering = ['-created_at']
-        # Evitar duplos agendamentos no mesmo horário
-        unique_together = ['service', 'date', 'start_time']
+        # Evitar duplos agendamentos no mesmo horário (cancelados liberam o horário)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['service', 'date', 'start_time'],
+                condition=models.Q(status__in=['PENDING', 'CONFIRMED']),
+                name='booking_unique_active_slot',
+            ),
+        ]
+        indexes = [
+            # Consulta de "meus agendamentos" por telefone
+            models.Index(fields=['customer_phone_key', 'status', 'date'], name='booking_phone_status_date'),
+            # Filtros por data/status (agenda, relatórios, admin)
+            models.Index(fields=['date', 'status'], name='booking_date_status'),
+            models.Index(fields=['status', 'date'], name='booking_status_date'),
+            # Ordenação padrão do admin/listagens
+            models.Index(fields=['-created_at'], name='booking_created_desc'),
+            # Os mesmos com o negócio na frente: site e painel filtram por
+            # negócio; admin do Django, lembretes e o modo de negócio único não
+            models.Index(fields=['business', 'customer_phone_key', 'status', 'date'], name='booking_biz_phone_status'),
+            models.Index(fields=['business', 'date', 'status'], name='booking_biz_date_status'),
+            models.Index(fields=['business', 'status', 'date'], name='booking_biz_status_date'),
+            models.Index(fields=['business', '-created_at'], name='booking_biz_created_desc'),
+            # Varredura de PENDENTES vencidos (poucas linhas: só pendentes)
+            models.Index(fields=['updated_at'], condition=models.Q(status='PENDING'), name='booking_pending_updated'),
+        ]
     
     def save(self, *args, **kwargs):
-        """Auto-calcular end_time baseado na duração do serviço"""
-        if self.start_time and not self.end_time:
-            from .services import calculate_end_time
-            self.end_time = calculate_end_time(self.start_time, self.service.duration_minutes)
+        """
+        Auto-calcular end_time (duração vem do catálogo em cache, sem
+        consultar Service), customer_phone_key, business e o snapshot de
+        preço/duração. Com update_fields, só recalcula se algum campo de
+        origem mudou.
+        """
+        from .services import fill_booking_fields
+        
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            fill_booking_fields([self])
+        elif update_fields:
+            if self.DERIVED_SOURCE_FIELDS.intersection(update_fields):
+                fill_booking_fields([self])
+                update_fields = set(update_fields) | self.DERIVED_FIELDS
+            # auto_now só é gravado se estiver em update_fields; a chave das
+            # notificações de status depende dele
+            kwargs['update_fields'] = update_fields = set(update_fields) | {'updated_at'}
         
-        # Garantir compatibilidade com campo antigo
-        if self.start_time and not self.time:
-            self.time = self.start_time
-            
         super().save(*args, **kwargs)
+        self._snapshot_service_id = self.service_id
+        self._remember_saved_state(update_fields)
+    
+    @property
+    def price_real(self):
+        """Preço em reais cobrado neste agendamento"""
+        if self.price_cents is None:
+            return self.service.price_real
+        return self.price_cents / 100
     
     def __str__(self):
         return f"{self.customer_name} - {self.service.name} em {self.date} às {self.start_time}"
     
     def whatsapp_message(self):
         """Gera mensagem formatada para WhatsApp"""
-        time_display = self.start_time or self.time
         return (
             f"Olá, meu nome é {self.customer_name}, "
             f"gostaria de confirmar meu agendamento para {self.service.name} "
-            f"no dia {self.date.strftime('%d/%m/%Y')} às {time_display.strftime('%H:%M')}. "
+            f"no dia {self.date.strftime('%d/%m/%Y')} às {self.start_time.strftime('%H:%M')}. "
             f"Telefone: {self.customer_phone}"
         )
+
+
+class WaitlistEntry(models.Model):
+    """Lista de espera por um horário (serviço, data, hora) já ocupado"""
+    STATUS_CHOICES = [
+        ('WAITING', 'Aguardando'),
+        ('PROMOTED', 'Promovido'),
+        ('CANCELLED', 'Cancelado'),
+    ]
+    
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, verbose_name="Serviço")
+    date = models.DateField(verbose_name="Data")
+    start_time = models.TimeField(verbose_name="Horário")
+    customer_name = models.CharField(max_length=200, verbose_name="Nome do Cliente")
+    customer_phone = models.CharField(max_length=20, help_text="Apenas dígitos", verbose_name="Telefone")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='WAITING', verbose_name="Status")
+    booking = models.OneToOneField(Booking, null=True, blank=True, on_delete=models.SET_NULL, related_name='waitlist_entry', verbose_name="Agendamento gerado")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Entrou em")
+    
+    class Meta:
+        verbose_name = "Lista de espera"
+        verbose_name_plural = "Lista de espera"
+        ordering = ['created_at']
+        indexes = [
+            # Próximo da fila de um horário: busca por índice, sem varrer a tabela
+            models.Index(fields=['service', 'date', 'start_time', 'status', 'created_at'], name='waitlist_slot_queue'),
+        ]
+        constraints = [
+            # Mesmo telefone não entra duas vezes na fila do mesmo horário
+            models.UniqueConstraint(
+                fields=['service', 'date', 'start_time', 'customer_phone'],
+                condition=models.Q(status='WAITING'),
+                name='waitlist_unique_waiting_phone',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.customer_name} aguardando {self.service.name} em {self.date} às {self.start_time}"
+
+
+class SlotHold(models.Model):
+    """
+    Reserva temporária de um horário enquanto o cliente preenche o formulário.
+    Expira sozinha: leituras ignoram holds vencidos e o comando
+    sweep_slot_holds remove os restantes.
+    """
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, verbose_name="Serviço")
+    date = models.DateField(verbose_name="Data")
+    start_time = models.TimeField(verbose_name="Horário")
+    owner = models.CharField(max_length=64, help_text="Token da sessão do cliente", verbose_name="Dono")
+    expires_at = models.DateTimeField(verbose_name="Expira em")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+    
+    class Meta:
+        verbose_name = "Reserva temporária"
+        verbose_name_plural = "Reservas temporárias"
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'date', 'start_time'], name='slothold_unique_slot'),
+        ]
+        indexes = [
+            models.Index(fields=['owner'], name='slothold_owner'),
+            models.Index(fields=['expires_at'], name='slothold_expires'),
+        ]
+    
+    def __str__(self):
+        return f"Hold {self.service_id} {self.date} {self.start_time} até {self.expires_at}"
+
+
+class ReservationKey(models.Model):
+    """
+    Chave de idempotência do formulário de reserva (bookings.idempotency).
+    A chave primária garante que só um POST a reivindique, mesmo entre
+    workers. Sem agendamento, é uma reivindicação em andamento.
+    """
+    key = models.CharField(max_length=32, primary_key=True, verbose_name="Chave")
+    booking = models.ForeignKey('Booking', null=True, blank=True, on_delete=models.CASCADE, related_name='+', verbose_name="Agendamento")
+    expires_at = models.DateTimeField(verbose_name="Expira em")
+    
+    class Meta:
+        verbose_name = "Chave de reserva"
+        verbose_name_plural = "Chaves de reserva"
+        indexes = [
+            models.Index(fields=['expires_at'], name='reservationkey_expires'),
+        ]
+    
+    def __str__(self):
+        return f"{self.key} → {self.booking_id or 'em andamento'}"
+
+
+class CalendarFeedToken(models.Model):
+    """Token secreto do feed .ics (o app de calendário não faz login)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='calendar_feed_tokens', verbose_name="Usuário")
+    business = models.ForeignKey(Business, null=True, blank=True, on_delete=models.CASCADE, verbose_name="Estabelecimento")
+    token = models.CharField(max_length=64, unique=True, verbose_name="Token")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+    
+    class Meta:
+        verbose_name = "Token do calendário"
+        verbose_name_plural = "Tokens do calendário"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'business'], name='calendarfeedtoken_user_business'),
+        ]
+    
+    def __str__(self):
+        return f"Calendário de {self.user}"
+
+
+class Notification(models.Model):
+    """
+    Caixa de saída de mensagens ao cliente (outbox).
+    Gravada na mesma transação da mudança no agendamento e enviada depois
+    pelo comando send_notifications.
+    """
+    KIND_CHOICES = [
+        ('CONFIRMATION', 'Agendamento recebido'),
+        ('STATUS', 'Mudança de status'),
+        ('REMINDER', 'Lembrete'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('PENDING', 'Pendente'),
+        ('SENT', 'Enviada'),
+        ('SKIPPED', 'Descartada'),
+        ('FAILED', 'Falhou'),
+    ]
+    
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='notifications', verbose_name="Agendamento")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Tipo")
+    recipient = models.CharField(max_length=20, help_text="Telefone (apenas dígitos)", verbose_name="Destinatário")
+    message = models.TextField(verbose_name="Mensagem")
+    dedup_key = models.CharField(max_length=100, unique=True, verbose_name="Chave de deduplicação")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING', verbose_name="Status")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Tentativas")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Próxima tentativa")
+    last_error = models.TextField(blank=True, verbose_name="Último erro")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Enviada em")
+    
+    class Meta:
+        verbose_name = "Notificação"
+        verbose_name_plural = "Notificações"
+        ordering = ['-created_at']
+        indexes = [
+            # Fila do worker: pendentes por vencimento
+            models.Index(fields=['status', 'next_attempt_at'], name='notification_due'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} para {self.recipient} ({self.get_status_display()})"
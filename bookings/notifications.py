@@ -0,0 +1,241 @@
+"""
+Notificações ao cliente (confirmação, mudança de status e lembrete).
+
+As mensagens são gravadas na tabela Notification (outbox) na mesma
+transação da mudança no agendamento: se a transação for desfeita, a
+mensagem some junto. O comando send_notifications entrega a fila em
+lotes pelo transporte configurado em NOTIFICATION_TRANSPORT, com novas
+tentativas e espera exponencial. A chave dedup_key (única) impede que o
+mesmo evento gere duas mensagens.
+"""
+import json
+import sys
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .catalog import service_catalog
+from .models import Booking, Notification
+
+# Tempo em que um lote reservado por um worker fica invisível aos demais
+LEASE_SECONDS = 300
+
+
+def notifications_enabled():
+    return getattr(settings, 'NOTIFICATIONS_ENABLED', True)
+
+
+def booking_message(booking, kind):
+    """Texto da mensagem para o agendamento, ou None se não há o que avisar"""
+    service = service_catalog.get(booking.service_id)
+    when = f"{booking.date.strftime('%d/%m/%Y')} às {booking.start_time.strftime('%H:%M')}"
+    if kind == 'CONFIRMATION':
+        return (f"Olá, {booking.customer_name}! Recebemos seu agendamento de "
+                f"{service.name} para {when}. Avisaremos quando for confirmado.")
+    if kind == 'REMINDER':
+        return (f"Olá, {booking.customer_name}! Lembrete: amanhã, {when}, "
+                f"você tem {service.name} agendado.")
+    if booking.status == 'CONFIRMED':
+        return f"Olá, {booking.customer_name}! Seu agendamento de {service.name} em {when} está confirmado."
+    if booking.status == 'CANCELLED':
+        return f"Olá, {booking.customer_name}. Seu agendamento de {service.name} em {when} foi cancelado."
+    return None
+
+
+def dedup_key(booking, kind):
+    if kind == 'STATUS':
+        # updated_at distingue transições repetidas (confirmado → pendente →
+        # confirmado avisa duas vezes); reenfileirar a mesma não duplica
+        changed = booking.updated_at.isoformat() if booking.updated_at else ''
+        return f'status:{booking.pk}:{booking.status}:{changed}'
+    if kind == 'REMINDER':
+        return f'reminder:{booking.pk}:{booking.date.isoformat()}'
+    return f'confirmation:{booking.pk}'
+
+
+def enqueue(bookings, kind):
+    """
+    Grava as mensagens dos agendamentos num único INSERT.
+    Eventos já enfileirados (mesma dedup_key) são ignorados.
+    """
+    if not notifications_enabled():
+        return 0
+    rows = []
+    for booking in bookings:
+        message = booking_message(booking, kind)
+        if message:
+            rows.append(Notification(
+                booking_id=booking.pk,
+                kind=kind,
+                recipient=booking.customer_phone,
+                message=message,
+                dedup_key=dedup_key(booking, kind),
+            ))
+    Notification.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+
+def enqueue_status_change(booking_ids):
+    """Mensagens de mudança de status feita em lote (uma consulta + um INSERT)"""
+    if not notifications_enabled():
+        return 0
+    bookings = Booking.objects.filter(id__in=booking_ids).only(
+        'id', 'service_id', 'customer_name', 'customer_phone', 'date', 'start_time', 'status', 'updated_at',
+    )
+    return enqueue(bookings, 'STATUS')
+
+
+def enqueue_reminders(today=None, days_ahead=1):
+    """
+    Lembretes dos agendamentos ativos dos próximos `days_ahead` dias.
+    Uma consulta por intervalo de datas e um INSERT por execução; rodar
+    de novo no mesmo dia não duplica lembretes.
+    """
+    today = today or timezone.localdate()
+    bookings = Booking.objects.filter(
+        date__range=(today + timedelta(days=1), today + timedelta(days=days_ahead)),
+        status__in=Booking.ACTIVE_STATUSES,
+    ).only('id', 'service_id', 'customer_name', 'customer_phone', 'date', 'start_time', 'status')
+    return enqueue(bookings, 'REMINDER')
+
+
+class Transport:
+    """
+    Interface de envio. Implementações recebem lotes e devolvem
+    {notification_id: None (enviada) | 'mensagem de erro'}.
+    A dedup_key pode ser repassada ao provedor como chave de idempotência.
+    """
+
+    def send(self, notification):
+        raise NotImplementedError
+
+    def send_batch(self, notifications):
+        results = {}
+        for notification in notifications:
+            try:
+                self.send(notification)
+                results[notification.pk] = None
+            except Exception as e:
+                results[notification.pk] = str(e) or e.__class__.__name__
+        return results
+
+
+class ConsoleTransport(Transport):
+    """Escreve as mensagens no stdout (desenvolvimento)"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def send(self, notification):
+        self.stream.write(f"📨 [{notification.kind}] {notification.recipient}: {notification.message}\n")
+
+
+class FileTransport(Transport):
+    """Acrescenta uma linha JSON por mensagem em NOTIFICATION_FILE_PATH"""
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, 'NOTIFICATION_FILE_PATH', 'notifications.jsonl')
+
+    def send_batch(self, notifications):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for notification in notifications:
+                f.write(json.dumps({
+                    'dedup_key': notification.dedup_key,
+                    'kind': notification.kind,
+                    'recipient': notification.recipient,
+                    'message': notification.message,
+                }, ensure_ascii=False) + '\n')
+        return {notification.pk: None for notification in notifications}
+
+
+def get_transport():
+    """Transporte configurado em NOTIFICATION_TRANSPORT (caminho pontuado)"""
+    path = getattr(settings, 'NOTIFICATION_TRANSPORT', 'bookings.notifications.ConsoleTransport')
+    return import_string(path)()
+
+
+def retry_delay(attempts):
+    """Espera exponencial: base, 2x base, 4x base... (máximo de 1 dia)"""
+    base = getattr(settings, 'NOTIFICATION_RETRY_SECONDS', 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 24 * 60 * 60))
+
+
+def claim_batch(batch_size):
+    """
+    Reserva um lote de mensagens vencidas para este worker.
+    SKIP LOCKED deixa outros workers pegarem lotes diferentes; o
+    adiamento de next_attempt_at funciona como "lease": se o worker
+    morrer, o lote volta para a fila sozinho.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Notification.objects.select_for_update(skip_locked=True)
+            .filter(status='PENDING', next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if ids:
+            Notification.objects.filter(id__in=ids).update(
+                next_attempt_at=now + timedelta(seconds=LEASE_SECONDS),
+            )
+    return ids
+
+
+def process_outbox(batch_size=100, transport=None):
+    """
+    Entrega um lote da fila.
+    
+    Lembretes de agendamentos que deixaram de estar ativos são
+    descartados sem envio.
+    
+    Returns:
+        dict: contagem de mensagens sent / skipped / retried / failed
+    """
+    transport = transport or get_transport()
+    counts = {'sent': 0, 'skipped': 0, 'retried': 0, 'failed': 0}
+    ids = claim_batch(batch_size)
+    if not ids:
+        return counts
+    
+    notifications = list(
+        Notification.objects.filter(id__in=ids)
+        .select_related('booking')
+        .only('id', 'kind', 'recipient', 'message', 'dedup_key', 'attempts', 'booking__status')
+    )
+    skipped = [
+        n.pk for n in notifications
+        if n.kind == 'REMINDER' and n.booking.status not in Booking.ACTIVE_STATUSES
+    ]
+    to_send = [n for n in notifications if n.pk not in skipped]
+    results = transport.send_batch(to_send) if to_send else {}
+    
+    now = timezone.now()
+    if skipped:
+        counts['skipped'] = Notification.objects.filter(id__in=skipped).update(status='SKIPPED')
+    sent = [pk for pk, error in results.items() if error is None]
+    if sent:
+        counts['sent'] = Notification.objects.filter(id__in=sent).update(
+            status='SENT', sent_at=now, attempts=F('attempts') + 1, last_error='',
+        )
+    
+    max_attempts = getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 5)
+    for notification in to_send:
+        error = results.get(notification.pk, 'sem resposta do transporte')
+        if error is None:
+            continue
+        attempts = notification.attempts + 1
+        if attempts >= max_attempts:
+            counts['failed'] += 1
+            changes = {'status': 'FAILED'}
+        else:
+            counts['retried'] += 1
+            changes = {'next_attempt_at': now + retry_delay(attempts)}
+        Notification.objects.filter(id=notification.pk).update(
+            attempts=attempts, last_error=error[:500], **changes,
+        )
+    return counts
@@ -3,22 +3,37 @@ Views para interface profissional mobile-first
 Interface moderna e otimizada para smartphones
 """
 from django.shortcuts import render, get_object_or_404, redirect
-from django.contrib.auth.decorators import login_required
+from django.urls import reverse
 from django.contrib.auth import authenticate, login, logout
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Count, Sum, Q
-from datetime import date as date_cls, timedelta
+from django.utils.cache import get_conditional_response
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
 from django.conf import settings
 from datetime import datetime, timedelta, date as date_cls
 import json
 import csv
 
-from .models import Booking, Service
-from .services import list_day_times, list_free_times
+from .models import Booking, Service, RecurrenceRule
+from . import analytics_export
+from .reports import period_comparison, period_report
+from .utilization import utilization_heatmap
+from .catalog import service_catalog
+from .services import list_day_times, list_free_times, bulk_update_status
+from .signals import booking_status_changed
+from .holds import hold_metrics
+from .notifications import notifications_enabled
+from .recurrence import MAX_OCCURRENCES, create_recurring_bookings, limit_reached
+from .calendar_feed import feed_etag, feed_token_for, valid_feed_token, render_feed
+from .tenants import business_member_required
+from .routers import replica_reads_view
 from .utils import build_whatsapp_url
 
+# Limite de IDs por requisição na atualização em lote
+BULK_STATUS_MAX_IDS = 500
+
 
 def login_view(request):
     """View de login para o painel profissional"""
@@ -46,19 +61,19 @@ def logout_view(request):
     return redirect('bookings:home')
 
 
-@login_required
+@business_member_required
 def dashboard(request):
     """Dashboard principal mobile-first"""
     today = timezone.now().date()
     
     # Estatísticas rápidas
-    agendamentos_hoje = Booking.objects.filter(
+    agendamentos_hoje = Booking.objects.for_business(request.business).filter(
         date=today,
         status__in=['PENDING', 'CONFIRMED']
     ).count()
     
     # Próximos agendamentos (hoje)
-    proximos_agendamentos = Booking.objects.filter(
+    proximos_agendamentos = Booking.objects.for_business(request.business).filter(
         date=today,
         status__in=['PENDING', 'CONFIRMED']
     ).select_related('service').order_by('start_time')[:5]
@@ -68,7 +83,7 @@ def dashboard(request):
         booking.whatsapp_url = build_whatsapp_url(booking)
     
     # Agendamentos pendentes (precisam confirmação)
-    pendentes = Booking.objects.filter(
+    pendentes = Booking.objects.for_business(request.business).filter(
         status='PENDING'
     ).select_related('service').order_by('date', 'start_time')[:10]
     
@@ -79,11 +94,11 @@ def dashboard(request):
     start_week = today - timedelta(days=today.weekday())
     end_week = start_week + timedelta(days=6)
     
-    faturamento_semana = Booking.objects.filter(
+    faturamento_semana = Booking.objects.for_business(request.business).filter(
         date__range=[start_week, end_week],
         status='CONFIRMED'
     ).aggregate(
-        total=Sum('service__price_cents')
+        total=Sum('price_cents')
     )['total'] or 0
     
     faturamento_semana = faturamento_semana / 100  # Converter para reais
@@ -100,7 +115,7 @@ def dashboard(request):
     return render(request, 'bookings/profissional/dashboard.html', context)
 
 
-@login_required  
+@business_member_required
 def agenda(request):
     """Agenda do dia com navegação por data"""
     date_str = request.GET.get('date')
@@ -127,7 +142,7 @@ def agenda(request):
         })
     
     # Agendamentos do dia
-    agendamentos = Booking.objects.filter(
+    agendamentos = Booking.objects.for_business(request.business).filter(
         date=selected_date,
         status__in=['PENDING', 'CONFIRMED']
     ).select_related('service').order_by('start_time')
@@ -141,9 +156,12 @@ def agenda(request):
     taken_times = set(booking.start_time for booking in agendamentos)
     available_times = sorted(all_times - taken_times)
     
+    # IDs pendentes para ações em lote
+    pendentes_ids = [booking.id for booking in agendamentos if booking.status == 'PENDING']
+    
     # Estatísticas do dia
     total_agendamentos = agendamentos.count()
-    faturamento_dia = sum(booking.service.price_real for booking in agendamentos if booking.status == 'CONFIRMED')
+    faturamento_dia = sum(booking.price_real for booking in agendamentos if booking.status == 'CONFIRMED')
     
     context = {
         'selected_date': selected_date,
@@ -153,12 +171,13 @@ def agenda(request):
         'total_agendamentos': total_agendamentos,
         'faturamento_dia': faturamento_dia,
         'slots_livres': len(available_times),
+        'pendentes_ids': pendentes_ids,
     }
     
     return render(request, 'bookings/profissional/agenda.html', context)
 
 
-@login_required
+@business_member_required
 def agenda_data(request, date):
     """API JSON para carregar agenda de data específica (AJAX)"""
     try:
@@ -166,7 +185,7 @@ def agenda_data(request, date):
     except ValueError:
         return JsonResponse({'error': 'Data inválida'}, status=400)
     
-    agendamentos = Booking.objects.filter(
+    agendamentos = Booking.objects.for_business(request.business).filter(
         date=selected_date,
         status__in=['PENDING', 'CONFIRMED']
     ).select_related('service').order_by('start_time')
@@ -179,7 +198,7 @@ def agenda_data(request, date):
             'telefone': booking.customer_phone,
             'servico': booking.service.name,
             'horario': booking.start_time.strftime('%H:%M'),
-            'valor': f"R$ {booking.service.price_real:.2f}",
+            'valor': f"R$ {booking.price_real:.2f}",
             'status': booking.status,
             'status_display': booking.get_status_display(),
             'whatsapp_url': build_whatsapp_url(booking),
@@ -192,10 +211,10 @@ def agenda_data(request, date):
     })
 
 
-@login_required
+@business_member_required
 def agendamento_detail(request, booking_id):
     """Detalhes de agendamento específico"""
-    booking = get_object_or_404(Booking, id=booking_id)
+    booking = get_object_or_404(Booking.objects.for_business(request.business), id=booking_id)
     booking.whatsapp_url = build_whatsapp_url(booking)
     
     context = {
@@ -205,14 +224,12 @@ def agendamento_detail(request, booking_id):
     return render(request, 'bookings/profissional/agendamento_detail.html', context)
 
 
-@login_required
+@business_member_required
 def update_status(request, booking_id):
     """Atualizar status do agendamento via AJAX"""
     if request.method != 'POST':
         return JsonResponse({'error': 'Método não permitido'}, status=405)
     
-    booking = get_object_or_404(Booking, id=booking_id)
-    
     try:
         data = json.loads(request.body)
         new_status = data.get('status')
@@ -220,14 +237,29 @@ def update_status(request, booking_id):
         if new_status not in ['PENDING', 'CONFIRMED', 'CANCELLED']:
             return JsonResponse({'error': 'Status inválido'}, status=400)
         
-        booking.status = new_status
-        booking.save()
+        # Só a data é lida; o UPDATE grava apenas a coluna status (sem save() completo)
+        bookings = Booking.objects.for_business(request.business).filter(id=booking_id)
+        booking_date = bookings.values_list('date', flat=True).first()
+        if booking_date is None:
+            return JsonResponse({'error': 'Agendamento não encontrado'}, status=404)
+        try:
+            with transaction.atomic():
+                # Status igual (clique duplo) não grava nem avisa de novo: a
+                # dedup_key inclui updated_at e a mensagem sairia repetida
+                if bookings.exclude(status=new_status).update(status=new_status, updated_at=timezone.now()):
+                        # Com a data, o feed .ics e os relatórios invalidam só aquele dia
+                    booking_status_changed.send(sender=Booking, booking_ids=[booking_id], status=new_status,
+                                                dates={booking_date})
+        except IntegrityError:
+            # Reativação de cancelado cujo horário já foi ocupado
+            return JsonResponse({'error': 'Horário já ocupado por outro agendamento'}, status=409)
         
+        status_display = dict(Booking.STATUS_CHOICES)[new_status]
         return JsonResponse({
             'success': True,
-            'status': booking.status,
-            'status_display': booking.get_status_display(),
-            'message': f'Status alterado para {booking.get_status_display()}'
+            'status': new_status,
+            'status_display': status_display,
+            'message': f'Status alterado para {status_display}'
         })
         
     except json.JSONDecodeError:
@@ -236,7 +268,150 @@ def update_status(request, booking_id):
         return JsonResponse({'error': str(e)}, status=500)
 
 
-@login_required
+@business_member_required
+def bulk_update_status_view(request):
+    """
+    Atualizar status de vários agendamentos via AJAX.
+    Corpo JSON: {"ids": [1, 2, 3], "status": "CONFIRMED"}
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método não permitido'}, status=405)
+    
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+    
+    new_status = data.get('status')
+    if new_status not in dict(Booking.STATUS_CHOICES):
+        return JsonResponse({'error': 'Status inválido'}, status=400)
+    
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids:
+        return JsonResponse({'error': 'Informe a lista de agendamentos'}, status=400)
+    if len(ids) > BULK_STATUS_MAX_IDS:
+        return JsonResponse({'error': f'Máximo de {BULK_STATUS_MAX_IDS} agendamentos por vez'}, status=400)
+    try:
+        # Remover duplicados mantendo a ordem
+        booking_ids = list(dict.fromkeys(int(i) for i in ids))
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'IDs inválidos'}, status=400)
+    
+    results = bulk_update_status(booking_ids, new_status, request.business)
+    updated = sum(1 for r in results.values() if r == 'updated')
+    status_display = dict(Booking.STATUS_CHOICES)[new_status]
+    
+    return JsonResponse({
+        'success': True,
+        'status': new_status,
+        'status_display': status_display,
+        'updated': updated,
+        'results': {str(booking_id): result for booking_id, result in results.items()},
+        'message': f'{updated} agendamento(s) alterado(s) para {status_display}'
+    })
+
+
+@business_member_required
+def criar_recorrencia(request):
+    """
+    Criar agendamentos recorrentes via AJAX.
+    Corpo JSON: {"service_id": 1, "customer_name": "...", "customer_phone": "...",
+                 "start_date": "2025-01-06", "start_time": "09:00",
+                 "frequency": "WEEKLY", "until": "2025-12-31", "count": null}
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método não permitido'}, status=405)
+    
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+    
+    try:
+        service = service_catalog.get(data.get('service_id'), request.business)
+    except Service.DoesNotExist:
+        return JsonResponse({'error': 'Serviço não encontrado'}, status=400)
+    
+    frequency = data.get('frequency', 'WEEKLY')
+    if frequency not in dict(RecurrenceRule.FREQUENCY_CHOICES):
+        return JsonResponse({'error': 'Frequência inválida'}, status=400)
+    
+    customer_name = (data.get('customer_name') or '').strip()
+    customer_phone = (data.get('customer_phone') or '').strip()
+    if not customer_name or not customer_phone:
+        return JsonResponse({'error': 'Nome e telefone são obrigatórios'}, status=400)
+    
+    try:
+        start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
+        start_time = datetime.strptime(data['start_time'], '%H:%M').time()
+        until = datetime.strptime(data['until'], '%Y-%m-%d').date() if data.get('until') else None
+        count = int(data['count']) if data.get('count') else None
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({'error': 'Data, horário ou limite inválidos'}, status=400)
+    if count is not None and not 0 < count <= MAX_OCCURRENCES:
+        return JsonResponse({'error': f'O número de ocorrências deve ficar entre 1 e {MAX_OCCURRENCES}'}, status=400)
+    
+    try:
+        with transaction.atomic():
+            rule = RecurrenceRule.objects.create(
+                service=service,
+                customer_name=customer_name,
+                customer_phone=customer_phone,
+                start_date=start_date,
+                start_time=start_time,
+                frequency=frequency,
+                until=until,
+                count=count,
+            )
+            created, skipped = create_recurring_bookings(rule)
+    except IntegrityError:
+        # Outra reserva ocupou uma das datas também na nova tentativa;
+        # a regra é desfeita junto e o profissional pode repetir o pedido
+        return JsonResponse({'error': 'Horário já ocupado por outro agendamento. Tente novamente.'}, status=409)
+    
+    message = f'{len(created)} agendamento(s) criado(s), {len(skipped)} data(s) ocupada(s)'
+    truncated = limit_reached(rule)
+    if truncated:
+        message += f' (limite de {MAX_OCCURRENCES} ocorrências por recorrência)'
+    return JsonResponse({
+        'success': True,
+        'recurrence_id': rule.pk,
+        'created': [booking.date.isoformat() for booking in created],
+        'skipped': [d.isoformat() for d in skipped],
+        'limit_reached': truncated,
+        'message': message,
+    })
+
+
+def calendario_ics(request, token):
+    """
+    Feed .ics da agenda para apps de calendário (autenticado pelo token).
+    Responde 304 quando o ETag enviado pelo cliente ainda é o atual.
+    """
+    feed_token = valid_feed_token(token)
+    if feed_token is None:
+        return HttpResponse(status=404)
+    
+    # O negócio vem do token, não do domínio (apps de calendário não têm sessão)
+    business = feed_token.business
+    etag = feed_etag(business)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(render_feed(business), content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = 'inline; filename="agenda.ics"'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@business_member_required
+def metricas_holds(request):
+    """Métricas das reservas temporárias: conflitos e expirações (JSON)"""
+    return JsonResponse(hold_metrics())
+
+
+@business_member_required
+@replica_reads_view
 def relatorios(request):
     """Relatórios e análises do negócio"""
     # Período de análise
@@ -254,140 +429,22 @@ def relatorios(request):
         end_date = timezone.now().date()
         start_date = end_date - timedelta(days=30)
     
-    # Agendamentos do período
-    agendamentos_periodo = Booking.objects.filter(
-        date__range=[start_date, end_date]
-    )
-    
-    # KPIs principais
-    total_agendamentos = agendamentos_periodo.count()
-    faturamento_total = agendamentos_periodo.filter(
-        status='CONFIRMED'
-    ).aggregate(
-        total=Sum('service__price_cents')
-    )['total'] or 0
-    
-    faturamento_total = faturamento_total / 100
-    
-    # Taxa de confirmação
-    confirmados = agendamentos_periodo.filter(status='CONFIRMED').count()
-    taxa_confirmacao = (confirmados / total_agendamentos * 100) if total_agendamentos > 0 else 0
-    
-    # Ticket médio
-    ticket_medio = faturamento_total / confirmados if confirmados > 0 else 0
-    
-    # Serviços mais procurados
-    servicos_populares = Service.objects.annotate(
-        agendamentos_count=Count('booking', filter=Q(
-            booking__date__range=[start_date, end_date]
-        )),
-        faturamento_total=Sum('booking__service__price_cents', filter=Q(
-            booking__date__range=[start_date, end_date],
-            booking__status='CONFIRMED'
-        ))
-    ).filter(agendamentos_count__gt=0).order_by('-agendamentos_count')[:5]
-    
-    # Adicionar percentual para cada serviço
-    max_agendamentos = servicos_populares.first().agendamentos_count if servicos_populares else 1
-    for service in servicos_populares:
-        service.percentage = (service.agendamentos_count / max_agendamentos * 100) if max_agendamentos > 0 else 0
-        service.faturamento_total = (service.faturamento_total or 0) / 100
-    
-    # Status dos agendamentos
-    confirmados_count = agendamentos_periodo.filter(status='CONFIRMED').count()
-    pendentes_count = agendamentos_periodo.filter(status='PENDING').count()
-    cancelados_count = agendamentos_periodo.filter(status='CANCELLED').count()
-    
-    total_status = confirmados_count + pendentes_count + cancelados_count
-    confirmados_percent = (confirmados_count / total_status * 100) if total_status > 0 else 0
-    pendentes_percent = (pendentes_count / total_status * 100) if total_status > 0 else 0
-    cancelados_percent = (cancelados_count / total_status * 100) if total_status > 0 else 0
-    
-    # Horários de pico
-    horarios_pico = []
-    for hour in range(9, 18):
-        count = agendamentos_periodo.filter(start_time__hour=hour).count()
-        if count > 0:
-            horarios_pico.append({
-                'hora': hour,
-                'agendamentos': count,
-                'percentage': (count / total_agendamentos * 100) if total_agendamentos > 0 else 0
-            })
-    
-    horarios_pico = sorted(horarios_pico, key=lambda x: x['agendamentos'], reverse=True)[:6]
-    
-    # Clientes fiéis
-    clientes_fieis = []
-    clientes_data = {}
-    
-    for booking in agendamentos_periodo:
-        if booking.customer_name not in clientes_data:
-            clientes_data[booking.customer_name] = {
-                'name': booking.customer_name,
-                'phone': booking.customer_phone,
-                'agendamentos_count': 0,
-                'total_gasto': 0,
-                'ultimo_agendamento': booking.date
-            }
-        
-        clientes_data[booking.customer_name]['agendamentos_count'] += 1
-        if booking.status == 'CONFIRMED':
-            clientes_data[booking.customer_name]['total_gasto'] += booking.service.price_cents / 100
-        
-        if booking.date > clientes_data[booking.customer_name]['ultimo_agendamento']:
-            clientes_data[booking.customer_name]['ultimo_agendamento'] = booking.date
-    
-    clientes_fieis = sorted(
-        [cliente for cliente in clientes_data.values() if cliente['agendamentos_count'] >= 2],
-        key=lambda x: x['agendamentos_count'],
-        reverse=True
-    )[:5]
-    
-    # Dados para gráfico
-    chart_days = []
-    current_date = start_date
-    while current_date <= end_date:
-        day_bookings = agendamentos_periodo.filter(
-            date=current_date,
-            status='CONFIRMED'
-        )
-        day_faturamento = day_bookings.aggregate(
-            total=Sum('service__price_cents')
-        )['total'] or 0
-        day_faturamento = day_faturamento / 100
-        
-        chart_days.append({
-            'date': current_date,
-            'faturamento': day_faturamento
-        })
-        current_date += timedelta(days=1)
+    # Números do período (colunas carregadas uma vez, cálculo vetorizado)
+    report = period_report(Booking.objects.for_business(request.business), start_date, end_date)
     
     context = {
         'start_date': start_date,
         'end_date': end_date,
-        'total_agendamentos': total_agendamentos,
-        'faturamento_total': faturamento_total,
-        'taxa_confirmacao': taxa_confirmacao,
-        'ticket_medio': ticket_medio,
-        'variacao_faturamento': 15,  # Simulado
-        'variacao_agendamentos': 8,  # Simulado
-        'variacao_ticket': 5,  # Simulado
-        'servicos_populares': servicos_populares,
-        'confirmados_count': confirmados_count,
-        'pendentes_count': pendentes_count,
-        'cancelados_count': cancelados_count,
-        'confirmados_percent': confirmados_percent,
-        'pendentes_percent': pendentes_percent,
-        'cancelados_percent': cancelados_percent,
-        'horarios_pico': horarios_pico,
-        'clientes_fieis': clientes_fieis,
-        'chart_days': chart_days,
+        **report,
+        # Comparação com a janela anterior de mesmo tamanho (dias em cache)
+        **period_comparison(report, request.business, start_date, end_date),
+        'utilizacao': utilization_heatmap(request.business, start_date, end_date),
     }
     
     return render(request, 'bookings/profissional/relatorios.html', context)
 
 
-@login_required
+@business_member_required
 def configuracoes(request):
     """Configurações do sistema"""
     if request.method == 'POST':
@@ -398,15 +455,29 @@ def configuracoes(request):
             service_price = float(request.POST.get('service_price', 0))
             
             Service.objects.create(
+                business=request.business,
                 name=service_name,
                 price_cents=int(service_price * 100)
             )
             
             messages.success(request, f'Serviço "{service_name}" adicionado com sucesso!')
             return redirect('profissional:configuracoes')
+        
+        if form_type == 'profile' and request.business is not None:
+            business = request.business
+            business.name = request.POST.get('business_name', '').strip() or business.name
+            business.description = request.POST.get('business_description', '').strip()
+            business.phone = request.POST.get('business_phone', '').strip()
+            business.whatsapp_number = ''.join(filter(str.isdigit, request.POST.get('whatsapp_number', '')))
+            business.address = request.POST.get('business_address', '').strip()
+            business.save()
+            
+            messages.success(request, 'Perfil atualizado com sucesso!')
+            return redirect('profissional:configuracoes')
     
     # Dados para o template
-    services = Service.objects.all().order_by('name')
+    business = request.business
+    services = service_catalog.all(request.business)
     
     # Dias da semana para horário de funcionamento
     days_of_week = [
@@ -423,24 +494,28 @@ def configuracoes(request):
     context = {
         'services': services,
         'days_of_week': days_of_week,
-        'business_name': 'Meu Salão',
-        'business_description': 'Salão de beleza com os melhores serviços da região',
-        'business_phone': '(11) 99999-9999',
-        'whatsapp_number': getattr(settings, 'WHATSAPP_BUSINESS_NUMBER', '5511999999999'),
-        'business_address': 'Rua das Flores, 123 - Centro',
-        'email_notifications': True,
-        'whatsapp_notifications': True,
+        'business_name': business.name if business else 'Meu Salão',
+        'business_description': business.description if business else '',
+        'business_phone': business.phone if business else '',
+        'whatsapp_number': (business and business.whatsapp_number) or getattr(settings, 'WHATSAPP_BUSINESS_NUMBER', '5511999999999'),
+        'business_address': business.address if business else '',
+        'email_notifications': notifications_enabled(),
+        'whatsapp_notifications': notifications_enabled(),
         'auto_confirm': False,
         'ultimo_backup': timezone.now(),
         'ultima_atualizacao': timezone.now().date(),
-        'total_agendamentos_sistema': Booking.objects.count(),
+        'total_agendamentos_sistema': Booking.objects.for_business(request.business).count(),
         'espaco_usado': 2.5,
+        'calendar_feed_url': request.build_absolute_uri(
+            reverse('profissional:calendario_ics', args=[feed_token_for(request.user, request.business)])
+        ),
     }
     
     return render(request, 'bookings/profissional/configuracoes.html', context)
 
 
-@login_required
+@business_member_required
+@replica_reads_view
 def exportar_relatorio_pdf(request):
     """Exportar relatório em PDF"""
     # Import dinâmico do reportlab apenas quando necessário
@@ -472,20 +547,11 @@ def exportar_relatorio_pdf(request):
         start_date = end_date - timedelta(days=30)
     
     # Dados do relatório
-    agendamentos_periodo = Booking.objects.filter(
-        date__range=[start_date, end_date]
-    )
-    
-    total_agendamentos = agendamentos_periodo.count()
-    faturamento_total = agendamentos_periodo.filter(
-        status='CONFIRMED'
-    ).aggregate(
-        total=Sum('service__price_cents')
-    )['total'] or 0
-    faturamento_total = faturamento_total / 100
-    
-    confirmados = agendamentos_periodo.filter(status='CONFIRMED').count()
-    ticket_medio = faturamento_total / confirmados if confirmados > 0 else 0
+    report = period_report(Booking.objects.for_business(request.business), start_date, end_date)
+    total_agendamentos = report['total_agendamentos']
+    faturamento_total = report['faturamento_total']
+    confirmados = report['confirmados']
+    ticket_medio = report['ticket_medio']
     
     # Criar PDF
     response = HttpResponse(content_type='application/pdf')
@@ -541,19 +607,15 @@ def exportar_relatorio_pdf(request):
     story.append(servicos_title)
     story.append(Spacer(1, 6))
     
-    servicos_populares = Service.objects.annotate(
-        agendamentos_count=Count('booking', filter=Q(
-            booking__date__range=[start_date, end_date]
-        ))
-    ).filter(agendamentos_count__gt=0).order_by('-agendamentos_count')[:5]
+    servicos_populares = report['servicos_populares']
     
     if servicos_populares:
         dados_servicos = [['Serviço', 'Agendamentos', 'Preço']]
         for service in servicos_populares:
             dados_servicos.append([
-                service.name,
-                str(service.agendamentos_count),
-                f'R$ {service.price_real:.2f}'
+                service['name'],
+                str(service['agendamentos_count']),
+                f"R$ {service['price_real']:.2f}"
             ])
         
         tabela_servicos = Table(dados_servicos)
@@ -583,7 +645,8 @@ def exportar_relatorio_pdf(request):
     return response
 
 
-@login_required
+@business_member_required
+@replica_reads_view
 def exportar_csv(request):
     """Exportar dados em CSV"""
     # Período de análise
@@ -602,7 +665,7 @@ def exportar_csv(request):
         start_date = end_date - timedelta(days=30)
     
     # Buscar agendamentos do período
-    agendamentos = Booking.objects.filter(
+    agendamentos = Booking.objects.for_business(request.business).filter(
         date__range=[start_date, end_date]
     ).select_related('service').order_by('date', 'start_time')
     
@@ -635,7 +698,7 @@ def exportar_csv(request):
             booking.customer_name,
             booking.customer_phone,
             booking.service.name,
-            f'R$ {booking.service.price_real:.2f}',
+            f'R$ {booking.price_real:.2f}',
             booking.get_status_display(),
             booking.created_at.strftime('%d/%m/%Y %H:%M')
         ])
@@ -643,7 +706,50 @@ def exportar_csv(request):
     return response
 
 
-@login_required 
+@business_member_required
+@replica_reads_view
+def exportar_dados(request):
+    """
+    Exportar agendamentos em formato colunar (?formato=parquet|arrow) para
+    análise. Sem start_date/end_date, exporta o histórico inteiro.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return JsonResponse({
+            'error': 'Exportação não disponível. Biblioteca pyarrow não instalada.'
+        }, status=500)
+    
+    formato = request.GET.get('formato', 'parquet')
+    if formato not in analytics_export.FORMATS:
+        return JsonResponse({'error': 'Formato inválido'}, status=400)
+    
+    agendamentos = Booking.objects.for_business(request.business)
+    start_date_str = request.GET.get('start_date')
+    end_date_str = request.GET.get('end_date')
+    if start_date_str or end_date_str:
+        try:
+            start_date = date_cls.fromisoformat(start_date_str or '0001-01-01')
+            end_date = date_cls.fromisoformat(end_date_str or '9999-12-31')
+        except ValueError:
+            return JsonResponse({'error': 'Data inválida'}, status=400)
+        agendamentos = agendamentos.filter(date__range=[start_date, end_date])
+    
+    # O conteúdo é gerado depois que a view retorna: fixar aqui o banco
+    # escolhido pelo roteador (réplica ou primário)
+    agendamentos = agendamentos.using(agendamentos.db).order_by('date', 'start_time', 'id')
+    
+    content_type, extension = analytics_export.FORMATS[formato]
+    response = StreamingHttpResponse(
+        analytics_export.iter_export(agendamentos, formato, request.business),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="agendamentos.{extension}"'
+    return response
+
+
+@business_member_required
+@replica_reads_view
 def backup_dados(request):
     """Fazer backup completo dos dados"""
     if request.method != 'POST':
@@ -652,7 +758,7 @@ def backup_dados(request):
     try:
         # Dados dos agendamentos
         agendamentos = []
-        for booking in Booking.objects.all().select_related('service'):
+        for booking in Booking.objects.for_business(request.business).select_related('service'):
             agendamentos.append({
                 'id': booking.id,
                 'data': booking.date.isoformat(),
@@ -661,14 +767,14 @@ def backup_dados(request):
                 'cliente_nome': booking.customer_name,
                 'cliente_telefone': booking.customer_phone,
                 'servico': booking.service.name,
-                'preco': booking.service.price_real,
+                'preco': booking.price_real,
                 'status': booking.status,
                 'criado_em': booking.created_at.isoformat(),
             })
         
         # Dados dos serviços
         servicos = []
-        for service in Service.objects.all():
+        for service in Service.objects.for_business(request.business):
             servicos.append({
                 'id': service.id,
                 'nome': service.name,
@@ -697,7 +803,7 @@ def backup_dados(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
-@login_required
+@business_member_required
 def limpar_dados_antigos(request):
     """Limpar agendamentos antigos (mais de 6 meses)"""
     if request.method != 'POST':
@@ -708,7 +814,7 @@ def limpar_dados_antigos(request):
         data_limite = timezone.now().date() - timedelta(days=180)
         
         # Buscar agendamentos antigos
-        agendamentos_antigos = Booking.objects.filter(date__lt=data_limite)
+        agendamentos_antigos = Booking.objects.for_business(request.business).filter(date__lt=data_limite)
         quantidade = agendamentos_antigos.count()
         
         # Deletar agendamentos antigos
@@ -0,0 +1,163 @@
+"""
+Limite de requisições (token bucket) para as rotas públicas.
+
+Cada rota listada em RATE_LIMITS tem baldes por IP e, quando a requisição
+traz um telefone, por telefone. Um balde de capacidade N se reenche a
+N fichas por período; cada requisição consome uma. Sem fichas, a
+RateLimitMiddleware responde 429 com Retry-After.
+
+O estado fica em RATE_LIMIT_BACKEND: LocalMemoryBackend (padrão, por
+processo, sem I/O; a capacidade é dividida entre os RATE_LIMIT_WORKERS
+workers) ou CacheBackend (o cache RATE_LIMIT_CACHE, só do limitador,
+compartilhado entre workers quando é Redis).
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from .utils import canonical_phone
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+KEY_PREFIX = 'bookings:ratelimit:'
+
+
+def parse_rate(rate):
+    """'10/m' -> (10, 60): capacidade e período em segundos"""
+    count, _, period = rate.partition('/')
+    return int(count), PERIODS[period]
+
+
+def take_token(state, now, capacity, period):
+    """
+    Consome uma ficha do balde `state` = (fichas, instante) ou None (cheio).
+    Retorna (permitido, novo estado, segundos até a próxima ficha).
+    """
+    refill = capacity / period
+    if state is None:
+        tokens = capacity
+    else:
+        tokens, updated = state
+        tokens = min(capacity, tokens + (now - updated) * refill)
+    if tokens >= 1:
+        return True, (tokens - 1, now), 0
+    return False, (tokens, now), (1 - tokens) / refill
+
+
+class LocalMemoryBackend:
+    """
+    Baldes em memória do processo (LRU limitado a `max_keys`). Cada worker
+    recebe 1/`workers` da capacidade: com as requisições distribuídas
+    entre os workers, o total se aproxima do limite configurado.
+    """
+
+    def __init__(self, max_keys=100_000, workers=None):
+        self.max_keys = max_keys
+        self.workers = max(1, workers or getattr(settings, 'RATE_LIMIT_WORKERS', 1))
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, period):
+        capacity = math.ceil(capacity / self.workers)
+        now = time.monotonic()
+        with self._lock:
+            allowed, state, retry_after = take_token(self._buckets.get(key), now, capacity, period)
+            self._buckets[key] = state
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                # O mais antigo volta a estar cheio: só afrouxa o limite
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBackend:
+    """
+    Baldes num cache do Django (RATE_LIMIT_CACHE), vistos por todos os
+    workers quando o cache é compartilhado (Redis). Leitura e escrita não são atômicas: sob concorrência algumas
+    requisições podem passar a mais, o que basta contra abuso.
+    """
+
+    def __init__(self, alias=None):
+        self.alias = alias or getattr(settings, 'RATE_LIMIT_CACHE', 'ratelimit')
+
+    def consume(self, key, capacity, period):
+        cache = caches[self.alias]
+        allowed, state, retry_after = take_token(cache.get(KEY_PREFIX + key), time.time(), capacity, period)
+        cache.set(KEY_PREFIX + key, state, timeout=period)
+        return allowed, retry_after
+
+    def clear(self):
+        pass
+
+
+class RateLimiter:
+    """Backend configurado (criado sob demanda) e regras por rota"""
+
+    def __init__(self):
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            path = getattr(settings, 'RATE_LIMIT_BACKEND', 'bookings.ratelimit.LocalMemoryBackend')
+            self._backend = import_string(path)()
+        return self._backend
+
+    def reset(self):
+        """Zera os baldes e relê a configuração (testes)"""
+        if self._backend is not None:
+            self._backend.clear()
+        self._backend = None
+
+    def check(self, route, ip, phone=None):
+        """
+        Consome uma ficha de cada balde da rota.
+        Retorna 0 se permitido, senão os segundos até poder tentar de novo.
+        """
+        rules = getattr(settings, 'RATE_LIMITS', {}).get(route)
+        if not rules:
+            return 0
+        keys = [('ip', ip)]
+        if phone:
+            keys.append(('phone', phone))
+        for kind, value in keys:
+            rate = rules.get(kind)
+            if not rate:
+                continue
+            capacity, period = parse_rate(rate)
+            allowed, retry_after = self.backend.consume(f'{route}:{kind}:{value}', capacity, period)
+            if not allowed:
+                return retry_after
+        return 0
+
+
+# Instância usada pelo middleware (uma por processo)
+rate_limiter = RateLimiter()
+
+
+def client_ip(request):
+    """
+    IP do cliente. Atrás de RATE_LIMIT_TRUSTED_PROXIES proxies (Railway: 1),
+    usa a entrada do X-Forwarded-For anexada pelo proxy mais externo, que o
+    cliente não consegue forjar.
+    """
+    proxies = getattr(settings, 'RATE_LIMIT_TRUSTED_PROXIES', 0)
+    if proxies:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def request_phone(request):
+    """Chave canônica do telefone enviado no formulário/consulta, se houver"""
+    phone = request.POST.get('phone') or request.GET.get('phone')
+    return canonical_phone(phone) if phone else None
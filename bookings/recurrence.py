@@ -0,0 +1,121 @@
+"""
+Expansão de agendamentos recorrentes.
+
+Gera todas as datas da regra, verifica conflitos de todas de uma vez
+(uma única consulta por intervalo de datas) e insere as livres com
+bulk_create numa única transação.
+"""
+import calendar
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .expiry import release_stale_slots
+from .models import Booking, SlotHold
+from .utils import normalize_phone
+
+# Limite de ocorrências por regra (2 anos de semanais)
+MAX_OCCURRENCES = 104
+
+
+def add_months(date_obj, months):
+    """Soma meses mantendo o dia (limitado ao último dia do mês)"""
+    month_index = date_obj.month - 1 + months
+    year = date_obj.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(date_obj.day, calendar.monthrange(year, month)[1])
+    return date_obj.replace(year=year, month=month, day=day)
+
+
+def nth_occurrence(rule, index):
+    """Data da ocorrência `index` (0 = start_date), ignorando os limites"""
+    if rule.frequency == 'MONTHLY':
+        return add_months(rule.start_date, index)
+    step = 14 if rule.frequency == 'BIWEEKLY' else 7
+    return rule.start_date + timedelta(days=step * index)
+
+
+def expand_occurrences(rule):
+    """Datas da regra, respeitando `until`, `count` e MAX_OCCURRENCES"""
+    limit = min(rule.count or MAX_OCCURRENCES, MAX_OCCURRENCES)
+    dates = []
+    while len(dates) < limit:
+        current = nth_occurrence(rule, len(dates))
+        if rule.until and current > rule.until:
+            break
+        dates.append(current)
+    return dates
+
+
+def limit_reached(rule):
+    """
+    True se MAX_OCCURRENCES cortou a regra: ela pedia mais datas (`count`
+    acima do limite, ou sem `count` e com `until` ausente ou além da
+    última data gerada)
+    """
+    if rule.count:
+        return rule.count > MAX_OCCURRENCES
+    return not rule.until or nth_occurrence(rule, MAX_OCCURRENCES) <= rule.until
+
+
+def taken_dates(rule, dates):
+    """
+    Datas em que o horário da regra já está ocupado: uma consulta por
+    intervalo em agendamentos ativos e outra em reservas temporárias.
+    """
+    if not dates:
+        return set()
+    slot = dict(
+        service_id=rule.service_id,
+        start_time=rule.start_time,
+        date__range=(dates[0], dates[-1]),
+    )
+    booked = Booking.objects.blocking().filter(**slot).values_list('date', flat=True)
+    held = SlotHold.objects.filter(
+        expires_at__gt=timezone.now(), **slot
+    ).values_list('date', flat=True)
+    return set(booked) | set(held)
+
+
+def create_recurring_bookings(rule, status='PENDING'):
+    """
+    Cria os agendamentos livres da regra.
+    
+    Returns:
+        tuple: (agendamentos criados, datas puladas por conflito)
+    
+    Raises:
+        IntegrityError: se a data continuar ocupada também na nova tentativa
+    """
+    dates = expand_occurrences(rule)
+    phone = normalize_phone(rule.customer_phone)
+    
+    # Uma nova tentativa cobre o caso raro de outro cliente reservar
+    # uma das datas entre a verificação e a inserção, e o de PENDENTES
+    # vencidos (livres na leitura) ainda não cancelados
+    for attempt in range(2):
+        taken = taken_dates(rule, dates)
+        free = [d for d in dates if d not in taken]
+        try:
+            with transaction.atomic():
+                created = Booking.objects.bulk_create([
+                    Booking(
+                        service_id=rule.service_id,
+                        customer_name=rule.customer_name,
+                        customer_phone=phone,
+                        date=occurrence,
+                        start_time=rule.start_time,
+                        status=status,
+                        recurrence=rule,
+                    )
+                    for occurrence in free
+                ])
+            break
+        except IntegrityError:
+            if attempt:
+                raise
+            release_stale_slots(rule.service_id, rule.start_time, free)
+    
+    skipped = [d for d in dates if d in taken]
+    return created, skipped
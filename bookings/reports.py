@@ -0,0 +1,324 @@
+"""
+Números da página de relatórios e do PDF.
+
+period_report() lê o período uma única vez como colunas compactas
+(values_list em arrays NumPy: dia ordinal, hora, status, centavos,
+serviço e cliente) e calcula tudo com operações vetorizadas: série
+diária de faturamento, histograma por hora, participação por status,
+serviços mais procurados e clientes fiéis.
+
+orm_aggregates() calcula os mesmos agregados com GROUP BY no banco. É a
+referência dos testes e do benchmark e o caminho usado quando o NumPy não
+está instalado.
+
+period_comparison() compara o período com a janela anterior de mesmo
+tamanho. O resumo de cada dia já encerrado fica em cache sob a versão do
+dia do feed .ics, que toda escrita em Booking (save, delete, status em
+lote) já troca: só os dias alterados são recalculados.
+"""
+from datetime import date, timedelta
+from itertools import islice
+
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+
+from . import metrics
+from .calendar_feed import chunk_cache, day_versions
+from .catalog import service_catalog
+from .models import Booking, Service
+
+STATUSES = [code for code, _ in Booking.STATUS_CHOICES]
+STATUS_CODES = {status: index for index, status in enumerate(STATUSES)}
+
+COLUMNS = ('date', 'start_time', 'status', 'price_cents', 'service_id', 'customer_phone_key')
+
+TOP_SERVICES = 5
+TOP_HOURS = 6
+TOP_CUSTOMERS = 5
+# Visitas no período para entrar em "clientes fiéis"
+LOYAL_MIN_BOOKINGS = 2
+
+DAY_SUMMARY_KEY = 'bookings:reports:day:{}:{}:{}'
+DAY_SUMMARY_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def numpy_available():
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def load_columns(bookings, chunk_size=50_000):
+    """
+    Colunas do período como arrays NumPy (int32/int8/int64 e texto),
+    montadas lote a lote a partir do cursor.
+    """
+    import numpy as np
+
+    parts = {name: [] for name in ('day', 'hour', 'status', 'cents', 'service', 'customer')}
+    rows = bookings.order_by().values_list(*COLUMNS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        dates, times, statuses, cents, services, customers = zip(*chunk)
+        count = len(chunk)
+        parts['day'].append(np.fromiter((d.toordinal() for d in dates), np.int32, count))
+        parts['hour'].append(np.fromiter((t.hour for t in times), np.int8, count))
+        parts['status'].append(np.fromiter((STATUS_CODES[s] for s in statuses), np.int8, count))
+        parts['cents'].append(np.fromiter((c or 0 for c in cents), np.int64, count))
+        parts['service'].append(np.fromiter(services, np.int64, count))
+        parts['customer'].append(np.array(customers, dtype=str))
+
+    empty = {'day': np.int32, 'hour': np.int8, 'status': np.int8, 'cents': np.int64, 'service': np.int64, 'customer': str}
+    return {
+        name: np.concatenate(arrays) if arrays else np.array([], dtype=empty[name])
+        for name, arrays in parts.items()
+    }
+
+
+def vectorized_aggregates(columns, start_date, end_date):
+    """Agregados do período (mesmo formato de orm_aggregates) sobre as colunas"""
+    import numpy as np
+
+    days = (end_date - start_date).days + 1
+    confirmed_cents = np.where(columns['status'] == STATUS_CODES['CONFIRMED'], columns['cents'], 0)
+    status_counts = np.bincount(columns['status'], minlength=len(STATUSES))
+    daily = np.bincount(columns['day'] - start_date.toordinal(), weights=confirmed_cents, minlength=days)
+    hours = np.bincount(columns['hour'], minlength=24)
+
+    services, service_inverse = np.unique(columns['service'], return_inverse=True)
+    service_counts = np.bincount(service_inverse, minlength=len(services))
+    service_cents = np.bincount(service_inverse, weights=confirmed_cents, minlength=len(services))
+    top_services = np.lexsort((services, -service_counts))[:TOP_SERVICES]
+
+    customers, customer_inverse = np.unique(columns['customer'], return_inverse=True)
+    customer_counts = np.bincount(customer_inverse, minlength=len(customers))
+    customer_cents = np.bincount(customer_inverse, weights=confirmed_cents, minlength=len(customers))
+    last_day = np.zeros(len(customers), dtype=np.int32)
+    np.maximum.at(last_day, customer_inverse, columns['day'])
+    loyal = np.flatnonzero(customer_counts >= LOYAL_MIN_BOOKINGS)
+    loyal = loyal[np.lexsort((customers[loyal], -customer_counts[loyal]))][:TOP_CUSTOMERS]
+
+    return {
+        'status_counts': {status: int(status_counts[code]) for status, code in STATUS_CODES.items()},
+        'revenue_cents': int(confirmed_cents.sum()),
+        'daily_cents': [int(round(value)) for value in daily],
+        'hour_counts': {int(hour): int(hours[hour]) for hour in np.flatnonzero(hours)},
+        'services': [
+            (int(services[i]), int(service_counts[i]), int(round(service_cents[i])))
+            for i in top_services
+        ],
+        'customers': [
+            (str(customers[i]), int(customer_counts[i]), int(round(customer_cents[i])), date.fromordinal(int(last_day[i])))
+            for i in loyal
+        ],
+    }
+
+
+def orm_aggregates(bookings, start_date, end_date):
+    """Os mesmos agregados com GROUP BY no banco (uma consulta por agregado)"""
+    bookings = bookings.order_by()
+    confirmed = Q(status='CONFIRMED')
+    status_counts = dict(bookings.values('status').annotate(n=Count('id')).values_list('status', 'n'))
+    daily = dict(
+        bookings.filter(confirmed).values('date').annotate(total=Sum('price_cents')).values_list('date', 'total')
+    )
+    hours = dict(
+        bookings.annotate(hour=ExtractHour('start_time')).values('hour')
+        .annotate(n=Count('id')).values_list('hour', 'n')
+    )
+    services = (
+        bookings.values('service_id')
+        .annotate(n=Count('id'), total=Sum('price_cents', filter=confirmed))
+        .order_by('-n', 'service_id')[:TOP_SERVICES]
+    )
+    customers = (
+        bookings.values('customer_phone_key')
+        .annotate(n=Count('id'), total=Sum('price_cents', filter=confirmed), last=Max('date'))
+        .filter(n__gte=LOYAL_MIN_BOOKINGS)
+        .order_by('-n', 'customer_phone_key')[:TOP_CUSTOMERS]
+    )
+    return {
+        'status_counts': {status: status_counts.get(status, 0) for status in STATUSES},
+        'revenue_cents': sum(value or 0 for value in daily.values()),
+        'daily_cents': [
+            daily.get(start_date + timedelta(days=offset)) or 0
+            for offset in range((end_date - start_date).days + 1)
+        ],
+        'hour_counts': {hour: n for hour, n in hours.items() if n},
+        'services': [(row['service_id'], row['n'], row['total'] or 0) for row in services],
+        'customers': [
+            (row['customer_phone_key'], row['n'], row['total'] or 0, row['last'])
+            for row in customers
+        ],
+    }
+
+
+def customer_details(bookings, keys):
+    """{chave do telefone: (nome, telefone)} do agendamento mais recente de cada cliente"""
+    details = {}
+    rows = (
+        bookings.filter(customer_phone_key__in=keys)
+        .order_by('customer_phone_key', '-date', '-start_time')
+        .values_list('customer_phone_key', 'customer_name', 'customer_phone')
+    )
+    for key, name, phone in rows:
+        details.setdefault(key, (name, phone))
+    return details
+
+
+def build_report(aggregates, bookings, start_date, end_date):
+    """Contexto do template/PDF a partir dos agregados"""
+    status_counts = aggregates['status_counts']
+    total = sum(status_counts.values())
+    confirmados = status_counts['CONFIRMED']
+    faturamento_total = aggregates['revenue_cents'] / 100
+
+    def percent(count):
+        return count / total * 100 if total else 0
+
+    max_service = aggregates['services'][0][1] if aggregates['services'] else 0
+    servicos_populares = []
+    for service_id, count, cents in aggregates['services']:
+        try:
+            service = service_catalog.get(service_id)
+        except Service.DoesNotExist:
+            continue
+        servicos_populares.append({
+            'service_id': service_id,
+            'name': service.name,
+            'price_real': service.price_real,
+            'agendamentos_count': count,
+            'faturamento_total': cents / 100,
+            'percentage': count / max_service * 100 if max_service else 0,
+        })
+
+    horarios_pico = sorted(aggregates['hour_counts'].items(), key=lambda item: (-item[1], item[0]))[:TOP_HOURS]
+
+    details = customer_details(bookings, [row[0] for row in aggregates['customers']]) if aggregates['customers'] else {}
+    clientes_fieis = []
+    for key, count, cents, last in aggregates['customers']:
+        name, phone = details.get(key, ('', key))
+        clientes_fieis.append({
+            'name': name,
+            'phone': phone,
+            'agendamentos_count': count,
+            'total_gasto': cents / 100,
+            'ultimo_agendamento': last,
+        })
+
+    return {
+        'total_agendamentos': total,
+        'faturamento_total': faturamento_total,
+        'confirmados': confirmados,
+        'taxa_confirmacao': percent(confirmados),
+        'ticket_medio': faturamento_total / confirmados if confirmados else 0,
+        'servicos_populares': servicos_populares,
+        'confirmados_count': confirmados,
+        'pendentes_count': status_counts['PENDING'],
+        'cancelados_count': status_counts['CANCELLED'],
+        'confirmados_percent': percent(confirmados),
+        'pendentes_percent': percent(status_counts['PENDING']),
+        'cancelados_percent': percent(status_counts['CANCELLED']),
+        'horarios_pico': [
+            {'hora': hour, 'agendamentos': count, 'percentage': percent(count)}
+            for hour, count in horarios_pico
+        ],
+        'clientes_fieis': clientes_fieis,
+        'chart_days': [
+            {'date': start_date + timedelta(days=offset), 'faturamento': cents / 100}
+            for offset, cents in enumerate(aggregates['daily_cents'])
+        ],
+    }
+
+
+def period_report(bookings, start_date, end_date, vectorized=None):
+    """
+    Relatório de `bookings` (queryset do negócio) entre as datas, inclusive.
+    `vectorized`: None escolhe NumPy quando instalado.
+    """
+    bookings = bookings.filter(date__range=[start_date, end_date])
+    if vectorized is None:
+        vectorized = numpy_available()
+    if vectorized:
+        aggregates = vectorized_aggregates(load_columns(bookings), start_date, end_date)
+    else:
+        aggregates = orm_aggregates(bookings, start_date, end_date)
+    return build_report(aggregates, bookings, start_date, end_date)
+
+
+def day_summaries(business, days, today=None):
+    """
+    {dia: (agendamentos, confirmados, centavos confirmados)}.
+    Dias anteriores a hoje vêm do cache; os demais, de uma única consulta.
+    """
+    today = today or timezone.localdate()
+    closed = [day for day in days if day < today]
+    versions = day_versions(closed)
+    business_id = business.pk if business else '-'
+    keys = {day: DAY_SUMMARY_KEY.format(business_id, day.isoformat(), versions[day]) for day in closed}
+    cache = chunk_cache()
+    cached = cache.get_many(list(keys.values()))
+    summaries = {day: cached[keys[day]] for day in closed if keys[day] in cached}
+    metrics.inc('cache_requests_total', len(summaries), cache='report_days', result='hit')
+    metrics.inc('cache_requests_total', len(closed) - len(summaries), cache='report_days', result='miss')
+
+    missing = [day for day in days if day not in summaries]
+    if missing:
+        computed = {day: (0, 0, 0) for day in missing}
+        confirmed = Q(status='CONFIRMED')
+        rows = (
+            Booking.objects.for_business(business)
+            .filter(date__range=[min(missing), max(missing)])
+            .order_by()
+            .values('date')
+            .annotate(n=Count('id'), confirmed=Count('id', filter=confirmed), cents=Sum('price_cents', filter=confirmed))
+            .values_list('date', 'n', 'confirmed', 'cents')
+        )
+        for day, count, confirmados, cents in rows:
+            if day in computed:
+                computed[day] = (count, confirmados, cents or 0)
+        cache.set_many({keys[day]: computed[day] for day in missing if day in keys}, timeout=DAY_SUMMARY_TIMEOUT)
+        summaries.update(computed)
+    return summaries
+
+
+def window_totals(business, start_date, end_date, today=None):
+    """Agendamentos, faturamento e ticket médio entre as datas, inclusive"""
+    days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+    summaries = day_summaries(business, days, today).values()
+    total = sum(summary[0] for summary in summaries)
+    confirmados = sum(summary[1] for summary in summaries)
+    faturamento = sum(summary[2] for summary in summaries) / 100
+    return {
+        'total_agendamentos': total,
+        'faturamento_total': faturamento,
+        'ticket_medio': faturamento / confirmados if confirmados else 0,
+    }
+
+
+def variation(current, previous):
+    """Variação percentual inteira; None sem base de comparação"""
+    if not previous:
+        return None
+    return round((current - previous) / previous * 100)
+
+
+def period_comparison(report, business, start_date, end_date, today=None):
+    """
+    Variações do `report` (período atual) sobre a janela anterior de mesmo
+    tamanho, que termina na véspera de `start_date`.
+    """
+    length = (end_date - start_date).days + 1
+    previous = window_totals(
+        business, start_date - timedelta(days=length), start_date - timedelta(days=1), today,
+    )
+    return {
+        'variacao_faturamento': variation(report['faturamento_total'], previous['faturamento_total']),
+        'variacao_agendamentos': variation(report['total_agendamentos'], previous['total_agendamentos']),
+        'variacao_ticket': variation(report['ticket_medio'], previous['ticket_medio']),
+    }
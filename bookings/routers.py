@@ -0,0 +1,93 @@
+"""
+Roteamento de leituras pesadas (relatórios e exportações) para a réplica.
+
+Só as views marcadas com @replica_reads leem da réplica, e só o model
+Booking. Serviços e negócios ficam no primário: o catálogo e o diretório
+de negócios podem recarregar durante um relatório, e linhas atrasadas da
+réplica ficariam em cache para o fluxo de agendamento. Sessões e
+usuários também ficam no primário. Depois de gravar um agendamento, o
+navegador fica preso ao primário por REPLICA_STICKY_SECONDS (cookie
+curto, sem tocar a sessão no banco), para o profissional ver na hora o
+que acabou de alterar mesmo com atraso de replicação.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+REPLICA_ALIAS = 'replica'
+PRIMARY_COOKIE_NAME = 'bookings_primary'
+
+# Leituras desta execução vão para a réplica?
+_reading_from_replica = ContextVar('reading_from_replica', default=False)
+# Houve escrita em Booking nesta requisição? (lista mutável por requisição)
+_booking_writes = ContextVar('booking_writes', default=None)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 15)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Leituras de Booking dentro do bloco vão para a réplica"""
+    token = _reading_from_replica.set(enabled and replica_configured())
+    try:
+        yield
+    finally:
+        _reading_from_replica.reset(token)
+
+
+def pinned_to_primary(request):
+    """O navegador gravou um agendamento há pouco (read-your-writes)"""
+    return PRIMARY_COOKIE_NAME in request.COOKIES
+
+
+def replica_reads_view(view_func):
+    """Views de relatório/exportação: leem da réplica, salvo se presas ao primário"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not replica_configured():
+            return view_func(request, *args, **kwargs)
+        with replica_reads(not pinned_to_primary(request)):
+            return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def track_booking_writes():
+    """Registra se houve escrita em Booking dentro do bloco"""
+    writes = []
+    token = _booking_writes.set(writes)
+    try:
+        yield writes
+    finally:
+        _booking_writes.reset(token)
+
+
+class ReplicaRouter:
+    """Réplica opcional (DATABASE_REPLICA_URL); escritas sempre no primário"""
+
+    def db_for_read(self, model, **hints):
+        if _reading_from_replica.get() and model._meta.label == 'bookings.Booking':
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.label == 'bookings.Booking':
+            writes = _booking_writes.get()
+            if writes is not None and not writes:
+                writes.append(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplica e primário têm os mesmos dados
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -2,10 +2,14 @@
 Serviços para gerenciamento de horários dinâmicos.
 Substitui a necessidade de criar slots manualmente no admin.
 """
-from datetime import datetime, time
+from datetime import datetime, time, timedelta
 from django.conf import settings
+from django.db import transaction
 from django.db.models import Q
-from .models import Booking, Service
+from django.utils import timezone
+from .models import Booking, Service, SlotHold
+from .holds import held_times, all_held_times, is_held_by_other
+from .tracing import traced
 
 
 def parse_times(str_list):
@@ -30,46 +34,101 @@ def list_day_times(date_obj=None):
     return parse_times(defaults)
 
 
-def list_free_times(service: Service, date_obj):
+@traced()
+def list_free_times(service: Service, date_obj, hold_owner=None):
     """
     Retorna horários livres para um serviço específico em uma data.
-    Remove horários já ocupados por bookings PENDING ou CONFIRMED.
+    Remove horários já ocupados por bookings PENDING (não vencidos) ou
+    CONFIRMED e horários segurados (hold ativo) por outros clientes.
     """
     all_times = set(list_day_times(date_obj))
     
     # Buscar horários já ocupados para este serviço e data
-    taken_times = Booking.objects.filter(
+    taken_times = Booking.objects.blocking().filter(
         service=service, 
         date=date_obj, 
-        status__in=['PENDING', 'CONFIRMED']
     ).values_list('start_time', flat=True)
     
-    # Remover horários ocupados dos disponíveis
-    free_times = all_times.difference(set(taken_times))
+    # Remover horários ocupados e segurados dos disponíveis
+    free_times = all_times.difference(set(taken_times), held_times(service, date_obj, hold_owner))
     
     # Retornar ordenado
     return sorted(free_times)
 
 
-def list_all_free_times(date_obj):
+@traced()
+def list_all_free_times(date_obj, hold_owner=None):
     """
     Retorna horários livres considerando TODOS os serviços.
-    Um horário só fica indisponível se estiver ocupado para QUALQUER serviço.
+    Um horário só fica indisponível se estiver ocupado (ou segurado por
+    outro cliente) para QUALQUER serviço.
     """
     all_times = set(list_day_times(date_obj))
     
     # Buscar TODOS os horários ocupados na data (qualquer serviço)
-    taken_times = Booking.objects.filter(
+    taken_times = Booking.objects.blocking().filter(
         date=date_obj, 
-        status__in=['PENDING', 'CONFIRMED']
     ).values_list('start_time', flat=True)
     
-    # Remover horários ocupados dos disponíveis
-    free_times = all_times.difference(set(taken_times))
+    # Remover horários ocupados e segurados dos disponíveis
+    free_times = all_times.difference(set(taken_times), all_held_times(date_obj, hold_owner))
     
     return sorted(free_times)
 
 
+@traced()
+def find_next_available(service: Service, after, limit=5, hold_owner=None,
+                        batch_days=14, max_days=180):
+    """
+    Próximos `limit` horários livres do serviço a partir de `after`.
+    
+    Percorre os dias em lotes de `batch_days`: cada lote custa uma
+    consulta por intervalo de datas em agendamentos ativos e outra em
+    holds, em vez de uma por dia. Para assim que encontra `limit`
+    horários ou após `max_days` dias.
+    
+    Args:
+        after: datetime (horários anteriores a ele no mesmo dia são
+               ignorados) ou date (o dia inteiro é considerado)
+    
+    Returns:
+        list: tuplas (date, time) em ordem cronológica
+    """
+    if isinstance(after, datetime):
+        start_date, min_time = after.date(), after.time()
+    else:
+        start_date, min_time = after, None
+    
+    found = []
+    last_date = start_date + timedelta(days=max_days - 1)
+    batch_start = start_date
+    while batch_start <= last_date and len(found) < limit:
+        batch_end = min(batch_start + timedelta(days=batch_days - 1), last_date)
+        slot_range = dict(service=service, date__range=(batch_start, batch_end))
+        
+        taken = set(Booking.objects.blocking().filter(
+            **slot_range
+        ).values_list('date', 'start_time'))
+        holds = SlotHold.objects.filter(expires_at__gt=timezone.now(), **slot_range)
+        if hold_owner:
+            holds = holds.exclude(owner=hold_owner)
+        taken.update(holds.values_list('date', 'start_time'))
+        
+        day = batch_start
+        while day <= batch_end and len(found) < limit:
+            for slot in list_day_times(day):
+                if day == start_date and min_time is not None and slot <= min_time:
+                    continue
+                if (day, slot) not in taken:
+                    found.append((day, slot))
+                    if len(found) >= limit:
+                        break
+            day += timedelta(days=1)
+        batch_start = batch_end + timedelta(days=1)
+    
+    return found
+
+
 def time_to_string(time_obj):
     """Converte time object para string HH:MM"""
     return time_obj.strftime('%H:%M')
@@ -81,17 +140,38 @@ def string_to_time(time_str):
     return time(hh, mm)
 
 
-def is_time_available(service: Service, date_obj, time_obj):
+@traced()
+def is_time_available(service: Service, date_obj, time_obj, hold_owner=None):
     """
     Verifica se um horário específico está disponível para agendamento.
     Útil para validação atômica antes de criar booking.
+    Holds do próprio cliente (hold_owner) não bloqueiam o horário.
     """
-    return not Booking.objects.filter(
+    booked = Booking.objects.blocking().filter(
         service=service,
         date=date_obj,
         start_time=time_obj,
-        status__in=['PENDING', 'CONFIRMED']
     ).exists()
+    return not booked and not is_held_by_other(service, date_obj, time_obj, hold_owner)
+
+
+def pending_limit_reached(phone, business=None):
+    """
+    O telefone já tem MAX_PENDING_BOOKINGS_PER_PHONE agendamentos
+    pendentes (não vencidos) a partir de hoje (contra reservas falsas em massa).
+    """
+    from .utils import canonical_phone
+    
+    limit = getattr(settings, 'MAX_PENDING_BOOKINGS_PER_PHONE', 3)
+    if not limit:
+        return False
+    pending = Booking.objects.for_business(business).blocking().filter(
+        customer_phone_key=canonical_phone(phone),
+        status='PENDING',
+        date__gte=timezone.localdate(),
+    )
+    # Conta no máximo `limit` linhas
+    return pending[:limit].count() >= limit
 
 
 def calculate_end_time(start_time, duration_minutes):
@@ -104,4 +184,131 @@ def calculate_end_time(start_time, duration_minutes):
     dummy_date = datetime.combine(datetime.today().date(), start_time)
     end_datetime = dummy_date + timedelta(minutes=duration_minutes)
     
-    return end_datetime.time()
\ No newline at end of file
+    return end_datetime.time()
+
+
+def coerce_time(value):
+    """Aceita time ou string 'HH:MM[:SS]' (ex: default do model)"""
+    if isinstance(value, str):
+        return time.fromisoformat(value)
+    return value
+
+
+def fill_booking_fields(bookings):
+    """
+    Calcula end_time, customer_phone_key, business e o snapshot de
+    preço/duração de vários bookings de uma vez.
+    
+    Usado por bulk_create/importações: preços, durações e negócio vêm das
+    tabelas em cache do catálogo (sem consultar Service) e cada combinação
+    (início, duração) é calculada uma única vez para o lote inteiro. O
+    snapshot só é tirado em agendamentos novos ou que trocaram de serviço.
+    """
+    from .catalog import service_catalog
+    from .utils import canonical_phone
+    
+    durations = service_catalog.durations()
+    prices = service_catalog.prices()
+    businesses = service_catalog.business_ids()
+    end_times = {}
+    
+    for booking in bookings:
+        booking.customer_phone_key = canonical_phone(booking.customer_phone)
+        if booking.service_id in businesses:
+            booking.business_id = businesses[booking.service_id]
+        elif booking.service_id:
+            booking.business_id = booking.service.business_id
+        
+        if booking.price_cents is None or getattr(booking, '_snapshot_service_id', booking.service_id) != booking.service_id:
+            if booking.service_id in durations:
+                booking.price_cents = prices[booking.service_id]
+                booking.duration_minutes = durations[booking.service_id]
+            elif booking.service_id:
+                booking.price_cents = booking.service.price_cents
+                booking.duration_minutes = booking.service.duration_minutes
+        
+        if not booking.start_time:
+            continue
+        booking.start_time = coerce_time(booking.start_time)
+        
+        duration = booking.duration_minutes
+        if duration is None:
+            duration = booking.service.duration_minutes
+        
+        key = (booking.start_time, duration)
+        if key not in end_times:
+            end_times[key] = calculate_end_time(booking.start_time, duration)
+        booking.end_time = end_times[key]
+    
+    return bookings
+
+
+def bulk_update_status(booking_ids, new_status, business=None, only_if=None):
+    """
+    Altera o status de vários agendamentos em uma única transação.
+    
+    Trava as linhas (SELECT ... FOR UPDATE), valida cada transição em
+    Booking.STATUS_TRANSITIONS e aplica um único UPDATE ... WHERE id IN (...).
+    Reativar um cancelado só é permitido se o horário continuar livre.
+    Com `business`, IDs de outro negócio são tratados como 'not_found'; com
+    `only_if` (Q), também os que não atendem à condição no momento da trava.
+    
+    Returns:
+        dict: {booking_id: 'updated' | 'unchanged' | 'invalid_transition'
+               | 'slot_taken' | 'not_found'}
+    """
+    from .signals import booking_status_changed
+    
+    results = {}
+    with transaction.atomic():
+        current = {
+            row[0]: row[1:]
+            for row in Booking.objects.for_business(business).select_for_update()
+            .filter(only_if or Q(), id__in=booking_ids)
+            .order_by()
+            .values_list('id', 'status', 'service_id', 'date', 'start_time')
+        }
+        
+        to_update = []
+        for booking_id in booking_ids:
+            if booking_id not in current:
+                results[booking_id] = 'not_found'
+                continue
+            status = current[booking_id][0]
+            if status == new_status:
+                results[booking_id] = 'unchanged'
+            elif new_status not in Booking.STATUS_TRANSITIONS[status]:
+                results[booking_id] = 'invalid_transition'
+            else:
+                results[booking_id] = 'updated'
+                to_update.append(booking_id)
+        
+        # Reativações: conferir horários numa única consulta
+        reactivated = [
+            booking_id for booking_id in to_update
+            if current[booking_id][0] not in Booking.ACTIVE_STATUSES
+        ]
+        if reactivated and new_status in Booking.ACTIVE_STATUSES:
+            slots = {booking_id: current[booking_id][1:] for booking_id in reactivated}
+            condition = Q()
+            for service_id, date_obj, start_time in set(slots.values()):
+                condition |= Q(service_id=service_id, date=date_obj, start_time=start_time)
+            taken = set(
+                Booking.objects.filter(condition, status__in=Booking.ACTIVE_STATUSES)
+                .values_list('service_id', 'date', 'start_time')
+            )
+            for booking_id in reactivated:
+                if slots[booking_id] in taken:
+                    results[booking_id] = 'slot_taken'
+                    to_update.remove(booking_id)
+                else:
+                    taken.add(slots[booking_id])
+        
+        if to_update:
+            Booking.objects.filter(id__in=to_update).update(status=new_status, updated_at=timezone.now())
+            booking_status_changed.send(
+                sender=Booking, booking_ids=to_update, status=new_status,
+                dates={current[booking_id][2] for booking_id in to_update},
+            )
+    
+    return results
@@ -0,0 +1,126 @@
+"""
+Sinais do app bookings: mantêm caches coerentes com o banco.
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+
+from .calendar_feed import feed_days, invalidate_days
+from .catalog import service_catalog
+from .notifications import enqueue, enqueue_status_change
+from . import metrics
+from .models import Booking, Business, Service
+
+# Enviado (dentro da transação) quando status mudam via QuerySet.update,
+# que não dispara post_save. Argumentos: booking_ids, status e,
+# opcionalmente, dates (datas afetadas, quando quem envia já as conhece)
+booking_status_changed = Signal()
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def invalidate_service_catalog(sender, **kwargs):
+    """Qualquer alteração em Service publica nova versão do catálogo"""
+    service_catalog.invalidate()
+
+
+@receiver(post_save, sender=Business)
+@receiver(post_delete, sender=Business)
+def invalidate_tenant_directory(sender, **kwargs):
+    """Domínio/slug alterado: todos os workers recarregam os negócios"""
+    from .tenants import tenant_directory
+    tenant_directory.invalidate()
+
+
+@receiver(booking_status_changed)
+def promote_waitlist_on_cancel(sender, booking_ids, status, **kwargs):
+    """Horários liberados vão para o primeiro da lista de espera"""
+    if status == 'CANCELLED':
+        from .waitlist import promote_for_bookings
+        promote_for_bookings(booking_ids)
+
+
+@receiver(post_save, sender=Booking)
+def promote_waitlist_on_cancelled_save(sender, instance, created, update_fields=None, **kwargs):
+    """Cancelamentos feitos via save() (admin, edição de agendamento)"""
+    if created or instance.status != 'CANCELLED':
+        return
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    from .waitlist import promote_waitlist
+    promote_waitlist([(instance.service_id, instance.date, instance.start_time)])
+
+
+@receiver(booking_status_changed)
+def invalidate_calendar_days_on_status(sender, booking_ids, dates=None, **kwargs):
+    """
+    Dias do feed .ics afetados por mudanças de status em lote.
+    Sem as datas, invalida a janela inteira do feed (só operações de
+    cache, nenhuma consulta extra no caminho de escrita).
+    """
+    invalidate_days(feed_days() if dates is None else dates)
+
+
+@receiver(booking_status_changed)
+def invalidate_report_days_on_status(sender, booking_ids, dates=None, **kwargs):
+    """
+    Resumos de dias encerrados dos relatórios (versões dos dias, as mesmas
+    do feed). Sem as datas, resolve após o commit quais dias foram
+    alterados: uma consulta pela chave primária, fora da transação.
+    """
+    if dates is not None:
+        return
+    
+    def resolve():
+        invalidate_days(set(Booking.objects.filter(id__in=booking_ids).values_list('date', flat=True)))
+    
+    transaction.on_commit(resolve)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_calendar_days(sender, instance, **kwargs):
+    """
+    Dias do feed .ics afetados por save()/delete() de um agendamento,
+    inclusive o dia antigo (Booking._remember_saved_state)
+    """
+    invalidate_days({instance.date, getattr(instance, '_previous_date', None) or instance.date})
+
+
+def status_saved_change(instance, update_fields):
+    """Status anterior, se este save() gravou um status diferente; senão None"""
+    if update_fields is not None and 'status' not in update_fields:
+        return None
+    previous = getattr(instance, '_previous_status', None)
+    return previous if previous not in (None, instance.status) else None
+
+
+@receiver(booking_status_changed)
+def notify_status_change(sender, booking_ids, **kwargs):
+    """Mensagens de mudanças de status feitas via QuerySet.update"""
+    enqueue_status_change(booking_ids)
+
+
+@receiver(post_save, sender=Booking)
+def notify_booking_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Novo agendamento ou status alterado via save() vão para a outbox"""
+    if created:
+        enqueue([instance], 'CONFIRMATION')
+    elif status_saved_change(instance, update_fields):
+        enqueue([instance], 'STATUS')
+
+
+@receiver(booking_status_changed)
+def count_status_change(sender, booking_ids, status, **kwargs):
+    """Cancelamentos em lote (métrica bookings_cancelled_total)"""
+    if status == 'CANCELLED':
+        metrics.inc('bookings_cancelled_total', len(booking_ids))
+
+
+@receiver(post_save, sender=Booking)
+def count_booking_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Criações e cancelamentos via save() (métricas de agendamentos)"""
+    if created:
+        metrics.inc('bookings_created_total')
+    elif instance.status == 'CANCELLED' and status_saved_change(instance, update_fields):
+        metrics.inc('bookings_cancelled_total')
@@ -0,0 +1,101 @@
+"""
+Resolução do negócio (tenant) de cada requisição.
+
+O negócio é identificado, nesta ordem, por:
+  1. link de entrada /n/<slug>/... (guarda o slug na sessão e redireciona)
+  2. domínio próprio (Business.host)
+  3. slug guardado na sessão
+  4. DEFAULT_BUSINESS_SLUG, ou o primeiro negócio cadastrado
+
+Os negócios ficam num diretório local a cada processo, versionado no
+cache compartilhado como o catálogo de serviços: resolver o tenant não
+consulta o banco.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+
+from .catalog import VersionedCache
+from .models import Business
+
+TENANT_VERSION_KEY = 'bookings:tenants:version'
+SESSION_BUSINESS_KEY = 'bookings_business_slug'
+PATH_PREFIX = '/n/'
+
+
+class TenantDirectory(VersionedCache):
+    """Negócios indexados por domínio e por slug"""
+    version_key = TENANT_VERSION_KEY
+    metrics_name = 'tenant_directory'
+
+    def __init__(self, cache_alias='shared'):
+        super().__init__(cache_alias)
+        self._by_id = {}
+        self._by_host = {}
+        self._by_slug = {}
+        self._default = None
+
+    def load(self):
+        businesses = list(Business.objects.order_by('pk'))
+        self._by_id = {b.pk: b for b in businesses}
+        self._by_host = {b.host.lower(): b for b in businesses if b.host}
+        self._by_slug = {b.slug: b for b in businesses}
+        default_slug = getattr(settings, 'DEFAULT_BUSINESS_SLUG', None)
+        self._default = self._by_slug.get(default_slug) or (businesses[0] if businesses else None)
+
+    def get(self, pk):
+        """Negócio pelo id, ou None"""
+        self._ensure_fresh()
+        return self._by_id.get(pk)
+
+    def for_host(self, host):
+        self._ensure_fresh()
+        return self._by_host.get(host.split(':')[0].lower())
+
+    def for_slug(self, slug):
+        self._ensure_fresh()
+        return self._by_slug.get(slug)
+
+    def default(self):
+        """Negócio padrão; None quando não há nenhum (modo de negócio único)"""
+        self._ensure_fresh()
+        return self._default
+
+
+tenant_directory = TenantDirectory()
+
+
+def split_tenant_path(path):
+    """'/n/salao/agenda/' -> ('salao', '/agenda/'); fora do prefixo -> (None, path)"""
+    if not path.startswith(PATH_PREFIX):
+        return None, path
+    slug, _, rest = path[len(PATH_PREFIX):].partition('/')
+    return slug, '/' + rest
+
+
+def resolve_business(request):
+    """Negócio da requisição (sem consultar o banco)"""
+    business = tenant_directory.for_host(request.get_host())
+    if business is None and hasattr(request, 'session'):
+        slug = request.session.get(SESSION_BUSINESS_KEY)
+        business = tenant_directory.for_slug(slug) if slug else None
+    return business or tenant_directory.default()
+
+
+def is_member(user, business):
+    """Profissional pode ver o painel do negócio"""
+    if business is None or user.is_superuser:
+        return True
+    return business.users.filter(pk=user.pk).exists()
+
+
+def business_member_required(view_func):
+    """login_required + o usuário precisa pertencer ao negócio da requisição"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not is_member(request.user, getattr(request, 'business', None)):
+            raise PermissionDenied('Usuário não pertence a este estabelecimento')
+        return view_func(request, *args, **kwargs)
+    return login_required(wrapper)
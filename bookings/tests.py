@@ -1,3 +1,1720 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from importlib import import_module
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.db.migrations.loader import MigrationLoader
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from bookings import middleware
+from bookings.catalog import ServiceCatalog, service_catalog
+from bookings.integrity import legacy_schema_objects
+from bookings.ratelimit import rate_limiter
+from bookings.tenants import tenant_directory
+from bookings.models import Booking, Business, RecurrenceRule, Service, SlotHold, WaitlistEntry
+from bookings.utils import canonical_phone
+
+
+class BookingsTestCase(TestCase):
+    """Base dos testes: evita a página de auto-migração do middleware"""
+
+    def setUp(self):
+        middleware._migrations_completed = True
+        service_catalog.invalidate()
+        tenant_directory.invalidate()
+        tenant_directory.default()  # carregado como num worker já aquecido
+        rate_limiter.reset()
+
+    @contextmanager
+    def assertNumStatements(self, num):
+        """Como assertNumQueries, ignorando SAVEPOINTs do próprio TestCase"""
+        with CaptureQueriesContext(connection) as ctx:
+            yield
+        statements = [q['sql'] for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(len(statements), num, '\n'.join(statements))
+
+
+class ServiceCatalogTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+
+    def test_hot_path_lookups_cost_zero_queries(self):
+        catalog = ServiceCatalog()
+        catalog.all()  # aquecimento
+
+        with self.assertNumQueries(0):
+            self.assertEqual([s.pk for s in catalog.all()], [self.service.pk])
+            self.assertEqual(catalog.first().pk, self.service.pk)
+            self.assertEqual(catalog.get(str(self.service.pk)).name, 'Corte')
+
+    def test_get_invalid_id_raises_does_not_exist(self):
+        with self.assertRaises(Service.DoesNotExist):
+            service_catalog.get('abc')
+        with self.assertRaises(Service.DoesNotExist):
+            service_catalog.get(999999)
+
+    def test_change_in_one_worker_invalidates_the_others(self):
+        # Dois catálogos independentes simulam dois workers do gunicorn
+        worker_a = ServiceCatalog()
+        worker_b = ServiceCatalog()
+        worker_a.all()
+        worker_b.all()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.create(name='Barba', price_cents=3000, duration_minutes=30)
+
+        with self.assertNumQueries(1):
+            names = [s.name for s in worker_b.all()]
+        self.assertEqual(names, ['Barba', 'Corte'])
+
+        self.service.delete()
+        self.assertEqual([s.name for s in worker_a.all()], ['Barba'])
+
+    def test_public_pages_use_catalog(self):
+        service_catalog.all()
+
+        # Apenas horários ocupados e holds ativos chegam ao banco
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('bookings:agenda'), {
+                'service': self.service.pk,
+                'date': '2030-01-07',
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['service'].pk, self.service.pk)
+
+
+class CustomerPhoneKeyTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+
+    def test_canonical_phone_variants_share_a_key(self):
+        variants = [
+            '(11) 99999-8888',
+            '11999998888',
+            '1199998888',
+            '5511999998888',
+            '+55 11 9999-8888',
+            '011999998888',
+        ]
+        self.assertEqual({canonical_phone(v) for v in variants}, {'1199998888'})
+        # Fixo não perde dígitos
+        self.assertEqual(canonical_phone('(11) 3333-4444'), '1133334444')
+
+    def test_key_is_computed_on_save(self):
+        booking = Booking.objects.create(
+            service=self.service, customer_name='Ana', customer_phone='5511999998888',
+            date=date(2030, 1, 7), start_time=time(9, 0),
+        )
+        self.assertEqual(booking.customer_phone_key, '1199998888')
+
+    def test_meus_agendamentos_matches_any_variant(self):
+        Booking.objects.create(
+            service=self.service, customer_name='Ana', customer_phone='11999998888',
+            date=date(2030, 1, 7), start_time=time(9, 0),
+        )
+        for phone in ['5511999998888', '(11) 9999-8888']:
+            response = self.client.get(reverse('bookings:meus_agendamentos'), {'phone': phone})
+            self.assertEqual(len(response.context['bookings']), 1, phone)
+
+    def test_backfill_migration_fills_existing_rows(self):
+        for i in range(3):
+            Booking.objects.create(
+                service=self.service, customer_name=f'C{i}', customer_phone=f'551199999000{i}',
+                date=date(2030, 1, 7), start_time=time(9 + i, 0),
+            )
+        Booking.objects.update(customer_phone_key='')
+
+        migration = import_module('bookings.migrations.0004_backfill_customer_phone_key')
+        self.addCleanup(setattr, migration, 'BATCH_SIZE', migration.BATCH_SIZE)
+        migration.BATCH_SIZE = 2
+        migration.backfill_customer_phone_key(apps, None)
+
+        self.assertEqual(
+            sorted(Booking.objects.values_list('customer_phone_key', flat=True)),
+            ['1199990000', '1199990001', '1199990002'],
+        )
+
+
+class LegacySchemaRemovalTests(TransactionTestCase):
+    # Estado histórico em que Schedule e Booking.time ainda existem
+    legacy_apps = MigrationLoader(None).project_state(('bookings', '0004_backfill_customer_phone_key')).apps
+
+    def setUp(self):
+        self.service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+        self.booking = Booking.objects.create(
+            service=self.service, customer_name='Ana', customer_phone='11999998888',
+            date=date(2030, 1, 7), start_time=time(14, 0),
+        )
+
+    def test_writes_no_longer_touch_legacy_column(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT "time" FROM bookings_booking WHERE id = %s', [self.booking.pk])
+            self.assertIsNone(cursor.fetchone()[0])
+
+    def test_backfill_moves_legacy_time_into_start_time(self):
+        legacy_booking = self.legacy_apps.get_model('bookings', 'Booking')
+        legacy_booking.objects.filter(pk=self.booking.pk).update(
+            time=time(15, 0), start_time=time(9, 0), end_time=None,
+        )
+        migration = import_module('bookings.migrations.0005_stop_legacy_time_writes')
+        migration.backfill_start_time(self.legacy_apps, None)
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.start_time, time(15, 0))
+        self.assertEqual(self.booking.end_time, time(16, 0))
+
+    def test_verify_and_drop_keep_data_intact(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+
+        call_command('verify_bookings', save=path, stdout=open(os.devnull, 'w'))
+        call_command('drop_legacy_schema', stdout=open(os.devnull, 'w'))
+        self.addCleanup(self._restore_legacy_schema)
+        call_command('verify_bookings', compare=path, stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(legacy_schema_objects(), {'schedule_table': False, 'booking_time_column': False})
+        Booking.objects.create(
+            service=self.service, customer_name='Bia', customer_phone='11988887777',
+            date=date(2030, 1, 7), start_time=time(15, 0),
+        )
+        with self.assertRaises(CommandError):
+            call_command('verify_bookings', compare=path, stdout=open(os.devnull, 'w'))
+
+    def test_legacy_snapshot_covers_time_still_in_legacy_column(self):
+        from bookings.integrity import data_snapshot
+
+        self.assertEqual(data_snapshot(legacy_time=True), data_snapshot())
+        legacy_booking = self.legacy_apps.get_model('bookings', 'Booking')
+        legacy_booking.objects.filter(pk=self.booking.pk).update(time=time(15, 0), start_time=time(9, 0))
+        self.assertNotEqual(data_snapshot(legacy_time=True), data_snapshot())
+        with self.assertRaises(CommandError):
+            call_command('drop_legacy_schema', stdout=open(os.devnull, 'w'))
+        self.assertTrue(legacy_schema_objects()['booking_time_column'])
+
+    def _restore_legacy_schema(self):
+        """Recria coluna e tabela legadas para os demais testes"""
+        legacy_booking = self.legacy_apps.get_model('bookings', 'Booking')
+        with connection.schema_editor() as editor:
+            editor.add_field(legacy_booking, legacy_booking._meta.get_field('time'))
+            editor.create_model(self.legacy_apps.get_model('bookings', 'Schedule'))
+
+
+class BookingWritePathTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=90)
+        service_catalog.all()
+        self.user = User.objects.create_user('pro', password='x', is_staff=True)
+
+    def make_booking(self, **kwargs):
+        data = {
+            'service': self.service, 'customer_name': 'Ana', 'customer_phone': '11999998888',
+            'date': date(2030, 1, 7), 'start_time': time(9, 0),
+        }
+        data.update(kwargs)
+        return Booking(**data)
+
+    def test_create_is_a_single_insert(self):
+        booking = self.make_booking()
+        booking.service = Service(pk=self.service.pk)  # relação sem duração carregada
+        # INSERT do agendamento + INSERT da notificação na outbox
+        with self.assertNumQueries(2):
+            booking.save()
+        self.assertEqual(booking.end_time, time(10, 30))
+
+    def test_status_update_with_update_fields_skips_derived_fields(self):
+        booking = self.make_booking()
+        booking.save()
+        booking.status = 'CONFIRMED'
+        # UPDATE só do status + INSERT da notificação (status anterior já em memória)
+        with self.assertNumQueries(2):
+            booking.save(update_fields=['status'])
+
+    def test_reschedule_recomputes_end_time(self):
+        booking = self.make_booking()
+        booking.save()
+        booking.start_time = time(14, 0)
+        booking.save(update_fields=['start_time'])
+        booking.refresh_from_db()
+        self.assertEqual(booking.end_time, time(15, 30))
+
+    def test_update_status_view_is_a_single_update(self):
+        booking = self.make_booking()
+        booking.save()
+        self.client.force_login(self.user)
+        url = reverse('profissional:update_status', args=[booking.pk])
+
+        from bookings.calendar_feed import day_versions
+
+        days = [booking.date, booking.date + timedelta(days=1)]
+        versions = day_versions(days)
+        # sessão + usuário + data + UPDATE + dados da notificação + INSERT na
+        # outbox; nada depois do commit (o dia já é conhecido)
+        with self.assertNumStatements(6), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, json.dumps({'status': 'CONFIRMED'}), content_type='application/json')
+        after = day_versions(days)
+        self.assertNotEqual(after[days[0]], versions[days[0]])
+        self.assertEqual(after[days[1]], versions[days[1]])  # só o dia do agendamento
+        self.assertEqual(response.json()['status_display'], 'Confirmado')
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'CONFIRMED')
+
+        response = self.client.post(
+            reverse('profissional:update_status', args=[999999]),
+            json.dumps({'status': 'CONFIRMED'}), content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_update_status_view_ignores_unchanged_status(self):
+        from bookings.models import Notification
+
+        booking = self.make_booking()
+        booking.save()
+        self.client.force_login(self.user)
+        url = reverse('profissional:update_status', args=[booking.pk])
+        self.client.post(url, json.dumps({'status': 'CONFIRMED'}), content_type='application/json')
+        booking.refresh_from_db()
+        confirmed_at = booking.updated_at
+
+        # Clique duplo: sem UPDATE, sem sinal e sem segunda mensagem
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(url, json.dumps({'status': 'CONFIRMED'}), content_type='application/json')
+        self.assertEqual(response.json()['status'], 'CONFIRMED')
+        self.assertEqual(callbacks, [])
+        booking.refresh_from_db()
+        self.assertEqual(booking.updated_at, confirmed_at)
+        self.assertEqual(Notification.objects.filter(booking=booking, kind='STATUS').count(), 1)
+
+    def test_bulk_create_computes_derived_fields_in_batch(self):
+        bookings = [
+            self.make_booking(start_time=time(9 + i % 8, 0), date=date(2030, 1, 1 + i // 8), customer_phone='5511999998888')
+            for i in range(40)
+        ]
+        # INSERT dos agendamentos + INSERT das confirmações na outbox
+        with self.assertNumQueries(2):
+            Booking.objects.bulk_create(bookings)
+        self.assertTrue(all(b.customer_phone_key == '1199998888' for b in bookings))
+        self.assertEqual(bookings[0].end_time, time(10, 30))
+
+
+class BulkStatusTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+        self.user = User.objects.create_user('pro', password='x', is_staff=True)
+        self.client.force_login(self.user)
+        self.pending = [
+            Booking.objects.create(
+                service=service, customer_name=f'C{i}', customer_phone='11999998888',
+                date=date(2030, 1, 7), start_time=time(9 + i, 0),
+            )
+            for i in range(3)
+        ]
+        self.cancelled = Booking.objects.create(
+            service=service, customer_name='X', customer_phone='11999998888',
+            date=date(2030, 1, 7), start_time=time(15, 0), status='CANCELLED',
+        )
+        self.url = reverse('profissional:bulk_update_status')
+
+    def post(self, payload):
+        return self.client.post(self.url, json.dumps(payload), content_type='application/json')
+
+    def test_applies_valid_transitions_and_reports_per_id(self):
+        ids = [b.pk for b in self.pending] + [self.cancelled.pk, 999999]
+        response = self.post({'ids': ids, 'status': 'CANCELLED'})
+
+        data = response.json()
+        self.assertEqual(data['updated'], 3)
+        self.assertEqual(data['results'][str(self.cancelled.pk)], 'unchanged')
+        self.assertEqual(data['results']['999999'], 'not_found')
+        self.assertEqual(Booking.objects.filter(status='CANCELLED').count(), 4)
+
+    def test_rejects_invalid_transition(self):
+        response = self.post({'ids': [self.cancelled.pk], 'status': 'PENDING'})
+        self.assertEqual(response.json()['results'][str(self.cancelled.pk)], 'invalid_transition')
+        self.cancelled.refresh_from_db()
+        self.assertEqual(self.cancelled.status, 'CANCELLED')
+
+    def test_single_select_and_single_update(self):
+        from bookings.services import bulk_update_status
+
+        # SELECT + UPDATE, e mais um SELECT e um INSERT para a outbox
+        with self.assertNumStatements(4):
+            bulk_update_status([b.pk for b in self.pending], 'CONFIRMED')
+
+    def test_validates_payload(self):
+        self.assertEqual(self.post({'ids': [], 'status': 'CONFIRMED'}).status_code, 400)
+        self.assertEqual(self.post({'ids': ['a'], 'status': 'CONFIRMED'}).status_code, 400)
+        self.assertEqual(self.post({'ids': [1], 'status': 'DONE'}).status_code, 400)
+
+
+class BookingAdminTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('root', 'root@example.com', 'x')
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:bookings_booking_changelist')
+
+    def seed(self, count):
+        from bookings.benchmarks import seed_bookings, seed_services
+        seed_bookings(count, seed_services(), start=date(2030, 1, 1))
+
+    def test_changelist_query_count_does_not_grow_with_rows(self):
+        self.seed(5)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.url)
+        Booking.objects.all().delete()
+        self.seed(100)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(self.url)
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+    def test_numeric_search_uses_canonical_phone_prefix(self):
+        service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+        Booking.objects.create(
+            service=service, customer_name='Ana', customer_phone='11999998888',
+            date=date(2030, 1, 7), start_time=time(9, 0),
+        )
+        response = self.client.get(self.url, {'q': '+55 11 99999-8888'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response = self.client.get(self.url, {'q': '2199'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+    def test_partial_phone_search_matches_prefix_only(self):
+        service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+        Booking.objects.create(
+            service=service, customer_name='Ana', customer_phone='11988887777',
+            date=date(2030, 1, 7), start_time=time(9, 0),
+        )
+        # Prefixo com e sem o nono dígito (a chave guarda 1188887777)
+        for term in ['1198888', '118888']:
+            response = self.client.get(self.url, {'q': term})
+            self.assertEqual(response.context['cl'].result_count, 1, term)
+        # O final do número não é buscado (LIKE '%…' sem índice)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, {'q': '87777'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+        self.assertFalse(any("LIKE '%" in query['sql'] for query in ctx.captured_queries))
+
+
+class WaitlistTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+        self.user = User.objects.create_user('pro', password='x', is_staff=True)
+        self.booking = Booking.objects.create(
+            service=self.service, customer_name='Ana', customer_phone='11999998888',
+            date=date(2030, 1, 7), start_time=time(9, 0),
+        )
+
+    def join(self, name, phone):
+        from bookings.waitlist import join_waitlist
+        return join_waitlist(self.service, date(2030, 1, 7), time(9, 0), name, phone)
+
+    def test_taken_slot_offers_waitlist_and_join_is_idempotent(self):
+        response = self.client.post(reverse('bookings:reservar'), {
+            'service_id': self.service.pk, 'date': '2030-01-07', 'time': '09:00',
+            'name': 'Bia', 'phone': '(11) 98888-7777',
+        })
+        self.assertEqual(response.status_code, 409)
+        self.assertTemplateUsed(response, 'bookings/lista_espera.html')
+
+        data = {'service_id': self.service.pk, 'date': '2030-01-07', 'time': '09:00',
+                'name': 'Bia', 'phone': '11988887777'}
+        self.client.post(reverse('bookings:lista_espera'), data)
+        self.client.post(reverse('bookings:lista_espera'), data)
+        self.assertEqual(WaitlistEntry.objects.filter(status='WAITING').count(), 1)
+
+    def test_cancellation_promotes_first_in_line(self):
+        first, _ = self.join('Bia', '11988887777')
+        self.join('Caio', '11977776666')
+
+        self.client.force_login(self.user)
+        self.client.post(
+            reverse('profissional:update_status', args=[self.booking.pk]),
+            json.dumps({'status': 'CANCELLED'}), content_type='application/json',
+        )
+
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'PROMOTED')
+        self.assertEqual(first.booking.customer_name, 'Bia')
+        self.assertEqual(first.booking.status, 'PENDING')
+        self.assertEqual(WaitlistEntry.objects.filter(status='WAITING').count(), 1)
+
+    def test_bulk_cancellation_promotes_each_slot(self):
+        from bookings.services import bulk_update_status
+
+        other = Booking.objects.create(
+            service=self.service, customer_name='Dani', customer_phone='11966665555',
+            date=date(2030, 1, 7), start_time=time(10, 0),
+        )
+        self.join('Bia', '11988887777')
+        bulk_update_status([self.booking.pk, other.pk], 'CANCELLED')
+
+        active = Booking.objects.filter(status__in=Booking.ACTIVE_STATUSES)
+        self.assertEqual(list(active.values_list('customer_name', flat=True)), ['Bia'])
+
+    def test_reactivation_of_refilled_slot_is_rejected(self):
+        from bookings.services import bulk_update_status
+
+        self.join('Bia', '11988887777')
+        bulk_update_status([self.booking.pk], 'CANCELLED')
+        results = bulk_update_status([self.booking.pk], 'CONFIRMED')
+        self.assertEqual(results[self.booking.pk], 'slot_taken')
+
+
+class SlotHoldTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+        self.slot = {'service_id': self.service.pk, 'date': '2030-01-07', 'time': '09:00'}
+        self.other = self.client_class()
+
+    def hold(self, client):
+        return client.post(reverse('bookings:segurar_horario'), self.slot)
+
+    def free_times(self, client):
+        response = client.get(reverse('bookings:agenda'), {'service': self.service.pk, 'date': '2030-01-07'})
+        return response.context['free_times']
+
+    def test_hold_hides_slot_from_other_customers_only(self):
+        self.assertEqual(self.hold(self.client).status_code, 200)
+
+        self.assertIn(time(9, 0), self.free_times(self.client))
+        self.assertNotIn(time(9, 0), self.free_times(self.other))
+        self.assertEqual(self.hold(self.other).status_code, 409)
+
+    def test_holder_books_and_others_are_blocked(self):
+        self.hold(self.client)
+        form = {'service_id': self.service.pk, 'date': '2030-01-07', 'time': '09:00',
+                'name': 'Bia', 'phone': '11988887777'}
+
+        response = self.other.post(reverse('bookings:reservar'), dict(form, name='Caio'))
+        self.assertEqual(response.status_code, 409)
+
+        self.client.post(reverse('bookings:reservar'), form)
+        self.assertEqual(Booking.objects.get().customer_name, 'Bia')
+        self.assertFalse(SlotHold.objects.exists())
+
+    def test_expired_hold_is_free_and_reclaimed(self):
+        from bookings.holds import hold_metrics, sweep_expired_holds
+
+        before = hold_metrics()
+        self.hold(self.client)
+        SlotHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertIn(time(9, 0), self.free_times(self.other))
+        self.assertEqual(self.hold(self.other).status_code, 200)
+        self.assertEqual(hold_metrics()['expired'] - before['expired'], 1)
+
+        SlotHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(sweep_expired_holds(), 1)
+        self.assertFalse(SlotHold.objects.exists())
+
+    def test_conflicts_are_counted(self):
+        from bookings.holds import hold_metrics
+
+        before = hold_metrics()
+        self.hold(self.client)
+        self.hold(self.other)
+        after = hold_metrics()
+        self.assertEqual(after['created'] - before['created'], 1)
+        self.assertEqual(after['conflicted'] - before['conflicted'], 1)
+
+
+class RecurrenceTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+
+    def rule(self, **kwargs):
+        fields = dict(service=self.service, customer_name='Ana', customer_phone='(11) 98888-7777',
+                      start_date=date(2030, 1, 7), start_time=time(9, 0), frequency='WEEKLY')
+        fields.update(kwargs)
+        return RecurrenceRule.objects.create(**fields)
+
+    def test_expand_occurrences(self):
+        from bookings.recurrence import expand_occurrences
+
+        weekly = expand_occurrences(self.rule(until=date(2030, 1, 28)))
+        self.assertEqual(weekly, [date(2030, 1, 7), date(2030, 1, 14), date(2030, 1, 21), date(2030, 1, 28)])
+        biweekly = expand_occurrences(self.rule(frequency='BIWEEKLY', count=3))
+        self.assertEqual(biweekly, [date(2030, 1, 7), date(2030, 1, 21), date(2030, 2, 4)])
+        monthly = expand_occurrences(self.rule(frequency='MONTHLY', start_date=date(2030, 1, 31), count=3))
+        self.assertEqual(monthly, [date(2030, 1, 31), date(2030, 2, 28), date(2030, 3, 31)])
+
+    def test_year_of_weekly_bookings_skips_conflicts(self):
+        from bookings.models import Notification
+        from bookings.recurrence import create_recurring_bookings
+
+        Booking.objects.create(service=self.service, customer_name='Outro', customer_phone='11977776666',
+                               date=date(2030, 1, 14), start_time=time(9, 0))
+        SlotHold.objects.create(service=self.service, date=date(2030, 1, 21), start_time=time(9, 0),
+                                owner='x', expires_at=timezone.now() + timedelta(minutes=5))
+        rule = self.rule(count=52)
+
+        # Duas consultas de conflito, um INSERT em lote e um na outbox
+        with self.assertNumStatements(4):
+            created, skipped = create_recurring_bookings(rule)
+
+        self.assertEqual(skipped, [date(2030, 1, 14), date(2030, 1, 21)])
+        self.assertEqual(len(created), 50)
+        self.assertEqual(rule.bookings.count(), 50)
+        self.assertEqual(Notification.objects.filter(kind='CONFIRMATION', booking__recurrence=rule).count(), 50)
+        booking = rule.bookings.order_by('date').first()
+        self.assertEqual(booking.customer_phone, '11988887777')
+        self.assertEqual(booking.end_time, time(10, 0))
+
+    def test_endpoint_reports_created_and_skipped(self):
+        user = User.objects.create_user('pro', password='x', is_staff=True)
+        self.client.force_login(user)
+        Booking.objects.create(service=self.service, customer_name='Outro', customer_phone='11977776666',
+                               date=date(2030, 1, 14), start_time=time(9, 0))
+
+        response = self.client.post(reverse('profissional:criar_recorrencia'), json.dumps({
+            'service_id': self.service.pk, 'customer_name': 'Ana', 'customer_phone': '11988887777',
+            'start_date': '2030-01-07', 'start_time': '09:00', 'frequency': 'WEEKLY', 'until': '2030-01-28',
+        }), content_type='application/json')
+
+        data = response.json()
+        self.assertEqual(data['created'], ['2030-01-07', '2030-01-21', '2030-01-28'])
+        self.assertEqual(data['skipped'], ['2030-01-14'])
+        self.assertFalse(data['limit_reached'])
+
+    def test_endpoint_rejects_or_reports_the_occurrence_limit(self):
+        from bookings.recurrence import MAX_OCCURRENCES
+
+        self.client.force_login(User.objects.create_user('pro', password='x', is_staff=True))
+        url = reverse('profissional:criar_recorrencia')
+        body = {'service_id': self.service.pk, 'customer_name': 'Ana', 'customer_phone': '11988887777',
+                'start_date': '2030-01-07', 'start_time': '09:00', 'frequency': 'WEEKLY'}
+
+        response = self.client.post(url, json.dumps(dict(body, count=MAX_OCCURRENCES + 1)), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(RecurrenceRule.objects.exists())
+
+        # Sem count nem until: cria o máximo e avisa que houve corte
+        data = self.client.post(url, json.dumps(body), content_type='application/json').json()
+        self.assertEqual(len(data['created']), MAX_OCCURRENCES)
+        self.assertTrue(data['limit_reached'])
+        self.assertIn(f'limite de {MAX_OCCURRENCES}', data['message'])
+
+    def test_endpoint_answers_conflict_when_the_retry_also_fails(self):
+        from bookings.expiry import stale_cutoff
+
+        # PENDENTE vencido no passado: não bloqueia a leitura nem é
+        # cancelado pela nova tentativa, mas ainda ocupa o índice único
+        stale = Booking.objects.create(service=self.service, customer_name='Outro', customer_phone='11977776666',
+                                       date=date(2020, 1, 13), start_time=time(9, 0))
+        Booking.objects.filter(pk=stale.pk).update(updated_at=stale_cutoff() - timedelta(hours=1))
+        self.client.force_login(User.objects.create_user('pro', password='x', is_staff=True))
+
+        response = self.client.post(reverse('profissional:criar_recorrencia'), json.dumps({
+            'service_id': self.service.pk, 'customer_name': 'Ana', 'customer_phone': '11988887777',
+            'start_date': '2020-01-06', 'start_time': '09:00', 'frequency': 'WEEKLY', 'count': 3,
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(RecurrenceRule.objects.exists())
+
+
+class NextAvailableTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+
+    def book(self, day, times):
+        Booking.objects.bulk_create([
+            Booking(service=self.service, customer_name='Ana', customer_phone='11988887777',
+                    date=day, start_time=t)
+            for t in times
+        ])
+
+    def test_skips_full_days_with_one_query_per_batch(self):
+        from bookings.services import find_next_available, list_day_times
+
+        start = date(2030, 1, 7)
+        grid = list_day_times(start)
+        for offset in range(20):
+            self.book(start + timedelta(days=offset), grid)
+        self.book(start + timedelta(days=20), grid[:2])
+
+        # Dois lotes de 14 dias: duas consultas em bookings e duas em holds
+        with self.assertNumQueries(4):
+            slots = find_next_available(self.service, start, limit=2)
+        self.assertEqual(slots, [(start + timedelta(days=20), grid[2]), (start + timedelta(days=20), grid[3])])
+
+    def test_ignores_earlier_times_and_held_slots(self):
+        from bookings.services import find_next_available
+
+        day = date(2030, 1, 7)
+        SlotHold.objects.create(service=self.service, date=day, start_time=time(14, 0), owner='outro',
+                                expires_at=timezone.now() + timedelta(minutes=5))
+        slots = find_next_available(self.service, datetime.combine(day, time(10, 30)), limit=2)
+        self.assertEqual(slots, [(day, time(11, 0)), (day, time(15, 0))])
+
+        own = find_next_available(self.service, datetime.combine(day, time(10, 30)), limit=2, hold_owner='outro')
+        self.assertEqual(own, [(day, time(11, 0)), (day, time(14, 0))])
+
+    def test_endpoint(self):
+        response = self.client.get(reverse('bookings:proximos_horarios'),
+                                   {'service_id': self.service.pk, 'limit': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['slots']), 3)
+        self.assertEqual(self.client.get(reverse('bookings:proximos_horarios'),
+                                         {'service_id': 'x'}).status_code, 400)
+
+
+class CalendarFeedTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        from bookings.calendar_feed import feed_token_for
+
+        self.service = Service.objects.create(name='Corte, Barba', price_cents=5000, duration_minutes=60)
+        self.user = User.objects.create_user('pro', password='x', is_staff=True)
+        self.url = reverse('profissional:calendario_ics', args=[feed_token_for(self.user)])
+        self.day = timezone.localdate() + timedelta(days=1)
+        self.booking = Booking.objects.create(service=self.service, customer_name='Ana', customer_phone='11988887777',
+                                              date=self.day, start_time=time(9, 0), status='CONFIRMED')
+
+    def test_feed_content_and_token(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn(f'UID:booking-{self.booking.pk}@agendamento', body)
+        self.assertIn('SUMMARY:Corte\\, Barba - Ana', body)
+        self.assertIn('LAST-MODIFIED:', body)
+        self.assertTrue(body.endswith('END:VCALENDAR\r\n'))
+
+        bad = reverse('profissional:calendario_ics', args=['invalido'])
+        self.assertEqual(self.client.get(bad).status_code, 404)
+
+    def test_conditional_get_and_per_day_invalidation(self):
+        etag = self.client.get(self.url)['ETag']
+
+        # Sem mudanças: 304 só com a checagem do token, sem renderizar
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        other_day = self.day + timedelta(days=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(service=self.service, customer_name='Bia', customer_phone='11977776666',
+                                   date=other_day, start_time=time(10, 0))
+        # Só o dia alterado volta ao banco: token + uma consulta de agendamentos
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('STATUS:TENTATIVE', response.content.decode())
+
+    def test_status_change_removes_event(self):
+        from bookings.services import bulk_update_status
+
+        self.client.get(self.url)
+        bulk_update_status([self.booking.pk], 'CANCELLED')
+        self.assertNotIn('UID:booking-', self.client.get(self.url).content.decode())
+
+
+class NotificationTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+        self.tomorrow = timezone.localdate() + timedelta(days=1)
+
+    def book(self, **kwargs):
+        fields = dict(service=self.service, customer_name='Ana', customer_phone='11988887777',
+                      date=self.tomorrow, start_time=time(9, 0))
+        fields.update(kwargs)
+        return Booking.objects.create(**fields)
+
+    def test_booking_changes_are_queued_once(self):
+        from bookings.models import Notification
+        from bookings.notifications import enqueue
+        from bookings.services import bulk_update_status
+
+        booking = self.book()
+        bulk_update_status([booking.pk], 'CONFIRMED')
+        booking.refresh_from_db()
+        confirmed_at = booking.updated_at
+        booking.customer_name = 'Ana Maria'
+        booking.save()  # status igual: nada a avisar
+        self.assertEqual(
+            sorted(Notification.objects.values_list('dedup_key', flat=True)),
+            [f'confirmation:{booking.pk}', f'status:{booking.pk}:CONFIRMED:{confirmed_at.isoformat()}'],
+        )
+
+        # Reenfileirar a mesma transição não duplica
+        booking.status, booking.updated_at = 'CONFIRMED', confirmed_at
+        enqueue([booking], 'STATUS')
+        self.assertEqual(Notification.objects.filter(kind='STATUS').count(), 1)
+
+    def test_repeated_transition_is_notified_again(self):
+        from bookings.models import Notification
+        from bookings.services import bulk_update_status
+
+        booking = self.book()
+        for status in ('CONFIRMED', 'PENDING', 'CONFIRMED'):
+            bulk_update_status([booking.pk], status)
+        booking.refresh_from_db()
+        for status in ('PENDING', 'CONFIRMED'):
+            booking.status = status
+            booking.save(update_fields=['status'])
+        messages = Notification.objects.filter(kind='STATUS').order_by('id').values_list('message', flat=True)
+        # Voltar a PENDENTE não gera mensagem; as duas confirmações, sim
+        self.assertEqual([('confirmado' in message) for message in messages], [True, True, True])
+
+    def test_save_compares_with_loaded_state_without_selecting_again(self):
+        from bookings.calendar_feed import day_versions
+        from bookings.models import Notification
+
+        booking = Booking.objects.get(pk=self.book().pk)
+        old_day, new_day = self.tomorrow, self.tomorrow + timedelta(days=1)
+        versions = day_versions([old_day, new_day])
+        booking.date, booking.status = new_day, 'CONFIRMED'
+        # UPDATE + INSERT da notificação, sem reler data/status anteriores
+        with self.assertNumQueries(2):
+            booking.save(update_fields=['date', 'status'])
+        after = day_versions([old_day, new_day])
+        self.assertNotEqual(after[old_day], versions[old_day])
+        self.assertNotEqual(after[new_day], versions[new_day])
+        self.assertEqual(Notification.objects.filter(kind='STATUS').count(), 1)
+
+        booking.customer_name = 'Ana Maria'
+        booking.save(update_fields=['customer_name'])
+        self.assertEqual(Notification.objects.filter(kind='STATUS').count(), 1)
+
+    def test_settings_page_reflects_notifications_enabled(self):
+        self.client.force_login(User.objects.create_user('pro', password='x', is_staff=True))
+        with override_settings(NOTIFICATIONS_ENABLED=False):
+            response = self.client.get(reverse('profissional:configuracoes'))
+        self.assertFalse(response.context['email_notifications'])
+        self.assertNotContains(response, 'id="emailNotif" checked')
+
+    def test_reminders_use_one_range_query_and_do_not_duplicate(self):
+        from bookings.models import Notification
+        from bookings.notifications import enqueue_reminders
+
+        for hour in (9, 10, 11):
+            self.book(start_time=time(hour, 0))
+        self.book(start_time=time(14, 0), status='CANCELLED')
+        self.book(date=self.tomorrow + timedelta(days=1))
+
+        # Uma consulta por intervalo e um INSERT em lote
+        with self.assertNumStatements(2):
+            self.assertEqual(enqueue_reminders(), 3)
+        enqueue_reminders()
+        self.assertEqual(Notification.objects.filter(kind='REMINDER').count(), 3)
+
+    def test_worker_retries_with_backoff_then_fails(self):
+        from bookings.models import Notification
+        from bookings.notifications import Transport, process_outbox
+
+        class BrokenTransport(Transport):
+            def send(self, notification):
+                raise ConnectionError('fora do ar')
+
+        self.book()
+        with self.settings(NOTIFICATION_MAX_ATTEMPTS=2, NOTIFICATION_RETRY_SECONDS=60):
+            self.assertEqual(process_outbox(transport=BrokenTransport())['retried'], 1)
+            notification = Notification.objects.get()
+            self.assertEqual(notification.attempts, 1)
+            self.assertGreater(notification.next_attempt_at, timezone.now() + timedelta(seconds=50))
+
+            # Ainda esperando: nada a enviar
+            self.assertEqual(process_outbox(transport=BrokenTransport())['retried'], 0)
+
+            Notification.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(process_outbox(transport=BrokenTransport())['failed'], 1)
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.last_error), ('FAILED', 'fora do ar'))
+
+    def test_file_transport_and_cancelled_reminder_skipped(self):
+        from bookings.models import Notification
+        from bookings.notifications import FileTransport, enqueue_reminders, process_outbox
+
+        fd, path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+
+        booking = self.book()
+        enqueue_reminders()
+        Booking.objects.filter(pk=booking.pk).update(status='CANCELLED')
+
+        counts = process_outbox(transport=FileTransport(path))
+        self.assertEqual((counts['sent'], counts['skipped']), (1, 1))
+        with open(path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line['kind'] for line in lines], ['CONFIRMATION'])
+        self.assertEqual(Notification.objects.get(kind='REMINDER').status, 'SKIPPED')
+
+
+class TenantTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.salao = Business.objects.create(name='Salão A', slug='salao-a', host='a.example.com',
+                                             whatsapp_number='5511911110000')
+        self.barbearia = Business.objects.create(name='Barbearia B', slug='barbearia-b')
+        self.corte = Service.objects.create(business=self.salao, name='Corte', price_cents=5000, duration_minutes=60)
+        self.barba = Service.objects.create(business=self.barbearia, name='Barba', price_cents=3000, duration_minutes=30)
+        self.day = date(2030, 1, 7)
+
+    def test_booking_inherits_business_from_service(self):
+        booking = Booking.objects.create(service=self.barba, customer_name='Ana', customer_phone='11988887777',
+                                         date=self.day, start_time=time(9, 0))
+        self.assertEqual(booking.business_id, self.barbearia.pk)
+        booking.service = self.corte
+        booking.save(update_fields=['service'])
+        booking.refresh_from_db()
+        self.assertEqual(booking.business_id, self.salao.pk)
+
+    def test_resolution_by_host_path_and_default(self):
+        response = self.client.get(reverse('bookings:home'), HTTP_HOST='a.example.com')
+        self.assertEqual([s.name for s in response.context['services']], ['Corte'])
+
+        # Link de entrada guarda o negócio na sessão
+        response = self.client.get('/n/barbearia-b/agenda/?date=2030-01-07')
+        self.assertRedirects(response, '/agenda/?date=2030-01-07', fetch_redirect_response=False)
+        response = self.client.get(reverse('bookings:home'))
+        self.assertEqual([s.name for s in response.context['services']], ['Barba'])
+
+        self.assertEqual(self.client.get('/n/inexistente/').status_code, 404)
+
+    def test_resolution_costs_no_queries_once_loaded(self):
+        from bookings.tenants import resolve_business
+        from django.test import RequestFactory
+
+        request = RequestFactory().get('/', HTTP_HOST='a.example.com')
+        resolve_business(request)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_business(request), self.salao)
+
+    def test_public_views_do_not_leak_other_businesses(self):
+        other = Booking.objects.create(service=self.barba, customer_name='Bia', customer_phone='11988887777',
+                                       date=self.day, start_time=time(9, 0))
+        response = self.client.get(reverse('bookings:meus_agendamentos'), {'phone': '11988887777'},
+                                   HTTP_HOST='a.example.com')
+        self.assertEqual(list(response.context['bookings']), [])
+        response = self.client.get(reverse('bookings:whatsapp_redirect', args=[other.pk]), HTTP_HOST='a.example.com')
+        self.assertEqual(response.status_code, 404)
+
+        mine = Booking.objects.create(service=self.corte, customer_name='Ana', customer_phone='11977776666',
+                                      date=self.day, start_time=time(9, 0))
+        response = self.client.get(reverse('bookings:whatsapp_redirect', args=[mine.pk]), HTTP_HOST='a.example.com')
+        self.assertTrue(response['Location'].startswith('https://wa.me/5511911110000'))
+
+    def test_professional_panel_requires_membership(self):
+        user = User.objects.create_user('pro', password='x', is_staff=True)
+        self.salao.users.add(user)
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('profissional:dashboard'), HTTP_HOST='a.example.com').status_code, 200)
+
+        self.client.get('/n/barbearia-b/')
+        self.assertEqual(self.client.get(reverse('profissional:dashboard')).status_code, 403)
+
+    def test_business_indexes_keep_unscoped_counterparts(self):
+        # Admin do Django, lembretes e o modo de negócio único não filtram por negócio
+        fields = [index.fields for index in Booking._meta.indexes if index.condition is None]
+        for index_fields in fields:
+            if index_fields[0] == 'business':
+                self.assertIn(index_fields[1:], fields)
+
+    def test_admin_edit_is_scoped_to_business(self):
+        from django.http import Http404
+        from django.test import RequestFactory
+        from bookings import views
+
+        other = Booking.objects.create(service=self.barba, customer_name='Bia', customer_phone='11988887777',
+                                       date=self.day, start_time=time(9, 0))
+        request = RequestFactory().get('/')
+        request.user = User.objects.create_user('pro', password='x', is_staff=True)
+        request.business = self.salao
+        with self.assertRaises(Http404):
+            views.admin_editar_booking(request, other.pk)
+
+
+class ReplicaRoutingTests(BookingsTestCase):
+    """'replica' nos testes é uma segunda base SQLite, vazia: o que for lido dela não aparece"""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        self.business = Business.objects.create(name='Salão', slug='salao')
+        self.user = User.objects.create_user('pro', password='x', is_staff=True)
+        self.business.users.add(self.user)
+        service = Service.objects.create(business=self.business, name='Corte', price_cents=5000, duration_minutes=60)
+        self.booking = Booking.objects.create(service=service, customer_name='Ana', customer_phone='11988887777',
+                                              date=date(2030, 1, 7), start_time=time(9, 0))
+        self.client.force_login(self.user)
+        self.export_url = reverse('profissional:exportar_csv') + '?start_date=2030-01-01&end_date=2030-01-31'
+
+    def test_reports_read_from_replica_until_a_booking_is_written(self):
+        self.assertNotIn('Ana', self.client.get(self.export_url).content.decode())
+
+        response = self.client.post(reverse('profissional:update_status', args=[self.booking.pk]),
+                                    json.dumps({'status': 'CONFIRMED'}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        # Quem acabou de gravar lê do primário (read-your-writes)
+        self.assertIn('Ana', self.client.get(self.export_url).content.decode())
+
+    def test_writes_and_other_views_use_the_primary(self):
+        from bookings.routers import ReplicaRouter, replica_reads
+
+        router = ReplicaRouter()
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Booking), 'replica')
+            self.assertIsNone(router.db_for_read(User))
+            # Catálogo e diretório de negócios não podem guardar linhas atrasadas
+            self.assertIsNone(router.db_for_read(Service))
+            self.assertIsNone(router.db_for_read(Business))
+            self.assertEqual(router.db_for_write(Booking), 'default')
+        self.assertIsNone(router.db_for_read(Booking))
+
+        response = self.client.get(reverse('profissional:agenda_data', args=['2030-01-07']))
+        self.assertContains(response, 'Ana')
+
+
+class ReservationIdempotencyTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.corte = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+        self.barba = Service.objects.create(name='Barba', price_cents=3000, duration_minutes=30)
+        response = self.client.get(reverse('bookings:agenda'), {'service': self.corte.pk, 'date': '2030-01-07'})
+        self.key = response.context['reservation_key']
+        self.form = {'service_id': self.corte.pk, 'date': '2030-01-07', 'time': '09:00',
+                     'name': 'Bia', 'phone': '11988887777', 'reservation_key': self.key}
+
+    def test_resubmission_returns_original_booking_without_writing(self):
+        first = self.client.post(reverse('bookings:reservar'), self.form)
+        booking = Booking.objects.get()
+        self.assertRedirects(first, reverse('bookings:whatsapp_redirect', args=[booking.pk]),
+                             fetch_redirect_response=False)
+
+        # Reenvio, mesmo que para outro serviço no mesmo horário
+        with CaptureQueriesContext(connection) as ctx:
+            again = self.client.post(reverse('bookings:reservar'), dict(self.form, service_id=self.barba.pk))
+        self.assertEqual(again.url, first.url)
+        self.assertFalse([q for q in ctx.captured_queries if 'bookings_booking' in q['sql']])
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_failed_submission_releases_the_key(self):
+        self.client.post(reverse('bookings:reservar'), dict(self.form, phone='123'))
+        self.assertFalse(Booking.objects.exists())
+
+        self.client.post(reverse('bookings:reservar'), self.form)
+        self.assertEqual(Booking.objects.get().customer_name, 'Bia')
+
+    def test_claim_is_exclusive_and_expired_claims_can_be_retaken(self):
+        from bookings import idempotency
+        from bookings.models import ReservationKey
+
+        self.assertIsNone(idempotency.claim(self.key))
+        self.assertEqual(idempotency.claim(self.key), idempotency.IN_FLIGHT)
+
+        # POST abandonado: depois do prazo, um único reenvio retoma a chave
+        ReservationKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(idempotency.claim(self.key))
+        self.assertEqual(idempotency.claim(self.key), idempotency.IN_FLIGHT)
+
+        ReservationKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(idempotency.sweep_expired_keys(), 1)
+
+    def test_without_key_each_post_is_processed(self):
+        form = dict(self.form)
+        del form['reservation_key']
+        self.client.post(reverse('bookings:reservar'), form)
+        self.client.post(reverse('bookings:reservar'), dict(form, service_id=self.barba.pk))
+        self.assertEqual(Booking.objects.count(), 2)
+
+
+class RateLimitTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+
+    def test_token_bucket_refills_over_time(self):
+        from bookings.ratelimit import take_token
+
+        state = None
+        for _ in range(3):
+            allowed, state, _ = take_token(state, 100.0, capacity=3, period=60)
+            self.assertTrue(allowed)
+        allowed, state, retry_after = take_token(state, 100.0, capacity=3, period=60)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 20.0)
+        # 20s depois volta uma ficha
+        self.assertTrue(take_token(state, 120.0, capacity=3, period=60)[0])
+
+    def test_lookups_are_limited_by_ip_and_by_phone(self):
+        url = reverse('bookings:meus_agendamentos')
+        with self.settings(RATE_LIMITS={'bookings:meus_agendamentos': {'ip': '3/m', 'phone': '2/m'}}):
+            self.client.get(url, {'phone': '11988887777'})
+            self.client.get(url, {'phone': '(11) 98888-7777'})
+            # Mesmo telefone em outro formato e de outro IP
+            response = self.client.get(url, {'phone': '5511988887777'}, REMOTE_ADDR='10.0.0.2')
+            self.assertEqual(response.status_code, 429)
+            self.assertTrue(int(response['Retry-After']) >= 1)
+
+            self.assertEqual(self.client.get(url, {'phone': '11977776666'}).status_code, 200)
+            self.assertEqual(self.client.get(url, {'phone': '11966665555'}).status_code, 429)
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.3').status_code, 200)
+
+    def test_memory_backend_splits_capacity_between_workers(self):
+        from bookings.ratelimit import CacheBackend, LocalMemoryBackend
+
+        backend = LocalMemoryBackend(workers=3)
+        self.assertEqual([backend.consume('ip', 10, 60)[0] for _ in range(5)], [True] * 4 + [False])
+
+        # Cache próprio do limitador, separado do 'shared'
+        self.assertEqual(CacheBackend().alias, 'ratelimit')
+
+    def test_forwarded_ip_is_taken_from_the_trusted_proxy(self):
+        from django.test import RequestFactory
+        from bookings.ratelimit import client_ip
+
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='1.1.1.1, 203.0.113.9', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(client_ip(request), '10.0.0.1')
+        with self.settings(RATE_LIMIT_TRUSTED_PROXIES=1):
+            self.assertEqual(client_ip(request), '203.0.113.9')
+
+    def test_pending_bookings_per_phone_are_capped(self):
+        form = {'service_id': self.service.pk, 'date': '2030-01-07', 'name': 'Bia', 'phone': '11988887777'}
+        with self.settings(MAX_PENDING_BOOKINGS_PER_PHONE=2):
+            for hour in ['09:00', '10:00', '11:00']:
+                self.client.post(reverse('bookings:reservar'), dict(form, time=hour))
+            self.assertEqual(Booking.objects.count(), 2)
+
+            Booking.objects.filter(start_time=time(9, 0)).update(status='CONFIRMED')
+            self.client.post(reverse('bookings:reservar'), dict(form, time='11:00'))
+            self.assertEqual(Booking.objects.filter(status='PENDING').count(), 2)
+            self.assertEqual(Booking.objects.count(), 3)
+
+
+class PendingExpiryTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+        self.day = date(2030, 1, 7)
+        self.stale = Booking.objects.create(service=self.service, customer_name='Ana', customer_phone='11988887777',
+                                            date=self.day, start_time=time(9, 0))
+        Booking.objects.filter(pk=self.stale.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        self.fresh = Booking.objects.create(service=self.service, customer_name='Bia', customer_phone='11977776666',
+                                            date=self.day, start_time=time(10, 0))
+
+    def test_stale_pending_is_free_at_read_time(self):
+        from bookings.services import find_next_available, is_time_available, list_free_times
+
+        free = list_free_times(self.service, self.day)
+        self.assertIn(time(9, 0), free)
+        self.assertNotIn(time(10, 0), free)
+        self.assertTrue(is_time_available(self.service, self.day, time(9, 0)))
+        self.assertEqual(find_next_available(self.service, self.day, 1), [(self.day, time(9, 0))])
+
+        with self.settings(PENDING_BOOKING_TTL_MINUTES=0):
+            self.assertNotIn(time(9, 0), list_free_times(self.service, self.day))
+
+    def test_booking_a_stale_slot_cancels_the_old_pending(self):
+        response = self.client.post(reverse('bookings:reservar'), {
+            'service_id': self.service.pk, 'date': '2030-01-07', 'time': '09:00',
+            'name': 'Caio', 'phone': '11966665555',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.stale.refresh_from_db()
+        self.assertEqual(self.stale.status, 'CANCELLED')
+        self.assertEqual(Booking.objects.get(start_time=time(9, 0), status='PENDING').customer_name, 'Caio')
+
+    def test_sweep_cancels_only_stale_pending_in_batches(self):
+        from bookings.expiry import expire_stale_pending
+
+        older = Booking.objects.create(service=self.service, customer_name='Dani', customer_phone='11955554444',
+                                       date=self.day, start_time=time(11, 0))
+        Booking.objects.filter(pk=older.pk).update(updated_at=timezone.now() - timedelta(days=3))
+
+        self.assertEqual(expire_stale_pending(batch_size=1), 2)
+        statuses = dict(Booking.objects.values_list('customer_name', 'status'))
+        self.assertEqual(statuses, {'Ana': 'CANCELLED', 'Bia': 'PENDING', 'Dani': 'CANCELLED'})
+        self.assertEqual(expire_stale_pending(), 0)
+
+    def test_ttl_counts_from_when_the_booking_became_pending(self):
+        from bookings.expiry import stale_pending
+
+        confirmed = Booking.objects.create(service=self.service, customer_name='Caio', customer_phone='11966665555',
+                                           date=self.day, start_time=time(11, 0), status='CONFIRMED')
+        Booking.objects.filter(pk=confirmed.pk).update(created_at=timezone.now() - timedelta(days=5))
+        confirmed.refresh_from_db()
+        confirmed.status = 'PENDING'
+        confirmed.save(update_fields=['status'])
+        self.assertEqual(list(stale_pending()), [self.stale])
+
+    def test_sweep_rechecks_status_under_lock(self):
+        from bookings.expiry import cancel_stale
+
+        # Confirmado depois da leitura dos IDs e antes do UPDATE
+        ids = [self.stale.pk]
+        Booking.objects.filter(pk=self.stale.pk).update(status='CONFIRMED')
+        self.assertEqual(cancel_stale(ids), 0)
+        self.stale.refresh_from_db()
+        self.assertEqual(self.stale.status, 'CONFIRMED')
+
+    def test_sweep_leaves_past_pending_alone(self):
+        from bookings.expiry import expire_stale_pending
+        from bookings.models import Notification
+
+        past = Booking.objects.create(service=self.service, customer_name='Eva', customer_phone='11944443333',
+                                      date=timezone.localdate() - timedelta(days=1), start_time=time(9, 0))
+        Booking.objects.filter(pk=past.pk).update(updated_at=timezone.now() - timedelta(days=3))
+        notifications = Notification.objects.filter(booking=past).count()
+
+        self.assertEqual(expire_stale_pending(), 1)
+        past.refresh_from_db()
+        self.assertEqual(past.status, 'PENDING')
+        self.assertEqual(Notification.objects.filter(booking=past).count(), notifications)
+
+    def test_sweep_keeps_calendar_feed_coherent(self):
+        from bookings.calendar_feed import feed_etag
+        from bookings.expiry import expire_stale_pending
+
+        with self.settings(CALENDAR_FEED_DAYS=5):
+            days = [self.day]
+            before = feed_etag(days=days)
+            expire_stale_pending()
+            self.assertNotEqual(feed_etag(days=days), before)
+
+
+class TracingTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+        self.url = reverse('bookings:agenda')
+        self.params = {'service': self.service.pk, 'date': '2030-01-07'}
+
+    def traced_spans(self, **headers):
+        with self.assertLogs('bookings.traces', 'INFO') as logs:
+            self.client.get(self.url, self.params, **headers)
+        self.assertEqual(len(logs.records), 1)
+        payload = json.loads(logs.records[0].getMessage())
+        return payload['resourceSpans'][0]['scopeSpans'][0]['spans']
+
+    def test_sampled_request_exports_otlp_spans(self):
+        with self.settings(TRACE_SAMPLE_RATE=1.0):
+            spans = self.traced_spans()
+
+        root = next(s for s in spans if 'parentSpanId' not in s)
+        self.assertEqual(root['name'], 'GET /agenda/')
+        self.assertEqual(root['kind'], 2)
+        attributes = {a['key']: a['value'] for a in root['attributes']}
+        self.assertEqual(attributes['http.response.status_code'], {'intValue': '200'})
+
+        names = {s['name'] for s in spans}
+        self.assertIn('db.query', names)
+        self.assertIn('template.render', names)
+        self.assertIn('bookings.services.list_free_times', names)
+        self.assertEqual({s['traceId'] for s in spans}, {root['traceId']})
+        span_ids = {s['spanId'] for s in spans}
+        self.assertTrue(all(s.get('parentSpanId', root['spanId']) in span_ids for s in spans))
+
+    def test_traceparent_header_continues_the_callers_trace(self):
+        trace_id, parent_id = '4bf92f3577b34da6a3ce929d0e0e4736', '00f067aa0ba902b7'
+        with self.settings(TRACE_TRUST_PARENT=True):
+            spans = self.traced_spans(HTTP_TRACEPARENT=f'00-{trace_id}-{parent_id}-01')
+        root = next(s for s in spans if s['kind'] == 2)
+        self.assertEqual(root['traceId'], trace_id)
+        self.assertEqual(root['parentSpanId'], parent_id)
+
+        trusted = self.settings(TRACE_SAMPLE_RATE=1.0, TRACE_TRUST_PARENT=True)
+        with trusted, self.assertNoLogs('bookings.traces', 'INFO'):
+            self.client.get(self.url, self.params, HTTP_TRACEPARENT=f'00-{trace_id}-{parent_id}-00')
+
+    def test_untrusted_traceparent_does_not_force_sampling(self):
+        trace_id, parent_id = '4bf92f3577b34da6a3ce929d0e0e4736', '00f067aa0ba902b7'
+        header = f'00-{trace_id}-{parent_id}-01'
+        # Amostragem desligada: o flag do cliente não liga o rastreamento
+        with self.assertNoLogs('bookings.traces', 'INFO'):
+            self.client.get(self.url, self.params, HTTP_TRACEPARENT=header)
+
+        # Amostrada aqui, a requisição continua o trace de quem chamou
+        with self.settings(TRACE_SAMPLE_RATE=1.0):
+            spans = self.traced_spans(HTTP_TRACEPARENT=f'00-{trace_id}-{parent_id}-00')
+        root = next(s for s in spans if s['kind'] == 2)
+        self.assertEqual((root['traceId'], root['parentSpanId']), (trace_id, parent_id))
+
+    def test_unsampled_requests_export_nothing(self):
+        with self.assertNoLogs('bookings.traces', 'INFO'):
+            self.client.get(self.url, self.params)
+
+
+class MetricsTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        from bookings.metrics import registry
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        settings_override = self.settings(METRICS_DIR=self.tmp.name, METRICS_TOKEN='segredo')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        registry.reset()
+        self.service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+
+    def scrape(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_endpoint_requires_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer errado').status_code, 401)
+
+    def test_bookings_latency_and_queries_are_exposed(self):
+        form = {'service_id': self.service.pk, 'date': '2030-01-07', 'time': '09:00', 'phone': '11988887777'}
+        self.client.post(reverse('bookings:reservar'), dict(form, name='Bia'))
+        self.client.post(reverse('bookings:reservar'), dict(form, name='Caio', phone='11977776666'))
+        Booking.objects.update(status='CANCELLED')
+        booking = Booking.objects.get()
+        booking.status = 'PENDING'
+        booking.save()
+        booking.status = 'CANCELLED'
+        booking.save()
+
+        text = self.scrape()
+        self.assertIn('bookings_created_total 1\n', text)
+        self.assertIn('bookings_conflicted_total 1\n', text)
+        self.assertIn('bookings_cancelled_total 1\n', text)
+        self.assertIn('http_request_duration_seconds_count{route="bookings:reservar"} 2\n', text)
+        self.assertIn('http_request_duration_seconds_bucket{route="bookings:reservar",le="+Inf"} 2\n', text)
+        self.assertRegex(text, r'db_queries_total\{route="bookings:reservar"\} \d+')
+        self.assertRegex(text, r'cache_requests_total\{cache="service_catalog",result="hit"\} \d+')
+
+    def test_snapshots_of_other_workers_are_summed(self):
+        from bookings.metrics import inc
+
+        inc('bookings_created_total', 2)
+        other_worker = {'counters': [['bookings_created_total', [], 5]], 'histograms': []}
+        with open(os.path.join(self.tmp.name, 'outro-worker.json'), 'w') as f:
+            json.dump(other_worker, f)
+
+        self.assertIn('bookings_created_total 7\n', self.scrape())
+
+    def test_finished_processes_are_folded_into_the_total(self):
+        import subprocess
+        import sys
+        from bookings.metrics import MetricsRegistry, TOTAL_FILE, inc, registry
+
+        inc('bookings_created_total', 2)
+        # Worker encerrado normalmente (atexit) e outro morto sem atexit
+        finished = MetricsRegistry()
+        finished.inc('bookings_created_total', 3)
+        finished.close()
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        killed = {'counters': [['bookings_created_total', [], 5]], 'histograms': []}
+        with open(os.path.join(self.tmp.name, f'{dead.pid}-deadbeef.json'), 'w') as f:
+            json.dump(killed, f)
+
+        self.assertIn('bookings_created_total 10\n', self.scrape())
+        files = sorted(name for name in os.listdir(self.tmp.name) if name.endswith('.json'))
+        self.assertEqual(files, sorted([TOTAL_FILE, f'{registry.process_id}.json']))
+        self.assertIn('bookings_created_total 10\n', self.scrape())
+
+
+class PriceSnapshotTests(BookingsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+        self.other = Service.objects.create(name='Barba', price_cents=3000, duration_minutes=30)
+        self.user = User.objects.create_user('pro', password='x', is_staff=True)
+
+    def make_booking(self, service=None, **kwargs):
+        data = {
+            'service': service or self.service, 'customer_name': 'Ana', 'customer_phone': '11999998888',
+            'date': date(2030, 1, 7), 'start_time': time(9, 0), 'status': 'CONFIRMED',
+        }
+        data.update(kwargs)
+        return Booking.objects.create(**data)
+
+    def test_price_change_does_not_rewrite_history(self):
+        booking = self.make_booking()
+        self.assertEqual((booking.price_cents, booking.duration_minutes), (5000, 60))
+
+        Service.objects.filter(pk=self.service.pk).update(price_cents=9000, duration_minutes=90)
+        service_catalog.invalidate()
+        booking.refresh_from_db()
+        booking.status = 'CANCELLED'
+        booking.save()
+        booking.refresh_from_db()
+        self.assertEqual((booking.price_cents, booking.end_time), (5000, time(10, 0)))
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('profissional:agenda_data', args=['2030-01-07']))
+        self.assertNotContains(response, 'R$ 90.00')
+
+    def test_changing_the_service_takes_a_new_snapshot(self):
+        booking = self.make_booking()
+        booking.service = self.other
+        booking.save(update_fields=['service'])
+        booking.refresh_from_db()
+        self.assertEqual((booking.price_cents, booking.duration_minutes), (3000, 30))
+        self.assertEqual(booking.end_time, time(9, 30))
+
+    def test_bulk_create_snapshots_from_the_catalog(self):
+        bookings = [
+            Booking(service=self.service, customer_name='Ana', customer_phone='11999998888',
+                    date=date(2030, 1, 7), start_time=time(9 + i, 0))
+            for i in range(3)
+        ]
+        service_catalog.all()
+        with self.assertNumQueries(2):
+            Booking.objects.bulk_create(bookings)
+        self.assertEqual({b.price_cents for b in bookings}, {5000})
+
+    def test_reports_aggregate_snapshots_without_joining_service(self):
+        from bookings.reports import period_report
+
+        self.make_booking()
+        self.make_booking(start_time=time(10, 0))
+        self.make_booking(service=self.other, status='PENDING')
+        Service.objects.filter(pk=self.service.pk).update(price_cents=9000)
+        service_catalog.all()
+
+        for vectorized in (False, True):
+            with CaptureQueriesContext(connection) as ctx:
+                report = period_report(Booking.objects.all(), date(2030, 1, 7), date(2030, 1, 7), vectorized)
+            self.assertFalse([q['sql'] for q in ctx.captured_queries if 'bookings_service' in q['sql']])
+            self.assertEqual(
+                [(row['name'], row['agendamentos_count'], row['faturamento_total'], row['percentage'])
+                 for row in report['servicos_populares']],
+                [('Corte', 2, 100.0, 100.0), ('Barba', 1, 0.0, 50.0)],
+            )
+        self.assertEqual(Booking.objects.aggregate(total=Sum('price_cents'))['total'], 13000)
+
+    def test_backfill_copies_current_service_values(self):
+        from bookings.migrations import __name__ as package
+        migration = import_module(f'{package}.0014_booking_price_snapshot')
+
+        booking = self.make_booking()
+        Booking.objects.filter(pk=booking.pk).update(price_cents=None, duration_minutes=None)
+        migration.backfill_price_snapshot(apps, None)
+        booking.refresh_from_db()
+        self.assertEqual((booking.price_cents, booking.duration_minutes), (5000, 60))
+
+
+class ColumnarExportTests(BookingsTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        self.service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+        self.other = Service.objects.create(name='Barba', price_cents=3000, duration_minutes=30)
+        for day, service, status in [(7, self.service, 'CONFIRMED'), (8, self.other, 'PENDING'), (9, self.service, 'CANCELLED')]:
+            Booking.objects.create(service=service, customer_name='Ana', customer_phone='11999998888',
+                                   date=date(2030, 1, day), start_time=time(9, 0), status=status)
+        self.user = User.objects.create_user('pro', password='x', is_staff=True)
+        self.url = reverse('profissional:exportar_dados')
+
+    def download(self, **params):
+        from bookings.routers import PRIMARY_COOKIE_NAME
+
+        self.client.force_login(self.user)
+        # Réplica vazia nos testes: ler do primário
+        self.client.cookies[PRIMARY_COOKIE_NAME] = '1'
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_parquet_has_typed_columns(self):
+        import io
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(io.BytesIO(self.download()))
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.schema.field('date').type, pa.date32())
+        self.assertEqual(table.schema.field('price_cents').type, pa.int32())
+        self.assertTrue(pa.types.is_dictionary(table.schema.field('status').type))
+        self.assertEqual(table.column('date').to_pylist(), [date(2030, 1, 7), date(2030, 1, 8), date(2030, 1, 9)])
+        self.assertEqual(table.column('service').to_pylist(), ['Corte', 'Barba', 'Corte'])
+        self.assertEqual(table.column('status').to_pylist(), ['CONFIRMED', 'PENDING', 'CANCELLED'])
+        self.assertEqual(table.column('price_cents').to_pylist(), [5000, 3000, 5000])
+
+    def test_arrow_ipc_is_streamed_in_batches_and_filtered_by_period(self):
+        import io
+        import pyarrow as pa
+        from bookings.analytics_export import iter_export
+
+        reader = pa.ipc.open_file(io.BytesIO(self.download(formato='arrow', start_date='2030-01-08')))
+        self.assertEqual(reader.read_all().column('end_time').to_pylist(), [time(9, 30), time(10, 0)])
+
+        chunks = list(iter_export(Booking.objects.order_by('date'), 'arrow', chunk_size=1))
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual(pa.ipc.open_file(io.BytesIO(b''.join(chunks))).num_record_batches, 3)
+
+    def test_invalid_format_and_login_required(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url, {'formato': 'xlsx'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'start_date': 'ontem'}).status_code, 400)
+
+    def test_rows_are_read_from_the_replica_chosen_by_the_view(self):
+        import io
+        import pyarrow.parquet as pq
+
+        self.client.force_login(self.user)
+        content = b''.join(self.client.get(self.url).streaming_content)
+        self.assertEqual(pq.read_table(io.BytesIO(content)).num_rows, 0)
+
+    def test_command_writes_file(self):
+        import pyarrow.parquet as pq
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'agendamentos.parquet')
+            call_command('export_bookings', path, '--end-date', '2030-01-08', stdout=open(os.devnull, 'w'))
+            self.assertEqual(pq.read_table(path).column('id').to_pylist(),
+                             list(Booking.objects.filter(date__lte=date(2030, 1, 8)).order_by('date').values_list('id', flat=True)))
+
+
+class ReportTests(BookingsTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        from bookings.benchmarks import seed_bookings, seed_services
+
+        seed_bookings(2000, seed_services(), start=date(2030, 1, 1), slot_minutes=30)
+        self.start, self.end = date(2030, 1, 3), date(2030, 1, 12)
+
+    def test_vectorized_numbers_match_the_orm(self):
+        from bookings.reports import load_columns, orm_aggregates, vectorized_aggregates
+
+        bookings = Booking.objects.filter(date__range=[self.start, self.end])
+        expected = orm_aggregates(bookings, self.start, self.end)
+        self.assertEqual(vectorized_aggregates(load_columns(bookings, chunk_size=333), self.start, self.end), expected)
+        self.assertEqual(len(expected['daily_cents']), 10)
+        self.assertEqual(len(expected['customers']), 5)
+        self.assertEqual(sum(expected['status_counts'].values()), bookings.count())
+
+    def test_loyal_customers_are_grouped_by_phone(self):
+        from bookings.reports import period_report
+
+        service = Service.objects.first()
+        for day, name, phone in [(20, 'Ana', '11 99999-0000'), (21, 'Ana Souza', '5511999990000')]:
+            Booking.objects.create(service=service, customer_name=name, customer_phone=phone,
+                                   date=date(2030, 2, day), start_time=time(8, 0), status='CONFIRMED')
+        report = period_report(Booking.objects.all(), date(2030, 2, 20), date(2030, 2, 21))
+        self.assertEqual(report['clientes_fieis'][0]['name'], 'Ana Souza')
+        self.assertEqual(report['clientes_fieis'][0]['agendamentos_count'], 2)
+        self.assertEqual(report['clientes_fieis'][0]['ultimo_agendamento'], date(2030, 2, 21))
+        self.assertEqual(report['horarios_pico'], [{'hora': 8, 'agendamentos': 2, 'percentage': 100.0}])
+
+    def test_report_page_and_empty_period(self):
+        from bookings.reports import period_report
+        from bookings.routers import PRIMARY_COOKIE_NAME
+
+        empty = period_report(Booking.objects.all(), date(2031, 1, 1), date(2031, 1, 2))
+        self.assertEqual((empty['total_agendamentos'], empty['ticket_medio'], empty['clientes_fieis']), (0, 0, []))
+
+        self.client.force_login(User.objects.create_user('pro', password='x', is_staff=True))
+        self.client.cookies[PRIMARY_COOKIE_NAME] = '1'
+        response = self.client.get(reverse('profissional:relatorios'), {'start_date': '2030-01-03', 'end_date': '2030-01-12'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_agendamentos'], Booking.objects.filter(date__range=[self.start, self.end]).count())
+        self.assertEqual(len(response.context['chart_days']), 10)
+
+
+class PeriodComparisonTests(BookingsTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import caches
+
+        caches['chunks'].clear()  # resumos de dias de testes anteriores (banco desfeito)
+        self.service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+        self.today = date(2030, 3, 1)
+
+    def book(self, day, hour=9, status='CONFIRMED'):
+        return Booking.objects.create(service=self.service, customer_name='Ana', customer_phone='11999998888',
+                                      date=day, start_time=time(hour, 0), status=status)
+
+    def test_deltas_against_the_previous_window(self):
+        from bookings.reports import period_comparison, period_report
+
+        # Anterior (10 a 19/02): 2 confirmados; atual (20/02 a 01/03): 3 confirmados + 1 cancelado
+        self.book(date(2030, 2, 10))
+        self.book(date(2030, 2, 19))
+        for day in (20, 21, 22):
+            self.book(date(2030, 2, day))
+        self.book(date(2030, 2, 23), status='CANCELLED')
+
+        start, end = date(2030, 2, 20), self.today
+        report = period_report(Booking.objects.all(), start, end)
+        self.assertEqual(
+            period_comparison(report, None, start, end, today=self.today),
+            {'variacao_faturamento': 50, 'variacao_agendamentos': 100, 'variacao_ticket': 0},
+        )
+        self.assertEqual(
+            period_comparison(report, None, date(2031, 1, 1), date(2031, 1, 2), today=self.today),
+            {'variacao_faturamento': None, 'variacao_agendamentos': None, 'variacao_ticket': None},
+        )
+
+    def test_closed_days_come_from_the_cache(self):
+        from bookings.reports import window_totals
+
+        self.book(date(2030, 2, 10))
+        window = (date(2030, 2, 1), date(2030, 2, 28))
+        self.assertEqual(window_totals(None, *window, today=self.today)['total_agendamentos'], 1)
+        with self.assertNumQueries(0):
+            window_totals(None, *window, today=self.today)
+        # Dias a partir de hoje nunca ficam em cache
+        with self.assertNumQueries(1):
+            window_totals(None, date(2030, 2, 27), date(2030, 3, 2), today=self.today)
+
+    def test_windows_longer_than_a_year_stay_cached(self):
+        from bookings.reports import window_totals
+
+        # 420 dias encerrados: mais chaves que as 300 do cache 'default'
+        self.book(date(2029, 1, 10))
+        window = (date(2029, 1, 7), date(2030, 2, 28))
+        self.assertEqual(window_totals(None, *window, today=self.today)['total_agendamentos'], 1)
+        with self.assertNumQueries(0):
+            window_totals(None, *window, today=self.today)
+
+    def test_late_changes_invalidate_only_their_days(self):
+        from bookings.reports import day_summaries, window_totals
+        from bookings.services import bulk_update_status
+
+        late = self.book(date(2030, 2, 10))
+        moved = self.book(date(2030, 2, 11))
+        window = (date(2030, 2, 1), date(2030, 2, 28))
+        window_totals(None, *window, today=self.today)
+
+        bulk_update_status([late.pk], 'CANCELLED')
+        moved.date = date(2030, 2, 12)
+        moved.save()
+        with CaptureQueriesContext(connection) as ctx:
+            summaries = day_summaries(None, [window[0] + timedelta(days=i) for i in range(28)], today=self.today)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn("BETWEEN '2030-02-10' AND '2030-02-12'", ctx.captured_queries[0]['sql'])
+        self.assertEqual(summaries[date(2030, 2, 10)], (1, 0, 0))
+        self.assertEqual(summaries[date(2030, 2, 12)], (1, 1, 5000))
+
+        # Status pelo painel (sem a data): dias resolvidos após o commit
+        self.client.force_login(User.objects.create_user('pro', password='x', is_staff=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('profissional:update_status', args=[late.pk]),
+                             json.dumps({'status': 'CONFIRMED'}), content_type='application/json')
+        self.assertEqual(window_totals(None, *window, today=self.today)['faturamento_total'], 100.0)
+
+    def test_report_page_shows_real_variation(self):
+        from bookings.routers import PRIMARY_COOKIE_NAME
+
+        self.book(date(2030, 2, 10))
+        self.book(date(2030, 2, 20))
+        self.book(date(2030, 2, 21))
+        self.client.force_login(User.objects.create_user('pro', password='x', is_staff=True))
+        self.client.cookies[PRIMARY_COOKIE_NAME] = '1'
+        response = self.client.get(reverse('profissional:relatorios'), {'start_date': '2030-02-20', 'end_date': '2030-03-01'})
+        self.assertEqual(response.context['variacao_agendamentos'], 100)
+        self.assertContains(response, '+100%')
+
+
+class UtilizationTests(BookingsTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import caches
+
+        caches['chunks'].clear()  # semanas em cache de testes anteriores (banco desfeito)
+        self.service = Service.objects.create(name='Corte', price_cents=5000, duration_minutes=60)
+        self.today = date(2030, 3, 20)
+
+    def book(self, day, hour, status='CONFIRMED'):
+        return Booking.objects.create(service=self.service, customer_name='Ana', customer_phone='11999998888',
+                                      date=day, start_time=time(hour, 0), status=status)
+
+    def cell(self, heatmap, weekday, hour):
+        return heatmap['rows'][weekday]['cells'][heatmap['hours'].index(hour)]
+
+    def test_heatmap_relates_bookings_to_the_slot_grid(self):
+        from bookings.utilization import utilization_heatmap
+
+        # 04 e 11/03/2030 são segundas-feiras
+        self.book(date(2030, 3, 4), 9)
+        self.book(date(2030, 3, 11), 9, status='PENDING')
+        self.book(date(2030, 3, 11), 10, status='CANCELLED')
+        self.book(date(2030, 3, 12), 20)  # fora da grade
+
+        with override_settings(DEFAULT_DAILY_TIMES=['09:00', '10:00']):
+            heatmap = utilization_heatmap(None, date(2030, 3, 4), date(2030, 3, 17), today=self.today)
+        self.assertEqual(heatmap['hours'], [9, 10, 20])
+        self.assertEqual(self.cell(heatmap, 0, 9)['capacity'], 2)
+        self.assertEqual(self.cell(heatmap, 0, 9)['utilization'], 100.0)
+        self.assertEqual(self.cell(heatmap, 0, 10)['cancel_rate'], 100.0)
+        self.assertEqual(self.cell(heatmap, 0, 10)['utilization'], 0.0)
+        self.assertIsNone(self.cell(heatmap, 1, 20)['utilization'])
+        self.assertEqual(self.cell(heatmap, 1, 20)['booked'], 1)
+        self.assertEqual((heatmap['booked'], heatmap['capacity']), (3, 28))
+        self.assertEqual(heatmap['cancel_rate'], 25.0)
+
+    def test_closed_weeks_are_cached_and_invalidated_by_late_changes(self):
+        from bookings.utilization import cell_counts
+
+        late = self.book(date(2030, 3, 5), 9)
+        self.book(date(2030, 3, 18), 9)
+        period = (date(2030, 3, 4), date(2030, 3, 19))
+        self.assertEqual(cell_counts(None, *period, today=self.today)[(1, 9)], [1, 0, 1])
+
+        # Semanas de 04 e 11/03 em cache; só 18 e 19/03 (semana aberta) consultam
+        with CaptureQueriesContext(connection) as ctx:
+            cell_counts(None, *period, today=self.today)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn("BETWEEN '2030-03-18' AND '2030-03-19'", ctx.captured_queries[0]['sql'])
+
+        late.status = 'CANCELLED'
+        late.save()
+        # A semana de 11/03 continua em cache e fica fora da consulta
+        with CaptureQueriesContext(connection) as ctx:
+            cells = cell_counts(None, *period, today=self.today)
+        sql = ctx.captured_queries[0]['sql']
+        self.assertIn("BETWEEN '2030-03-04' AND '2030-03-10'", sql)
+        self.assertIn("BETWEEN '2030-03-18' AND '2030-03-19'", sql)
+        self.assertNotIn("'2030-03-11'", sql)
+        self.assertEqual(cells[(1, 9)], [0, 1, 1])
+
+    def test_capacity_counts_every_service_of_the_business(self):
+        from bookings.utilization import utilization_heatmap
+
+        # Mesmo horário, serviços diferentes: os dois cabem na grade
+        barba = Service.objects.create(name='Barba', price_cents=3000, duration_minutes=30)
+        self.book(date(2030, 3, 4), 9)
+        Booking.objects.create(service=barba, customer_name='Bia', customer_phone='11988887777',
+                               date=date(2030, 3, 4), start_time=time(9, 0), status='CONFIRMED')
+
+        with override_settings(DEFAULT_DAILY_TIMES=['09:00', '10:00']):
+            heatmap = utilization_heatmap(None, date(2030, 3, 4), date(2030, 3, 10), today=self.today)
+        self.assertEqual(self.cell(heatmap, 0, 9)['capacity'], 2)
+        self.assertEqual(self.cell(heatmap, 0, 9)['utilization'], 100.0)
+        self.assertEqual((heatmap['booked'], heatmap['capacity']), (2, 28))
+
+    def test_report_page_renders_heatmap(self):
+        from bookings.routers import PRIMARY_COOKIE_NAME
+
+        self.book(date(2030, 3, 4), 9)
+        self.client.force_login(User.objects.create_user('pro', password='x', is_staff=True))
+        self.client.cookies[PRIMARY_COOKIE_NAME] = '1'
+        response = self.client.get(reverse('profissional:relatorios'), {'start_date': '2030-03-04', 'end_date': '2030-03-10'})
+        self.assertContains(response, 'Ocupação da Agenda')
+        self.assertContains(response, 'rgba(25, 135, 84, 1.00)')
@@ -0,0 +1,267 @@
+"""
+Rastreamento de requisições (spans compatíveis com OpenTelemetry).
+
+A TracingMiddleware abre um span por requisição, com a fração
+TRACE_SAMPLE_RATE das requisições amostradas (0 = desligado). Um trace
+recebido no cabeçalho W3C `traceparent` é continuado (mesmo trace_id)
+quando a requisição é amostrada aqui; a decisão de amostragem de quem
+chamou só vale com TRACE_TRUST_PARENT, já que qualquer cliente pode
+mandar o cabeçalho com o flag ligado. Dentro do span,
+spans filhos cobrem cada query (connection.execute_wrapper), a
+renderização de templates (backend TracedDjangoTemplates) e as funções
+marcadas com @traced (disponibilidade em services.py).
+
+Ao fim da requisição o trace é gravado como uma linha OTLP-JSON
+(ExportTraceServiceRequest) no logger 'bookings.traces'. O LOGGING manda
+essa linha para um arquivo rotativo ou para o stdout (TRACE_EXPORT), no
+mesmo formato lido pelo filelog/otlpjsonfile do OpenTelemetry Collector.
+"""
+import json
+import logging
+import random
+import re
+import secrets
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger('bookings.traces')
+
+# SpanKind e StatusCode do OTLP
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+STATUS_ERROR = 2
+
+# Limite do texto da query gravado no span
+MAX_STATEMENT_LENGTH = 2000
+
+_TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_current_span = ContextVar('current_span', default=None)
+
+
+def otlp_value(value):
+    """Valor de atributo no formato AnyValue do OTLP-JSON"""
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class Span:
+    """Um span do trace; filhos são registrados no mesmo `trace`"""
+
+    def __init__(self, trace, name, parent_id=None, kind=KIND_INTERNAL, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        trace.spans.append(self)
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_error(self, message):
+        self.error = message
+
+    def end(self):
+        self.end_ns = time.time_ns()
+
+    def to_otlp(self):
+        data = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or time.time_ns()),
+            'attributes': [
+                {'key': key, 'value': otlp_value(value)}
+                for key, value in self.attributes.items() if value is not None
+            ],
+        }
+        if self.parent_id:
+            data['parentSpanId'] = self.parent_id
+        if self.error is not None:
+            data['status'] = {'code': STATUS_ERROR, 'message': self.error}
+        return data
+
+
+class Trace:
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.spans = []
+
+    def to_otlp(self):
+        """ExportTraceServiceRequest com todos os spans do trace"""
+        return {'resourceSpans': [{
+            'resource': {'attributes': [
+                {'key': 'service.name', 'value': otlp_value(getattr(settings, 'TRACE_SERVICE_NAME', 'agendamento'))},
+            ]},
+            'scopeSpans': [{
+                'scope': {'name': 'bookings.tracing'},
+                'spans': [span.to_otlp() for span in self.spans],
+            }],
+        }]}
+
+
+def export(trace):
+    logger.info(json.dumps(trace.to_otlp(), separators=(',', ':'), ensure_ascii=False))
+
+
+def current_span():
+    return _current_span.get()
+
+
+@contextmanager
+def span(name, kind=KIND_INTERNAL, **attributes):
+    """
+    Span filho do span atual. Fora de um trace amostrado não faz nada
+    (o custo é ler uma ContextVar).
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, kind, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except Exception as exc:
+        child.record_error(f'{type(exc).__name__}: {exc}')
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+
+def traced(name=None):
+    """Decorador: executa a função dentro de um span"""
+    def decorator(func):
+        span_name = name or f'{func.__module__}.{func.__qualname__}'
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def sample_rate():
+    return getattr(settings, 'TRACE_SAMPLE_RATE', 0.0)
+
+
+def trust_parent():
+    return getattr(settings, 'TRACE_TRUST_PARENT', False)
+
+
+def parse_traceparent(header):
+    """(trace_id, parent_span_id, amostrado) do cabeçalho W3C, ou None"""
+    match = _TRACEPARENT_RE.match(header.strip().lower()) if header else None
+    if not match or match.group(1) == '0' * 32:
+        return None
+    trace_id, parent_id, flags = match.groups()
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def query_span(execute, sql, params, many, context):
+    """execute_wrapper: um span CLIENT por query"""
+    connection = context['connection']
+    with span('db.query', KIND_CLIENT, **{
+        'db.system': connection.vendor,
+        'db.name': connection.alias,
+        'db.statement': sql[:MAX_STATEMENT_LENGTH],
+        'db.executemany': many,
+    }):
+        return execute(sql, params, many, context)
+
+
+class TracingMiddleware:
+    """Span SERVER por requisição amostrada (ver o docstring do módulo)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        parent = parse_traceparent(request.META.get('HTTP_TRACEPARENT'))
+        trace_id, parent_id, parent_sampled = parent or (None, None, False)
+        if parent is not None and trust_parent():
+            sampled = parent_sampled
+        else:
+            rate = sample_rate()
+            sampled = rate > 0 and random.random() < rate
+        if not sampled:
+            return self.get_response(request)
+
+        trace = Trace(trace_id)
+        root = Span(trace, f'{request.method} {request.path}', parent_id, KIND_SERVER, {
+            'http.request.method': request.method,
+            'url.path': request.path,
+        })
+        token = _current_span.set(root)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(query_span))
+                response = self.get_response(request)
+            root.set_attribute('http.response.status_code', response.status_code)
+            if response.status_code >= 500:
+                root.record_error(f'HTTP {response.status_code}')
+            return response
+        except Exception as exc:
+            root.record_error(f'{type(exc).__name__}: {exc}')
+            raise
+        finally:
+            _current_span.reset(token)
+            match = getattr(request, 'resolver_match', None)
+            if match is not None:
+                # Nome pela rota (baixa cardinalidade), como no OpenTelemetry
+                root.name = f'{request.method} /{match.route}'
+                root.set_attribute('http.route', f'/{match.route}')
+                root.set_attribute('code.function', match.view_name)
+            root.end()
+            export(trace)
+
+
+class TracedTemplate:
+    """Template do backend do Django com span na renderização"""
+
+    def __init__(self, template):
+        self.template = template
+
+    @property
+    def origin(self):
+        return self.template.origin
+
+    def render(self, context=None, request=None):
+        if _current_span.get() is None:
+            return self.template.render(context, request)
+        with span('template.render', **{'template.name': self.origin.template_name or '<string>'}):
+            return self.template.render(context, request)
+
+
+class TracedDjangoTemplates(DjangoTemplates):
+    """Backend DjangoTemplates com spans de renderização"""
+
+    def from_string(self, template_code):
+        return TracedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TracedTemplate(super().get_template(template_name))
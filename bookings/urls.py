@@ -14,6 +14,9 @@ urlpatterns = [
     path('agenda/', views.agenda_view, name='agenda'),
     path('agendar/', views.agenda_view, name='agendar'),  # Compatibilidade
     path('reservar/', views.reservar_view, name='reservar'),
+    path('reservar/segurar/', views.segurar_horario, name='segurar_horario'),
+    path('proximos-horarios/', views.proximos_horarios, name='proximos_horarios'),
+    path('lista-espera/', views.lista_espera_view, name='lista_espera'),
     path('meus-agendamentos/', views.meus_agendamentos, name='meus_agendamentos'),
     path('whatsapp/<int:booking_id>/', views.whatsapp_redirect, name='whatsapp_redirect'),
 ]
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""
+Ocupação da agenda por dia da semana × hora (mapa de calor dos relatórios).
+
+A capacidade de cada célula vem da grade de horários de list_day_times
+vezes os serviços do negócio: a unicidade de agendamento ativo é por
+(serviço, data, horário), então cada serviço oferece a grade inteira.
+Os agendamentos são contados numa única consulta agrupada por
+(data, hora), restrita aos dias que não vieram do cache; semanas
+(segunda a domingo) inteiramente dentro do período e já encerradas ficam
+em cache sob as versões dos seus dias, as mesmas do feed .ics, então uma
+alteração tardia só recalcula a semana afetada.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.db.models import Count, Q
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+
+from . import metrics
+from .calendar_feed import chunk_cache, day_versions
+from .catalog import service_catalog
+from .models import Booking
+from .services import list_day_times
+
+WEEKDAYS = ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom']
+
+WEEK_COUNTS_KEY = 'bookings:reports:week:{}:{}:{}'
+WEEK_COUNTS_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def slot_capacity(business, days):
+    """
+    {(dia da semana, hora): horários oferecidos} somados nos dias, um por
+    serviço do negócio em cada horário da grade
+    """
+    services = len(service_catalog.all(business))
+    capacity = {}
+    for day in days:
+        for slot in list_day_times(day):
+            key = (day.weekday(), slot.hour)
+            capacity[key] = capacity.get(key, 0) + services
+    return {key: slots for key, slots in capacity.items() if slots}
+
+
+def day_ranges(days):
+    """Agrupa os dias em intervalos [início, fim] de datas consecutivas."""
+    ranges = []
+    for day in sorted(days):
+        if ranges and day - ranges[-1][1] == timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return ranges
+
+
+def count_days(business, days):
+    """
+    {data: {hora: (ocupados, cancelados, total)}} dos dias pedidos, numa
+    única consulta agrupada que só lê os intervalos de dias pedidos (as
+    semanas vindas do cache ficam de fora).
+    """
+    counts = {day: {} for day in days}
+    if not days:
+        return counts
+    condition = Q()
+    for first, last in day_ranges(days):
+        condition |= Q(date__range=[first, last])
+    rows = (
+        Booking.objects.for_business(business)
+        .filter(condition)
+        .order_by()
+        .values('date', hour=ExtractHour('start_time'))
+        .annotate(
+            booked=Count('id', filter=Q(status__in=Booking.ACTIVE_STATUSES)),
+            cancelled=Count('id', filter=Q(status='CANCELLED')),
+            total=Count('id'),
+        )
+        .values_list('date', 'hour', 'booked', 'cancelled', 'total')
+    )
+    for day, hour, booked, cancelled, total in rows:
+        if day in counts:
+            counts[day][hour] = (booked, cancelled, total)
+    return counts
+
+
+def add_counts(cells, day, hours):
+    for hour, values in hours.items():
+        cell = cells.setdefault((day.weekday(), hour), [0, 0, 0])
+        for index, value in enumerate(values):
+            cell[index] += value
+
+
+def week_key(business, monday, versions):
+    digest = hashlib.md5(''.join(versions[monday + timedelta(days=offset)] for offset in range(7)).encode())
+    return WEEK_COUNTS_KEY.format(business.pk if business else '-', monday.isoformat(), digest.hexdigest())
+
+
+def cell_counts(business, start_date, end_date, today=None):
+    """
+    {(dia da semana, hora): [ocupados, cancelados, total]} do período.
+    Semanas encerradas vêm do cache; o resto sai de uma única consulta.
+    """
+    today = today or timezone.localdate()
+    days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+    closed_weeks = [
+        day for day in days
+        if day.weekday() == 0 and day + timedelta(days=6) <= end_date and day + timedelta(days=6) < today
+    ]
+    versions = day_versions([monday + timedelta(days=offset) for monday in closed_weeks for offset in range(7)])
+    keys = {monday: week_key(business, monday, versions) for monday in closed_weeks}
+    cache = chunk_cache()
+    cached = cache.get_many(list(keys.values()))
+    hits = [monday for monday in closed_weeks if keys[monday] in cached]
+    metrics.inc('cache_requests_total', len(hits), cache='report_weeks', result='hit')
+    metrics.inc('cache_requests_total', len(closed_weeks) - len(hits), cache='report_weeks', result='miss')
+
+    cached_days = {monday + timedelta(days=offset) for monday in hits for offset in range(7)}
+    counts = count_days(business, [day for day in days if day not in cached_days])
+
+    cells = {}
+    for monday in hits:
+        for (weekday, hour), values in cached[keys[monday]].items():
+            add_counts(cells, monday + timedelta(days=weekday), {hour: values})
+    to_cache = {}
+    for monday in closed_weeks:
+        if monday in hits:
+            continue
+        week = {}
+        for offset in range(7):
+            add_counts(week, monday + timedelta(days=offset), counts[monday + timedelta(days=offset)])
+        to_cache[keys[monday]] = {key: tuple(values) for key, values in week.items()}
+    if to_cache:
+        cache.set_many(to_cache, timeout=WEEK_COUNTS_TIMEOUT)
+    for day, hours in counts.items():
+        add_counts(cells, day, hours)
+    return cells
+
+
+def utilization_heatmap(business, start_date, end_date, today=None):
+    """
+    Mapa de calor do período: uma linha por dia da semana e uma coluna
+    por hora, com ocupação (ocupados / horários oferecidos) e taxa de
+    cancelamento de cada célula, além dos totais.
+    """
+    days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+    capacity = slot_capacity(business, days)
+    cells = cell_counts(business, start_date, end_date, today)
+    hours = sorted({hour for _, hour in capacity} | {hour for _, hour in cells})
+
+    rows = []
+    for weekday, label in enumerate(WEEKDAYS):
+        row = []
+        for hour in hours:
+            booked, cancelled, total = cells.get((weekday, hour), (0, 0, 0))
+            slots = capacity.get((weekday, hour), 0)
+            utilization = min(booked / slots, 1) * 100 if slots else None
+            row.append({
+                'hour': hour,
+                'booked': booked,
+                'capacity': slots,
+                'utilization': utilization,
+                # Opacidade da cor da célula (0 a 1)
+                'intensity': utilization / 100 if slots else 0,
+                'cancelled': cancelled,
+                'cancel_rate': cancelled / total * 100 if total else None,
+            })
+        rows.append({'weekday': label, 'cells': row})
+
+    booked = sum(values[0] for values in cells.values())
+    total_capacity = sum(capacity.values())
+    cancelled = sum(values[1] for values in cells.values())
+    total = sum(values[2] for values in cells.values())
+    return {
+        'hours': hours,
+        'rows': rows,
+        'booked': booked,
+        'capacity': total_capacity,
+        'utilization': min(booked / total_capacity, 1) * 100 if total_capacity else None,
+        'cancel_rate': cancelled / total * 100 if total else None,
+    }
@@ -12,12 +12,17 @@ def build_whatsapp_url(booking_or_message, phone_number=None):
     Args:
         booking_or_message: Instância do model Booking ou string com mensagem
         phone_number: Número do WhatsApp do profissional (com código do país)
-                     Se None, usa settings.WHATSAPP_BUSINESS_NUMBER
+                     Se None, usa o WhatsApp do negócio do agendamento ou
+                     settings.WHATSAPP_BUSINESS_NUMBER
     
     Returns:
         str: URL completa para redirecionamento ao WhatsApp
     """
-    if phone_number is None:
+    if phone_number is None and not isinstance(booking_or_message, str):
+        from .tenants import tenant_directory
+        business = tenant_directory.get(booking_or_message.business_id)
+        phone_number = business.whatsapp_number if business else None
+    if not phone_number:
         phone_number = getattr(settings, 'WHATSAPP_BUSINESS_NUMBER', '5524998190280')
     
     if isinstance(booking_or_message, str):
@@ -42,6 +47,38 @@ def normalize_phone(phone_str):
     return ''.join(filter(str.isdigit, phone_str))
 
 
+def canonical_phone(phone_str):
+    """
+    Gera a chave canônica de um telefone brasileiro para buscas.
+    
+    Remove código do país (55), prefixo de operadora/tronco (0) e o nono
+    dígito de celulares, de modo que todas as variações do mesmo número
+    resultem na mesma chave: DDD + 8 dígitos.
+    
+    Args:
+        phone_str: String com telefone em qualquer formato
+    
+    Returns:
+        str: Chave com 10 dígitos (ex: "1199999999"), ou apenas os dígitos
+             se o número não tiver formato brasileiro reconhecível
+    """
+    digits = normalize_phone(phone_str or '')
+    
+    # Código do país: 55 + DDD + número (12 ou 13 dígitos)
+    if len(digits) in (12, 13) and digits.startswith('55'):
+        digits = digits[2:]
+    
+    # Prefixo de tronco/operadora: 0 + DDD + número
+    if len(digits) in (11, 12) and digits.startswith('0'):
+        digits = digits[1:]
+    
+    # Nono dígito de celular: DDD + 9 + 8 dígitos
+    if len(digits) == 11 and digits[2] == '9':
+        digits = digits[:2] + digits[3:]
+    
+    return digits
+
+
 def format_phone_display(phone_digits):
     """
     Formata telefone para exibição amigável.
@@ -4,15 +4,23 @@ from django.contrib import messages
 from django.http import HttpResponse, JsonResponse
 from django.urls import reverse
 from django.utils import timezone
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.conf import settings
 import traceback
 import sys
 import os
 from datetime import date as date_cls, datetime
-from .models import Service, Schedule, Booking
-from .services import list_free_times, list_day_times, is_time_available, string_to_time
-from .utils import build_whatsapp_url, normalize_phone
+from .models import Service, Booking
+from .catalog import service_catalog
+from .services import (
+    list_free_times, list_day_times, is_time_available, string_to_time, find_next_available,
+    pending_limit_reached,
+)
+from .waitlist import join_waitlist
+from .expiry import release_stale_slots
+from .holds import acquire_hold, get_hold_owner, hold_ttl, release_holds
+from . import idempotency, metrics
+from .utils import build_whatsapp_url, normalize_phone, canonical_phone
 
 
 def health_check(request):
@@ -55,7 +63,7 @@ def health_check(request):
 def home(request):
     """Página inicial com lista de serviços"""
     try:
-        services = Service.objects.all()
+        services = service_catalog.all(request.business)
         return render(request, 'bookings/home.html', {'services': services})
     except Exception as e:
         # Se der erro, retorna uma resposta simples para debug
@@ -81,11 +89,11 @@ def agenda_view(request):
     # Obter serviço (primeiro se não especificado)
     if service_id:
         try:
-            service = Service.objects.get(pk=service_id)
+            service = service_catalog.get(service_id, request.business)
         except Service.DoesNotExist:
-            service = Service.objects.first()
+            service = service_catalog.first(request.business)
     else:
-        service = Service.objects.first()
+        service = service_catalog.first(request.business)
     
     # Obter data (hoje se não especificada)
     if date_str:
@@ -97,13 +105,14 @@ def agenda_view(request):
         selected_date = date_cls.today()
     
     # Obter horários livres para este serviço e data
+    # (holds do próprio cliente continuam aparecendo para ele)
     if service:
-        free_times = list_free_times(service, selected_date)
+        free_times = list_free_times(service, selected_date, get_hold_owner(request))
     else:
         free_times = []
     
     # Obter todos os serviços para o formulário
-    services = Service.objects.all()
+    services = service_catalog.all(request.business)
     
     context = {
         'service': service,
@@ -111,20 +120,55 @@ def agenda_view(request):
         'date': selected_date,
         'free_times': free_times,
         'selected_service_id': service.id if service else None,
+        'reservation_key': idempotency.new_reservation_key(),
     }
     
     return render(request, 'bookings/agenda.html', context)
 
 
 @transaction.atomic
+def create_pending_booking(service, name, phone, booking_date, booking_time):
+    """
+    Cria o agendamento PENDENTE, ou None se o horário foi ocupado.
+    Um PENDENTE vencido ainda não cancelado (livre na leitura) é cancelado
+    e a inserção repetida uma vez.
+    """
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                return Booking.objects.create(
+                    service=service,
+                    customer_name=name,
+                    customer_phone=phone,
+                    date=booking_date,
+                    start_time=booking_time,
+                    status='PENDING'  # Inicia como pendente, confirma no WhatsApp
+                )
+        except IntegrityError:
+            if attempt or not release_stale_slots(service, booking_time, [booking_date]):
+                return None
+
+
 def reservar_view(request):
     """
     Processa criação de novo agendamento com validação atômica.
     Evita conflitos de horário com transaction.atomic().
+    Reenvios do mesmo formulário (mesma reservation_key) voltam ao
+    agendamento já criado, sem validar nem inserir de novo.
     """
     if request.method != 'POST':
         return redirect('bookings:agenda')
     
+    key = idempotency.reservation_key(request)
+    if key:
+        previous = idempotency.claim(key)
+        if previous == idempotency.IN_FLIGHT:
+            messages.info(request, 'Seu agendamento já está sendo processado.')
+            return redirect('bookings:agenda')
+        if previous is not None:
+            return redirect('bookings:whatsapp_redirect', booking_id=previous)
+    
+    booking = None
     try:
         # Extrair dados do formulário
         service_id = request.POST.get('service_id')
@@ -145,26 +189,31 @@ def reservar_view(request):
             return redirect('bookings:agenda')
         
         # Converter dados
-        service = Service.objects.get(pk=service_id)
+        service = service_catalog.get(service_id, request.business)
         booking_date = date_cls.fromisoformat(date_str)
         booking_time = string_to_time(time_str)
         
+        if pending_limit_reached(phone, request.business):
+            messages.error(request, 'Você já tem agendamentos aguardando confirmação. '
+                                    'Confirme-os pelo WhatsApp antes de fazer outro.')
+            return redirect('bookings:agenda')
+        
         # Validação atômica: verificar se horário ainda está disponível
-        if not is_time_available(service, booking_date, booking_time):
-            messages.error(request, 
-                         'Ops! Alguém acabou de reservar esse horário. '
-                         'Por favor, escolha outro horário disponível.')
-            return redirect(f'bookings:agenda?service={service_id}&date={date_str}')
+        hold_owner = get_hold_owner(request)
+        if is_time_available(service, booking_date, booking_time, hold_owner):
+            booking = create_pending_booking(service, name, phone, booking_date, booking_time)
+        if booking is None:
+            metrics.inc('bookings_conflicted_total')
+            # Oferecer a lista de espera do horário
+            return render(request, 'bookings/lista_espera.html', {
+                'service': service,
+                'date': booking_date,
+                'time': booking_time,
+                'name': name,
+                'phone': phone,
+            }, status=409)
         
-        # Criar o agendamento
-        booking = Booking.objects.create(
-            service=service,
-            customer_name=name,
-            customer_phone=phone,
-            date=booking_date,
-            start_time=booking_time,
-            status='PENDING'  # Inicia como pendente, confirma no WhatsApp
-        )
+        release_holds(hold_owner, converted=True)
         
         messages.success(request, 
                         f'Agendamento realizado! Você será direcionado ao WhatsApp '
@@ -179,6 +228,105 @@ def reservar_view(request):
         messages.error(request, 'Data ou horário inválido.')
     except Exception as e:
         messages.error(request, 'Erro inesperado. Tente novamente.')
+    finally:
+        if key:
+            if booking is not None:
+                idempotency.remember(key, booking.id)
+            else:
+                idempotency.release(key)
+    
+    return redirect('bookings:agenda')
+
+
+def segurar_horario(request):
+    """
+    Segura o horário escolhido na agenda por alguns minutos (AJAX).
+    Responde 409 se o horário já foi agendado ou está segurado por outro cliente.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método não permitido'}, status=405)
+    
+    try:
+        service = service_catalog.get(request.POST.get('service_id'), request.business)
+        hold_date = date_cls.fromisoformat(request.POST.get('date', ''))
+        hold_time = string_to_time(request.POST.get('time', ''))
+    except (Service.DoesNotExist, ValueError):
+        return JsonResponse({'error': 'Dados inválidos'}, status=400)
+    
+    hold = acquire_hold(service, hold_date, hold_time, get_hold_owner(request, create=True))
+    if hold is None:
+        return JsonResponse({
+            'held': False,
+            'error': 'Esse horário acabou de ser escolhido por outra pessoa.',
+        }, status=409)
+    
+    return JsonResponse({
+        'held': True,
+        'expires_at': hold.expires_at.isoformat(),
+        'ttl_seconds': int(hold_ttl().total_seconds()),
+    })
+
+
+NEXT_AVAILABLE_MAX_LIMIT = 20
+
+
+def proximos_horarios(request):
+    """
+    Próximos horários livres de um serviço a partir de agora (AJAX).
+    Parâmetros: service_id e limit (padrão 5, máximo 20).
+    """
+    try:
+        service = service_catalog.get(request.GET.get('service_id'), request.business)
+        limit = int(request.GET.get('limit', 5))
+    except (Service.DoesNotExist, ValueError):
+        return JsonResponse({'error': 'Dados inválidos'}, status=400)
+    limit = max(1, min(limit, NEXT_AVAILABLE_MAX_LIMIT))
+    
+    now = timezone.localtime().replace(tzinfo=None)
+    slots = find_next_available(service, now, limit, hold_owner=get_hold_owner(request))
+    
+    return JsonResponse({
+        'service_id': service.pk,
+        'slots': [
+            {
+                'date': slot_date.isoformat(),
+                'time': slot_time.strftime('%H:%M'),
+                'display': f"{slot_date.strftime('%d/%m/%Y')} às {slot_time.strftime('%H:%M')}",
+            }
+            for slot_date, slot_time in slots
+        ],
+    })
+
+
+def lista_espera_view(request):
+    """Coloca o cliente na lista de espera de um horário ocupado"""
+    if request.method != 'POST':
+        return redirect('bookings:agenda')
+    
+    try:
+        service = service_catalog.get(request.POST.get('service_id'), request.business)
+        waitlist_date = date_cls.fromisoformat(request.POST.get('date', ''))
+        waitlist_time = string_to_time(request.POST.get('time', ''))
+        name = request.POST.get('name', '').strip()
+        phone = normalize_phone(request.POST.get('phone', ''))
+        
+        if not name or len(phone) < 10:
+            messages.error(request, 'Nome e telefone são obrigatórios.')
+            return redirect('bookings:agenda')
+        
+        entry, created = join_waitlist(service, waitlist_date, waitlist_time, name, phone)
+        if created:
+            messages.success(request, 
+                            'Você entrou na lista de espera! Se o horário for liberado, '
+                            'ele será reservado automaticamente para você.')
+        else:
+            messages.info(request, 'Você já está na lista de espera deste horário.')
+        return redirect(f"{reverse('bookings:meus_agendamentos')}?phone={phone}")
+    
+    except Service.DoesNotExist:
+        messages.error(request, 'Serviço inválido.')
+    except ValueError:
+        messages.error(request, 'Data ou horário inválido.')
     
     return redirect('bookings:agenda')
 
@@ -189,11 +337,12 @@ def meus_agendamentos(request):
     bookings = []
     
     if phone_raw:
-        phone = normalize_phone(phone_raw)
-        bookings = Booking.objects.filter(
-            customer_phone=phone, 
+        # Chave canônica: aceita com/sem 55, com/sem o nono dígito
+        phone_key = canonical_phone(phone_raw)
+        bookings = Booking.objects.for_business(request.business).filter(
+            customer_phone_key=phone_key, 
             status__in=['PENDING', 'CONFIRMED']
-        ).order_by('date', 'start_time')
+        ).select_related('service').order_by('date', 'start_time')
     
     return render(request, 'bookings/meus_agendamentos.html', {
         'bookings': bookings,
@@ -203,7 +352,7 @@ def meus_agendamentos(request):
 
 def whatsapp_redirect(request, booking_id):
     """Redirecionar para WhatsApp com mensagem formatada"""
-    booking = get_object_or_404(Booking, id=booking_id)
+    booking = get_object_or_404(Booking.objects.for_business(request.business), id=booking_id)
     whatsapp_url = build_whatsapp_url(booking)
     return redirect(whatsapp_url)
 
@@ -219,33 +368,33 @@ def admin_dashboard(request):
     end_of_week = start_of_week + timedelta(days=6)
     
     # Estatísticas básicas
-    agendamentos_hoje = Booking.objects.filter(
+    agendamentos_hoje = Booking.objects.for_business(request.business).filter(
         date=today, 
         status__in=['PENDING', 'CONFIRMED']
     ).count()
     
-    agendamentos_semana = Booking.objects.filter(
+    agendamentos_semana = Booking.objects.for_business(request.business).filter(
         date__range=[start_of_week, end_of_week], 
         status__in=['PENDING', 'CONFIRMED']
     ).count()
     
     # Faturamento semanal estimado
-    bookings_semana = Booking.objects.filter(
+    faturamento_semana = Booking.objects.for_business(request.business).filter(
         date__range=[start_of_week, end_of_week], 
         status__in=['PENDING', 'CONFIRMED']
-    ).select_related('service')
-    faturamento_semana = sum(booking.service.price_real for booking in bookings_semana)
+    ).aggregate(total=Sum('price_cents'))['total'] or 0
+    faturamento_semana = faturamento_semana / 100
     
     # Horários livres hoje (baseado em regra dinâmica)
     total_slots_hoje = len(list_day_times(today))
-    bookings_hoje = Booking.objects.filter(
+    bookings_hoje = Booking.objects.for_business(request.business).filter(
         date=today, 
         status__in=['PENDING', 'CONFIRMED']
     ).count()
     slots_livres_hoje = total_slots_hoje - bookings_hoje
     
     # Agendamentos recentes com WhatsApp URLs
-    agendamentos_recentes = Booking.objects.filter(
+    agendamentos_recentes = Booking.objects.for_business(request.business).filter(
         status__in=['PENDING', 'CONFIRMED']
     ).select_related('service').order_by('-created_at')[:5]
     
@@ -282,7 +431,7 @@ def admin_agenda(request):
         selected_date = timezone.now().date()
     
     # Buscar agendamentos do dia
-    bookings = Booking.objects.filter(
+    bookings = Booking.objects.for_business(request.business).filter(
         date=selected_date, 
         status__in=['PENDING', 'CONFIRMED']
     ).select_related('service').order_by('start_time')
@@ -292,7 +441,7 @@ def admin_agenda(request):
         booking.whatsapp_url = build_whatsapp_url(booking)
     
     # Calcular estatísticas do dia
-    total_faturamento = sum(booking.service.price_real for booking in bookings)
+    total_faturamento = sum(booking.price_real for booking in bookings)
     
     # Horários disponíveis (todos os horários menos os ocupados)
     all_times = set(list_day_times(selected_date))
@@ -316,7 +465,7 @@ def admin_editar_booking(request, booking_id):
     """Editar agendamento com validação de conflitos"""
     from datetime import datetime, timedelta
     
-    booking = get_object_or_404(Booking, id=booking_id)
+    booking = get_object_or_404(Booking.objects.for_business(request.business), id=booking_id)
     
     if request.method == 'POST':
         new_date_str = request.POST.get('new_date')
@@ -328,7 +477,7 @@ def admin_editar_booking(request, booking_id):
             new_time = string_to_time(new_time_str)
             
             # Se mudou data/horário, verificar conflito
-            if (new_date != booking.date or new_time != (booking.start_time or booking.time)):
+            if (new_date != booking.date or new_time != booking.start_time):
                 # Verificar disponibilidade do novo horário (excluindo este booking)
                 conflict_exists = Booking.objects.filter(
                     service=booking.service,
@@ -344,9 +493,8 @@ def admin_editar_booking(request, booking_id):
             # Atualizar booking
             booking.date = new_date
             booking.start_time = new_time
-            booking.time = new_time  # Compatibilidade
             booking.status = new_status
-            booking.save()
+            booking.save(update_fields=['date', 'start_time', 'status'])
             
             messages.success(request, 'Agendamento atualizado com sucesso!')
             return redirect('admin_panel:agenda')
@@ -387,6 +535,33 @@ def admin_editar_booking(request, booking_id):
     return render(request, 'bookings/admin/editar_booking.html', context)
 
 
+def metrics_view(request):
+    """
+    Métricas no formato do Prometheus. Protegido por METRICS_TOKEN
+    (Authorization: Bearer <token>) ou, sem token configurado, só staff.
+    """
+    import hmac
+    from .holds import METRIC_NAMES, METRICS_KEY_PREFIX
+    from django.core.cache import caches
+    
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        provided = request.META.get('HTTP_AUTHORIZATION', '').removeprefix('Bearer ')
+        allowed = hmac.compare_digest(provided.encode(), token.encode())
+    else:
+        allowed = request.user.is_authenticated and request.user.is_staff
+    if not allowed:
+        return HttpResponse('Não autorizado', status=401, content_type='text/plain; charset=utf-8')
+    
+    # Contadores de holds já somados entre workers no cache compartilhado
+    holds = caches['shared'].get_many([METRICS_KEY_PREFIX + name for name in METRIC_NAMES])
+    extra = {
+        f'slot_holds_{name}_total': (f'Reservas temporárias ({name})', holds.get(METRICS_KEY_PREFIX + name, 0))
+        for name in METRIC_NAMES
+    }
+    return HttpResponse(metrics.render_metrics(extra), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def favicon_view(request):
     """Serve um favicon simples para evitar erro 404/500"""
     # SVG simples de um calendário
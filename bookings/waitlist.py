@@ -0,0 +1,95 @@
+"""
+Lista de espera: quando um horário é liberado (cancelamento), o próximo
+da fila recebe o horário na mesma transação.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Booking, WaitlistEntry
+from .utils import normalize_phone
+
+
+def join_waitlist(service, date_obj, time_obj, name, phone):
+    """
+    Coloca o cliente na fila do horário.
+    Retorna (entry, created); o mesmo telefone não entra duas vezes.
+    """
+    phone = normalize_phone(phone)
+    try:
+        with transaction.atomic():
+            entry = WaitlistEntry.objects.create(
+                service=service, date=date_obj, start_time=time_obj,
+                customer_name=name, customer_phone=phone,
+            )
+        return entry, True
+    except IntegrityError:
+        entry = WaitlistEntry.objects.get(
+            service=service, date=date_obj, start_time=time_obj,
+            customer_phone=phone, status='WAITING',
+        )
+        return entry, False
+
+
+def promote_waitlist(slots):
+    """
+    Oferece cada horário liberado ao primeiro da fila.
+    
+    `slots` é um iterável de (service_id, date, start_time). Os candidatos
+    de todos os horários vêm de uma única consulta pelo índice da fila,
+    com SELECT ... FOR UPDATE SKIP LOCKED: filas já travadas por outra
+    transação são puladas em vez de esperar. Cada promoção cria um
+    agendamento PENDING num savepoint próprio; se o horário foi ocupado
+    nesse meio tempo, o cliente continua na fila.
+    
+    Returns:
+        list: Agendamentos criados
+    """
+    today = timezone.localdate()
+    slots = {slot for slot in slots if slot[1] >= today}
+    if not slots:
+        return []
+    
+    condition = Q()
+    for service_id, date_obj, start_time in slots:
+        condition |= Q(service_id=service_id, date=date_obj, start_time=start_time)
+    
+    promoted = []
+    with transaction.atomic():
+        waiting = (
+            WaitlistEntry.objects.select_for_update(skip_locked=True)
+            .filter(condition, status='WAITING')
+            .order_by('created_at', 'id')
+        )
+        
+        # Primeiro da fila de cada horário
+        next_in_line = {}
+        for entry in waiting:
+            next_in_line.setdefault((entry.service_id, entry.date, entry.start_time), entry)
+        
+        for entry in next_in_line.values():
+            try:
+                with transaction.atomic():
+                    booking = Booking.objects.create(
+                        service_id=entry.service_id,
+                        customer_name=entry.customer_name,
+                        customer_phone=entry.customer_phone,
+                        date=entry.date,
+                        start_time=entry.start_time,
+                        status='PENDING',
+                    )
+            except IntegrityError:
+                continue  # Horário já ocupado de novo
+            
+            entry.status = 'PROMOTED'
+            entry.booking = booking
+            entry.save(update_fields=['status', 'booking'])
+            promoted.append(booking)
+    
+    return promoted
+
+
+def promote_for_bookings(booking_ids):
+    """Promove a fila dos horários dos agendamentos informados"""
+    slots = Booking.objects.filter(id__in=booking_ids).values_list('service_id', 'date', 'start_time')
+    return promote_waitlist(slots)